@@ -18,11 +18,26 @@ from .models import (Capability,
                      JobPosition,
                      ChatMessage,
                      ChatMessageFile,
-                     UserTask)
+                     UserTask,
+                     prefetch_last_status)
 from django.contrib.auth.admin import UserAdmin
 from simple_history.admin import SimpleHistoryAdmin
 
 
+class LastStatusAdminMixin:
+    """Changelist pages resolve last_status for the whole page in one query."""
+
+    def get_changelist_instance(self, request):
+        changelist = super().get_changelist_instance(request)
+        prefetch_last_status(changelist.result_list)
+        return changelist
+
+    @admin.display(description='Last Action')
+    def last_status_display(self, obj):
+        status = obj.last_status_object
+        return status.latest_action if status else None
+
+
 @admin.register(Capability)
 class CapabilityAdmin(admin.ModelAdmin):
     list_display = ('capability_id', 'capability_name', 'description', 'create_time','update_time')
@@ -116,7 +131,7 @@ class CurrencyAdmin(admin.ModelAdmin):
 
 
 @admin.register(Project)
-class ProjectAdmin(SimpleHistoryAdmin):
+class ProjectAdmin(LastStatusAdminMixin, SimpleHistoryAdmin):
     list_display = (
         'project_code', 'project_name', 'total_price','currency','partner',
         'start_date', 'end_date',
@@ -132,18 +147,11 @@ class ProjectAdmin(SimpleHistoryAdmin):
     def get_full_id(self, obj):
         return obj.full_id or None
 
-    @admin.display(description='Last Action')
-    def last_status_display(self, obj):
-        try:
-            status = ObjectLastStatus.objects.get(full_id=obj.full_id)
-            return status.latest_action or None
-        except ObjectLastStatus.DoesNotExist:
-            return None
 
     
 
 @admin.register(ProjectFinancePart)
-class ProjectFinancePartAdmin(admin.ModelAdmin):
+class ProjectFinancePartAdmin(LastStatusAdminMixin, admin.ModelAdmin):
     list_display = (
         'fs_part_code', 'fs_part_no', 'fs_part_name', 'fs_part_price',
         'fs_start_date', 'fs_finish_date',
@@ -158,6 +166,7 @@ class ProjectFinancePartAdmin(admin.ModelAdmin):
         'fs_start_date', 'fs_finish_date',
         'project_code',
     )
+    list_select_related = ('project_code', 'create_user_id')
     search_fields = (
         'fs_part_code', 'fs_part_no', 'fs_part_name',
         'project_code__project_name', 'project_code__project_code',
@@ -174,13 +183,6 @@ class ProjectFinancePartAdmin(admin.ModelAdmin):
     def get_full_id(self, obj):
         return obj.full_id or None
 
-    @admin.display(description='Last Action')
-    def last_status_display(self, obj):
-        try:
-            status = ObjectLastStatus.objects.get(full_id=obj.full_id)
-            return status.latest_action or None
-        except ObjectLastStatus.DoesNotExist:
-            return None
 
     
     
@@ -246,7 +248,7 @@ class ProjectPhaseAdmin(admin.ModelAdmin):
 
 
 @admin.register(ProjectGipPart)
-class ProjectGipPartAdmin(admin.ModelAdmin):
+class ProjectGipPartAdmin(LastStatusAdminMixin, admin.ModelAdmin):
     list_display = (
         'tch_part_code',
         'fs_part_code',
@@ -262,6 +264,7 @@ class ProjectGipPartAdmin(admin.ModelAdmin):
         'path_type_display',
         'last_status_display'
     )
+    list_select_related = ('fs_part_code', 'tch_part_nach', 'create_user_id')
     search_fields = ('tch_part_no', 'tch_part_name')
     list_filter = ('nach_otd_confirm', 'tch_start_date', 'tch_finish_date')
     readonly_fields = ('create_date',)
@@ -275,20 +278,13 @@ class ProjectGipPartAdmin(admin.ModelAdmin):
     path_type_display.short_description = "Path Type"
     
     
-    @admin.display(description='Last Action')
-    def last_status_display(self, obj):
-        try:
-            status = ObjectLastStatus.objects.get(full_id=obj.full_id)
-            return status.latest_action or None
-        except ObjectLastStatus.DoesNotExist:
-            return None
 
 
 
 
 
 @admin.register(WorkOrder)
-class WorkOrderAdmin(admin.ModelAdmin):
+class WorkOrderAdmin(LastStatusAdminMixin, admin.ModelAdmin):
     list_display = (
         'wo_id',
         'wo_no',
@@ -304,6 +300,7 @@ class WorkOrderAdmin(admin.ModelAdmin):
         'path_type_display',
         'last_status_display',  # ✅ Qo‘shildi
     )
+    list_select_related = ('tch_part_code', 'wo_staff', 'create_user')
     search_fields = ('wo_name',)
     list_filter = ('staff_confirm', 'wo_start_date', 'wo_finish_date')
     readonly_fields = ('create_date',)
@@ -316,13 +313,6 @@ class WorkOrderAdmin(admin.ModelAdmin):
         return obj.path_type
     path_type_display.short_description = "Path Type"
 
-    @admin.display(description='Last Action')
-    def last_status_display(self, obj):
-        try:
-            status = ObjectLastStatus.objects.get(full_id=obj.full_id)
-            return status.latest_action or None
-        except ObjectLastStatus.DoesNotExist:
-            return None
 
 
 
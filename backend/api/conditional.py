@@ -0,0 +1,94 @@
+# conditional.py
+import hashlib
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from api.models import Message, ObjectLastStatus, Project, ProjectRollup
+
+
+class ConditionalGetMixin:
+    """
+    Conditional GET for read views: the view returns a cheap version token
+    (a few aggregates) from get_version() and the request is answered with
+    304 Not Modified before any serialization when the client's ETag /
+    Last-Modified still match.
+
+    Views must define get_version(request, *args, **kwargs) returning
+    (parts, last_modified): hashable version parts and the newest change time.
+
+    The ETag also covers the user (results are permission-scoped) and the full
+    path (filters and page).
+    """
+
+    def get(self, request, *args, **kwargs):
+        if not hasattr(self, 'get_version'):
+            raise ImproperlyConfigured(
+                f'{type(self).__name__} uses ConditionalGetMixin and must define get_version().'
+            )
+        parts, last_modified = self.get_version(request, *args, **kwargs)
+        user = request.user
+        token = repr((user.pk, user.update_time, request.get_full_path(), *parts))
+        etag = quote_etag(hashlib.md5(token.encode()).hexdigest())
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+
+        not_modified = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if not_modified is not None:
+            return not_modified
+
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == 200:
+            response['ETag'] = etag
+            if timestamp is not None:
+                response['Last-Modified'] = http_date(timestamp)
+        return response
+
+
+def newest(*values):
+    values = [value for value in values if value is not None]
+    return max(values) if values else None
+
+
+# Related rows ProjectSerializer renders (names, INN, fio and position): editing one moves the list
+PROJECT_LIST_RELATED_UPDATES = [
+    'partner__update_time', 'currency__update_time',
+    'create_user__update_time', 'create_user__position__update_time',
+    'financier__update_time', 'financier__position__update_time',
+]
+
+
+def project_list_version(queryset):
+    """Version of a filtered project list: rows, the related rows they render, their rollups and last statuses."""
+    project_codes = queryset.order_by().values('pk')  # drops the list annotations
+    stats = Project.objects.filter(pk__in=project_codes).aggregate(
+        count=Count('pk'),
+        updated=Max('update_date'),
+        rollup_updated=Max('rollup__update_time'),
+        **{field: Max(field) for field in PROJECT_LIST_RELATED_UPDATES},
+    )
+    status_updated = ObjectLastStatus.objects.filter(
+        path_type='PROJECT', project__in=project_codes
+    ).aggregate(updated=Max('last_updated'))['updated']
+
+    related = [stats[field] for field in PROJECT_LIST_RELATED_UPDATES]
+    parts = (stats['count'], stats['updated'], stats['rollup_updated'], status_updated, *related)
+    return parts, newest(stats['updated'], stats['rollup_updated'], status_updated, *related)
+
+
+def subtree_status_version(statuses):
+    """Version of a set of last statuses (a subtree): every new ActionLog on one of them moves it."""
+    stats = statuses.aggregate(count=Count('pk'), updated=Max('last_updated'))
+    return (stats['count'], stats['updated']), stats['updated']
+
+
+def project_tree_version(project):
+    """Version of one project's tree: the project, its rollup (touched by every child change),
+    the last statuses of all its levels and its messages."""
+    rollup_updated = ProjectRollup.objects.filter(project=project).values_list('update_time', flat=True).first()
+    status_updated = ObjectLastStatus.objects.filter(project=project).aggregate(updated=Max('last_updated'))['updated']
+    messages = Message.objects.filter(project=project).aggregate(count=Count('pk'), updated=Max('update_time'))
+
+    parts = (project.update_date, rollup_updated, status_updated, messages['count'], messages['updated'])
+    return parts, newest(project.update_date, rollup_updated, status_updated, messages['updated'])
@@ -0,0 +1,99 @@
+import asyncio
+import json
+import secrets
+import time
+
+from asgiref.sync import sync_to_async
+from django.core import signing
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from api.events import broker
+from api.models import ChatMessage, NotificationCounter, StaffUser
+
+HEARTBEAT_SECONDS = 15
+TICKET_SALT = 'api.events.stream-ticket'
+TICKET_MAX_AGE = 30
+
+
+class StreamTicketView(APIView):
+    """
+    POST: a signed ticket for one connection to the event stream. EventSource
+    cannot send headers, so the stream URL carries this short-lived, single-use
+    ticket instead of the access token (URLs end up in logs and history).
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        # the stream lasts as long as the access token the ticket was issued for
+        if request.auth is not None:
+            expires = request.auth['exp']
+        else:
+            expires = int(time.time() + jwt_settings.ACCESS_TOKEN_LIFETIME.total_seconds())
+        ticket = signing.dumps(
+            {'user': request.user.pk, 'exp': expires, 'nonce': secrets.token_urlsafe(8)}, salt=TICKET_SALT
+        )
+        return Response({'ticket': ticket, 'max_age': TICKET_MAX_AGE})
+
+
+def _redeem(ticket):
+    """(user, expires) for a valid ticket not used before, else (None, None)."""
+    try:
+        payload = signing.loads(ticket, salt=TICKET_SALT, max_age=TICKET_MAX_AGE)
+    except signing.BadSignature:
+        return None, None
+    if not cache.add(f"events:ticket:{payload['nonce']}", 1, TICKET_MAX_AGE):
+        return None, None  # already used
+    user = StaffUser.objects.filter(pk=payload['user'], is_active=True).first()
+    return (user, payload['exp']) if user else (None, None)
+
+
+def _counts(user):
+    return {
+        'notifications': NotificationCounter.objects.unread(user.pk),
+        'chat_messages': ChatMessage.objects.filter(receiver=user, is_read=False).count(),
+    }
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+
+async def event_stream(request):
+    """
+    Server-Sent Events for the current user (serve under ASGI):
+    "counts" once on connect, then "notification" / "chat_message" as rows are
+    created and "chat_read" when the user reads a task's chat. Authenticated by ?ticket= from StreamTicketView; the stream ends
+    when the access token the ticket was issued for expires, and the client
+    reconnects with a new ticket.
+    """
+    ticket = request.GET.get('ticket')
+    user, expires = await sync_to_async(_redeem)(ticket) if ticket else (None, None)
+    if user is None:
+        return JsonResponse({"detail": "Authentication credentials were not provided or are invalid."}, status=401)
+
+    async def stream():
+        # Subscribe before reading the counts so nothing committed in between is missed
+        queue = broker.subscribe(user.pk)
+        try:
+            yield _sse('counts', await sync_to_async(_counts)(user))
+            while (remaining := expires - time.time()) > 0:
+                try:
+                    message = await asyncio.wait_for(queue.get(), min(HEARTBEAT_SECONDS, remaining))
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                message.pop('user', None)
+                yield _sse(message.pop('event'), message)
+        finally:
+            broker.unsubscribe(user.pk, queue)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
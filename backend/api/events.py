@@ -0,0 +1,111 @@
+# events.py
+"""
+Per-user event fan-out for the notification stream (api.event_views).
+
+Writers call publish() inside their transaction: PostgreSQL delivers a NOTIFY
+only when the transaction commits, to every process LISTENing on CHANNEL. Each
+ASGI process keeps one LISTEN connection (EventBroker) that hands the events to
+the asyncio queues of its connected clients.
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, connections
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'promont_events'
+QUEUE_SIZE = 100
+
+
+def publish(user_id, event, **data):
+    """Queue an event for one user's open streams (sent on commit)."""
+    if not user_id:
+        return
+    payload = json.dumps({'user': user_id, 'event': event, **data}, cls=DjangoJSONEncoder)
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, payload])
+
+
+def publish_many(events):
+    """publish() for a list of (user_id, event, data) in one query."""
+    payloads = [
+        json.dumps({'user': user_id, 'event': event, **data}, cls=DjangoJSONEncoder)
+        for user_id, event, data in events
+        if user_id
+    ]
+    if payloads:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, payload) FROM unnest(%s::text[]) AS payload', [CHANNEL, payloads])
+
+
+class EventBroker:
+    """One LISTEN connection per process feeding the asyncio queues of connected clients."""
+
+    def __init__(self, channel=CHANNEL):
+        self.channel = channel
+        self._subscribers = {}  # user_id -> {queue: loop}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def subscribe(self, user_id):
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.setdefault(user_id, {})[queue] = asyncio.get_running_loop()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._listen, name='event-broker', daemon=True)
+                self._thread.start()
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        with self._lock:
+            queues = self._subscribers.get(user_id, {})
+            queues.pop(queue, None)
+            if not queues:
+                self._subscribers.pop(user_id, None)
+
+    def _dispatch(self, payload):
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            return
+        with self._lock:
+            targets = list(self._subscribers.get(message.get('user'), {}).items())
+        for queue, loop in targets:
+            loop.call_soon_threadsafe(self._offer, queue, message)
+
+    @staticmethod
+    def _offer(queue, message):
+        # A client that stopped reading loses events instead of growing the queue;
+        # its next "counts" event (on reconnect) brings it back in step.
+        if not queue.full():
+            queue.put_nowait(message)
+
+    def _listen(self):
+        while True:
+            conn = None
+            try:
+                db = connections['default']
+                conn = db.get_new_connection(db.get_connection_params())
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute(f'LISTEN {self.channel}')
+                while True:
+                    if select.select([conn], [], [], 5) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self._dispatch(conn.notifies.pop(0).payload)
+            except Exception:
+                logger.exception("Event broker lost its LISTEN connection, reconnecting")
+                if conn is not None:
+                    conn.close()
+                time.sleep(1)
+
+
+broker = EventBroker()
@@ -0,0 +1,57 @@
+# inbox.py
+"""
+Cached first page of each user's notification inbox (MyNotificationLogsView).
+
+Pages are stored under a per-user version that writers replace after commit
+(invalidate_inbox), so a page built from a snapshot taken before the commit is
+never served afterwards. Versions are random, not counters, so a version key lost
+to cache culling comes back as a new value instead of one an old page was stored
+under. Names inside object_data and performer fio can change without a new log;
+INBOX_TIMEOUT bounds how long those stay stale.
+"""
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+
+INBOX_TIMEOUT = 300
+
+
+def _version_key(user_id):
+    return f'inbox:{user_id}:version'
+
+
+def inbox_variant(request):
+    """Cache variant for a first-page request ('all' / 'true' / 'false' by ?identified=), else None."""
+    params = request.query_params
+    if any(name in params for name in ('cursor', 'page_size', 'with_total')) or params.get('page', '1') != '1':
+        return None
+    identified = params.get('identified', '').lower()
+    return identified if identified in ('true', 'false') else 'all'
+
+
+def cached_inbox_page(user_id, variant, build):
+    """The cached page data for (user, variant); build() produces it on a miss."""
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(_version_key(user_id), version, timeout=None):
+            version = cache.get(_version_key(user_id), version)  # another request set it first
+    key = f'inbox:{user_id}:{version}:{variant}'
+    data = cache.get(key)
+    if data is None:
+        data = build()
+        cache.set(key, data, INBOX_TIMEOUT)
+    return data
+
+
+def invalidate_inbox(user_ids):
+    """Drop the cached pages of these users once the current transaction commits."""
+    user_ids = {user_id for user_id in user_ids if user_id}
+    if not user_ids:
+        return
+
+    def bump():
+        cache.set_many({_version_key(user_id): uuid.uuid4().hex for user_id in user_ids}, timeout=None)
+
+    transaction.on_commit(bump)
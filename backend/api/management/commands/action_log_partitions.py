@@ -0,0 +1,76 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.models import notification_window_start
+from api.partitions import (
+    add_months,
+    archive_detached,
+    archive_partition,
+    ensure_partitions,
+    expire_notifications,
+    expiring_notifications,
+    list_detached,
+    list_partitions,
+    month_start,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the upcoming monthly action_logs partitions and archive the ones older than the "
+        "retention window (gzip JSONL, then drop; or just detach with --detach-only). Tables left detached "
+        "are archived on the next run without --detach-only. Unread notifications that left the window "
+        "are taken off the counters. Run daily from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=3, help="Months of partitions to create ahead")
+        parser.add_argument('--retention-months', type=int, default=settings.ACTION_LOG_RETENTION_MONTHS)
+        parser.add_argument('--archive-dir', default=settings.ACTION_LOG_ARCHIVE_DIR)
+        parser.add_argument('--detach-only', action='store_true', help="Detach old partitions without dumping/dropping them")
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        if not options['dry_run']:
+            for name in ensure_partitions(options['ahead']):
+                self.stdout.write(f"Created {name}")
+
+        cutoff = add_months(month_start(timezone.now()), -options['retention_months'])
+        # Unread logs about to be archived or already outside the notification window are
+        # recounted at the end, so the counters agree with the inbox (ActionLog.objects.recent())
+        expiring = [] if options['dry_run'] else expiring_notifications(max(cutoff, notification_window_start()))
+        old = [(month, name) for month, name in list_partitions() if month < cutoff]
+        detached = [] if options['detach_only'] else list_detached()
+        if old or detached:
+            self.archive(old, detached, options)
+        else:
+            self.stdout.write("No partitions older than the retention window")
+
+        if expiring:
+            fixed = expire_notifications(expiring)
+            self.stdout.write(self.style.SUCCESS(f"Recounted notifications of {len(expiring)} users ({fixed} changed)"))
+
+    def archive(self, old, detached, options):
+        if not options['detach_only']:
+            os.makedirs(options['archive_dir'], exist_ok=True)
+        for _, name in detached:
+            if options['dry_run']:
+                self.stdout.write(f"Would archive detached {name}")
+                continue
+            path = os.path.join(options['archive_dir'], f"{name}.jsonl.gz")
+            rows = archive_detached(name, path)
+            self.stdout.write(self.style.SUCCESS(f"Archived detached {name}: {rows} rows -> {path}"))
+
+        for month, name in old:
+            if options['dry_run']:
+                self.stdout.write(f"Would archive {name}")
+                continue
+            path = None if options['detach_only'] else os.path.join(options['archive_dir'], f"{name}.jsonl.gz")
+            rows = archive_partition(month, name, path)
+            if path:
+                self.stdout.write(self.style.SUCCESS(f"Archived {name}: {rows} rows -> {path}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"Detached {name}"))
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.models import ActionLog, Message, ObjectLastStatus
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete action logs, last statuses and messages whose project / part / work order no longer "
+        "exists, in short batches (each batch is its own transaction)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--pause', type=float, default=0.1, help="Seconds to sleep between batches")
+        parser.add_argument('--dry-run', action='store_true', help="Only count the orphans")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for model in (ActionLog, ObjectLastStatus, Message):
+            orphans = model.objects.orphaned().order_by('pk')
+            if options['dry_run']:
+                self.stdout.write(f"{model.__name__}: {orphans.count()} orphans")
+                continue
+
+            purged = 0
+            last_pk = None
+            while True:
+                batch = orphans if last_pk is None else orphans.filter(pk__gt=last_pk)
+                pks = list(batch.values_list('pk', flat=True)[:batch_size])
+                if not pks:
+                    break
+                purged += model.objects.filter(pk__in=pks).delete()[0]
+                last_pk = pks[-1]
+                time.sleep(options['pause'])
+            self.stdout.write(self.style.SUCCESS(f"{model.__name__}: purged {purged} orphans"))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from api.models import NotificationCounter
+
+
+class Command(BaseCommand):
+    help = "Recompute notification_counters from unread, live action_logs and fix drifted rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument('user_ids', nargs='*', type=int, help="Only these users (default: all)")
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        fixed = NotificationCounter.objects.rebuild(
+            options['user_ids'] or None,
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Fixed {fixed} notification counters"))
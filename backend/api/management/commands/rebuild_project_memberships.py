@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.models import ProjectMembership
+
+
+class Command(BaseCommand):
+    help = "Recreate project_memberships from projects, technical parts and work orders."
+
+    def add_arguments(self, parser):
+        parser.add_argument('project_codes', nargs='*', type=int, help="Only these projects (default: all)")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rebuilt = ProjectMembership.objects.rebuild(options['project_codes'] or None)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rebuilt} project memberships"))
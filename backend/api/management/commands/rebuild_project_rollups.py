@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from api.models import ProjectRollup
+
+
+class Command(BaseCommand):
+    help = "Recompute project_rollups from finance parts, technical parts and work orders."
+
+    def add_arguments(self, parser):
+        parser.add_argument('project_codes', nargs='*', type=int, help="Only these projects (default: all)")
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        rebuilt = ProjectRollup.objects.rebuild(
+            options['project_codes'] or None,
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rebuilt} project rollups"))
@@ -0,0 +1,74 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:00
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def backfill_rollups(apps, schema_editor):
+    Project = apps.get_model('api', 'Project')
+    ProjectFinancePart = apps.get_model('api', 'ProjectFinancePart')
+    ProjectGipPart = apps.get_model('api', 'ProjectGipPart')
+    WorkOrder = apps.get_model('api', 'WorkOrder')
+    ProjectRollup = apps.get_model('api', 'ProjectRollup')
+
+    rollups = {pk: ProjectRollup(project_id=pk) for pk in Project.objects.values_list('pk', flat=True)}
+
+    parts = ProjectFinancePart.objects.values('project_code').annotate(
+        n=Count('pk'),
+        sent=Count('pk', filter=Q(send_to_tech_dir=True)),
+        confirmed=Count('pk', filter=Q(tech_dir_confirm=True)),
+    )
+    for row in parts:
+        rollup = rollups[row['project_code']]
+        rollup.finance_parts_count = row['n']
+        rollup.parts_sent_count = row['sent']
+        rollup.parts_confirmed_count = row['confirmed']
+
+    tech_parts = ProjectGipPart.objects.values('fs_part_code__project_code').annotate(n=Count('pk'))
+    for row in tech_parts:
+        rollups[row['fs_part_code__project_code']].tech_parts_count = row['n']
+
+    work_orders = WorkOrder.objects.values('tch_part_code__fs_part_code__project_code').annotate(
+        n=Count('pk'),
+        finished=Count('pk', filter=Q(finished=True)),
+    )
+    for row in work_orders:
+        rollup = rollups[row['tch_part_code__fs_part_code__project_code']]
+        rollup.work_orders_count = row['n']
+        rollup.work_orders_finished_count = row['finished']
+
+    ProjectRollup.objects.bulk_create(rollups.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0064_department_is_for_all'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectRollup',
+            fields=[
+                ('project', models.OneToOneField(db_column='project_code', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rollup', serialize=False, to='api.project')),
+                ('finance_parts_count', models.IntegerField(default=0)),
+                ('parts_sent_count', models.IntegerField(default=0)),
+                ('parts_confirmed_count', models.IntegerField(default=0)),
+                ('tech_parts_count', models.IntegerField(default=0)),
+                ('work_orders_count', models.IntegerField(default=0)),
+                ('work_orders_finished_count', models.IntegerField(default=0)),
+                ('all_sent_to_tech_dir', models.GeneratedField(db_persist=True, expression=models.Q(('parts_sent_count', models.F('finance_parts_count'))), output_field=models.BooleanField())),
+                ('all_tech_dir_confirmed', models.GeneratedField(db_persist=True, expression=models.Q(('parts_confirmed_count', models.F('finance_parts_count'))), output_field=models.BooleanField())),
+                ('update_time', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Project Rollup',
+                'verbose_name_plural': 'Project Rollups',
+                'db_table': 'project_rollups',
+                'indexes': [models.Index(condition=models.Q(('parts_sent_count__gt', 0)), fields=['all_tech_dir_confirmed'], name='rollup_tech_dir_queue_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_memberships(apps, schema_editor):
+    ProjectMembership = apps.get_model('api', 'ProjectMembership')
+    sources = [
+        ('CREATOR', apps.get_model('api', 'Project'), 'pk', 'create_user'),
+        ('GIP', apps.get_model('api', 'Project'), 'pk', 'project_gip'),
+        ('FINANCIER', apps.get_model('api', 'Project'), 'pk', 'financier'),
+        ('TECH_PART_NACH', apps.get_model('api', 'ProjectGipPart'), 'fs_part_code__project_code', 'tch_part_nach'),
+        ('WORK_ORDER_STAFF', apps.get_model('api', 'WorkOrder'), 'tch_part_code__fs_part_code__project_code', 'wo_staff'),
+    ]
+    for relation, model, project_lookup, user_field in sources:
+        pairs = model.objects.filter(**{f'{user_field}__isnull': False}).values_list(user_field, project_lookup).distinct()
+        ProjectMembership.objects.bulk_create(
+            [ProjectMembership(user_id=user_id, project_id=project_code, relation=relation) for user_id, project_code in pairs],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0065_projectrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectMembership',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('relation', models.CharField(choices=[('CREATOR', 'Creator'), ('GIP', 'GIP'), ('FINANCIER', 'Financier'), ('TECH_PART_NACH', 'Technical part head'), ('WORK_ORDER_STAFF', 'Work order staff')], max_length=20)),
+                ('project', models.ForeignKey(db_column='project_code', on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='api.project')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='project_memberships', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Project Membership',
+                'verbose_name_plural': 'Project Memberships',
+                'db_table': 'project_memberships',
+                'constraints': [models.UniqueConstraint(fields=('user', 'relation', 'project'), name='project_membership_unique')],
+            },
+        ),
+        migrations.RunPython(backfill_memberships, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0067_project_partner_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='actionlog',
+            index=models.Index(fields=['notify_to', 'identified', '-performed_at'], name='actionlog_inbox_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='actionlog',
+            index=models.Index(fields=['full_id'], name='actionlog_full_id_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(condition=models.Q(('is_read', False)), fields=['receiver', '-send_time'], name='chat_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['-create_date', '-project_code'], name='project_create_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['financier', 'financier_confirm', '-create_date'], name='project_financier_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['project_gip', 'gip_confirm', '-create_date'], name='project_gip_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usertask',
+            index=models.Index(fields=['receiver', 'done', '-create_time'], name='task_receiver_done_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usertask',
+            index=models.Index(fields=['create_user', 'done', '-create_time'], name='task_creator_done_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='workorder',
+            index=models.Index(fields=['wo_staff', '-wo_start_date'], name='wo_staff_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='workorder',
+            index=models.Index(condition=models.Q(('answer_date__isnull', False), ('staff_confirm', True), ('wo_answer__isnull', False)), fields=['create_user', '-answer_date'], name='wo_answered_idx'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:11
+
+from django.db import migrations, models
+from django.db.models import CharField, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Concat
+
+
+def backfill_full_ids(apps, schema_editor):
+    ProjectFinancePart = apps.get_model('api', 'ProjectFinancePart')
+    ProjectGipPart = apps.get_model('api', 'ProjectGipPart')
+    WorkOrder = apps.get_model('api', 'WorkOrder')
+
+    def pk_path(*parts):
+        return Concat(*parts, Cast('pk', CharField()), Value('/'), output_field=CharField())
+
+    ProjectFinancePart.objects.update(
+        full_id=pk_path(Cast('project_code', CharField()), Value('/'))
+    )
+    ProjectGipPart.objects.update(
+        full_id=pk_path(Subquery(ProjectFinancePart.objects.filter(pk=OuterRef('fs_part_code')).values('full_id')[:1]))
+    )
+    WorkOrder.objects.update(
+        full_id=pk_path(Subquery(ProjectGipPart.objects.filter(pk=OuterRef('tch_part_code')).values('full_id')[:1]))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0068_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projectfinancepart',
+            name='full_id',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, help_text='Hierarchical full identifier, maintained on save', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='projectgippart',
+            name='full_id',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, help_text='Hierarchical full identifier, maintained on save', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='workorder',
+            name='full_id',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, help_text='Hierarchical full identifier, maintained on save', max_length=255),
+        ),
+        migrations.RunPython(backfill_full_ids, migrations.RunPython.noop),
+    ]
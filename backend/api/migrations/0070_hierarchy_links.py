@@ -0,0 +1,112 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BATCH_SIZE = 5000
+
+# typed FK -> (target model, position of its id inside "p/f/t/w/")
+LINKS = [
+    ('project', 'Project', 1),
+    ('finance_part', 'ProjectFinancePart', 2),
+    ('tech_part', 'ProjectGipPart', 3),
+    ('work_order', 'WorkOrder', 4),
+]
+
+
+def backfill_links(apps, schema_editor):
+    """Parse full_id into the typed FKs in pk batches, keeping only ids that still exist."""
+    qn = schema_editor.connection.ops.quote_name
+    for model_name in ('ActionLog', 'ObjectLastStatus', 'Message'):
+        model = apps.get_model('api', model_name)
+        table, pk = qn(model._meta.db_table), qn(model._meta.pk.column)
+        bounds = model.objects.aggregate(low=models.Min('pk'), high=models.Max('pk'))
+        if bounds['low'] is None:
+            continue
+
+        for field, target_name, position in LINKS:
+            target = apps.get_model('api', target_name)
+            column = qn(model._meta.get_field(field).column)
+            segment = f"split_part(t.full_id, '/', {position})"
+            sql = (
+                f"UPDATE {table} t SET {column} = x.{qn(target._meta.pk.column)} "
+                f"FROM {qn(target._meta.db_table)} x "
+                f"WHERE t.{pk} BETWEEN %s AND %s "
+                f"AND x.{qn(target._meta.pk.column)} = "
+                f"CASE WHEN {segment} ~ '^[0-9]{{1,9}}$' THEN {segment}::integer END"
+            )
+            with schema_editor.connection.cursor() as cursor:
+                for low in range(bounds['low'], bounds['high'] + 1, BATCH_SIZE):
+                    cursor.execute(sql, [low, low + BATCH_SIZE - 1])
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('api', '0069_stored_full_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='actionlog',
+            name='finance_part',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.projectfinancepart'),
+        ),
+        migrations.AddField(
+            model_name='actionlog',
+            name='project',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.project'),
+        ),
+        migrations.AddField(
+            model_name='actionlog',
+            name='tech_part',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.projectgippart'),
+        ),
+        migrations.AddField(
+            model_name='actionlog',
+            name='work_order',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.workorder'),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='finance_part',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.projectfinancepart'),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='project',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.project'),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='tech_part',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.projectgippart'),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='work_order',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.workorder'),
+        ),
+        migrations.AddField(
+            model_name='objectlaststatus',
+            name='finance_part',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.projectfinancepart'),
+        ),
+        migrations.AddField(
+            model_name='objectlaststatus',
+            name='project',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.project'),
+        ),
+        migrations.AddField(
+            model_name='objectlaststatus',
+            name='tech_part',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.projectgippart'),
+        ),
+        migrations.AddField(
+            model_name='objectlaststatus',
+            name='work_order',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.workorder'),
+        ),
+        migrations.RunPython(backfill_links, migrations.RunPython.noop, atomic=False),
+    ]
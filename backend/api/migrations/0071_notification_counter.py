@@ -0,0 +1,53 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:19
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def backfill_counters(apps, schema_editor):
+    ActionLog = apps.get_model('api', 'ActionLog')
+    NotificationCounter = apps.get_model('api', 'NotificationCounter')
+
+    live = (
+        Q(path_type='PROJECT', project__isnull=False)
+        | Q(path_type='FIN_PART', finance_part__isnull=False)
+        | Q(path_type='TECH_PART', tech_part__isnull=False)
+        | Q(path_type='WORK_ORDER', work_order__isnull=False)
+    )
+    unread = (
+        ActionLog.objects.filter(live, identified=False, notify_to__isnull=False)
+        .order_by()
+        .values('notify_to')
+        .annotate(n=Count('pk'))
+    )
+    NotificationCounter.objects.bulk_create(
+        [NotificationCounter(user_id=row['notify_to'], unread=row['n']) for row in unread],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0070_hierarchy_links'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='notification_counter', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('unread', models.IntegerField(default=0)),
+                ('update_time', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Notification Counter',
+                'verbose_name_plural': 'Notification Counters',
+                'db_table': 'notification_counters',
+            },
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0071_notification_counter'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='actionlog',
+            name='finance_part',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.projectfinancepart'),
+        ),
+        migrations.AlterField(
+            model_name='actionlog',
+            name='project',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.project'),
+        ),
+        migrations.AlterField(
+            model_name='actionlog',
+            name='tech_part',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.projectgippart'),
+        ),
+        migrations.AlterField(
+            model_name='actionlog',
+            name='work_order',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.workorder'),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='finance_part',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.projectfinancepart'),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='project',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.project'),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='tech_part',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.projectgippart'),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='work_order',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.workorder'),
+        ),
+        migrations.AlterField(
+            model_name='objectlaststatus',
+            name='finance_part',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.projectfinancepart'),
+        ),
+        migrations.AlterField(
+            model_name='objectlaststatus',
+            name='project',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.project'),
+        ),
+        migrations.AlterField(
+            model_name='objectlaststatus',
+            name='tech_part',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.projectgippart'),
+        ),
+        migrations.AlterField(
+            model_name='objectlaststatus',
+            name='work_order',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.workorder'),
+        ),
+    ]
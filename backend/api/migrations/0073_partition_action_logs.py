@@ -0,0 +1,75 @@
+import datetime
+
+from django.db import migrations
+
+MONTHS_AHEAD = 3
+
+
+def _add_months(value, months):
+    month = value.month - 1 + months
+    return value.replace(year=value.year + month // 12, month=month % 12 + 1, day=1)
+
+
+def partition_action_logs(apps, schema_editor):
+    """
+    Rebuild action_logs as a table partitioned by month on performed_at.
+
+    PostgreSQL needs the partition key in the primary key, so the table's key becomes
+    (action_id, performed_at); action_id stays unique through its identity sequence and
+    the model keeps treating it as the pk. Index and FK definitions are copied from
+    the current table, so their names do not change.
+    """
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_get_indexdef(indexrelid) FROM pg_index "
+            "WHERE indrelid = 'action_logs'::regclass AND NOT indisprimary"
+        )
+        indexes = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = 'action_logs'::regclass AND contype = 'f'"
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute("SELECT min(performed_at) FROM action_logs")
+        oldest = cursor.fetchone()[0]
+
+        cursor.execute("ALTER TABLE action_logs RENAME TO action_logs_unpartitioned")
+        cursor.execute(
+            "CREATE TABLE action_logs (LIKE action_logs_unpartitioned INCLUDING DEFAULTS INCLUDING IDENTITY) "
+            "PARTITION BY RANGE (performed_at)"
+        )
+
+        now = datetime.datetime.now(datetime.timezone.utc)
+        month = datetime.datetime((oldest or now).year, (oldest or now).month, 1, tzinfo=datetime.timezone.utc)
+        last = _add_months(datetime.datetime(now.year, now.month, 1, tzinfo=datetime.timezone.utc), MONTHS_AHEAD)
+        while month <= last:
+            cursor.execute(
+                f"CREATE TABLE action_logs_p{month:%Y%m} PARTITION OF action_logs "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+            )
+            month = _add_months(month, 1)
+        cursor.execute("CREATE TABLE action_logs_default PARTITION OF action_logs DEFAULT")
+
+        cursor.execute("INSERT INTO action_logs SELECT * FROM action_logs_unpartitioned")
+        cursor.execute("DROP TABLE action_logs_unpartitioned")
+        cursor.execute(
+            "SELECT setval(pg_get_serial_sequence('action_logs', 'action_id'), "
+            "coalesce((SELECT max(action_id) FROM action_logs), 0) + 1, false)"
+        )
+
+        cursor.execute("ALTER TABLE action_logs ADD CONSTRAINT action_logs_pkey PRIMARY KEY (action_id, performed_at)")
+        for definition in indexes:
+            cursor.execute(definition)
+        for name, definition in foreign_keys:
+            cursor.execute(f"ALTER TABLE action_logs ADD CONSTRAINT {schema_editor.quote_name(name)} {definition}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0072_cascade_hierarchy_links'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_action_logs, migrations.RunPython.noop),
+    ]
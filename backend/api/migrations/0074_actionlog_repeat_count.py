@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0073_partition_action_logs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='actionlog',
+            name='last_repeated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='actionlog',
+            name='repeat_count',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0074_actionlog_repeat_count'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='objectlaststatus',
+            index=models.Index(fields=['full_id'], name='laststatus_full_id_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:08
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0075_objectlaststatus_full_id_prefix_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='actionlog',
+            index=models.Index(models.F('notify_to'), models.F('identified'), models.OrderBy(django.db.models.functions.comparison.Coalesce('last_repeated_at', 'performed_at'), descending=True), name='actionlog_inbox_activity_idx'),
+        ),
+    ]
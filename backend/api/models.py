@@ -1,4 +1,10 @@
-from django.db import models
+import datetime
+
+from django.db import connection, models
+from django.db.models import OuterRef, Value
+from django.db.models.functions import Cast, Coalesce, Concat, Greatest, Substr, Upper
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import TrigramSimilarity
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.utils import timezone
 from django.core.validators import FileExtensionValidator
@@ -285,7 +291,176 @@ class HistoricalProjectBase(models.Model):
 
 
 
-class Project(models.Model):
+def _subquery_count(queryset):
+    """COUNT(*) of a correlated queryset as a scalar subquery (0 when empty)."""
+    counted = queryset.order_by().annotate(_count=models.Func(models.F('pk'), function='COUNT')).values('_count')
+    return Coalesce(models.Subquery(counted, output_field=models.IntegerField()), 0)
+
+
+def prefetch_last_status(objects):
+    """
+    Load ObjectLastStatus (with phase type and user) for a list of hierarchy objects
+    in one query and cache it on each instance for last_status / last_status_object.
+    """
+    objects = [obj for obj in objects if obj is not None]
+    by_full_id = {}
+    for obj in objects:
+        by_full_id.setdefault(obj.full_id, []).append(obj)
+
+    statuses = ObjectLastStatus.objects.filter(
+        full_id__in=[full_id for full_id in by_full_id if full_id]
+    ).select_related('latest_phase_type', 'updated_by')
+    statuses = {status.full_id: status for status in statuses}
+
+    for full_id, same_objects in by_full_id.items():
+        for obj in same_objects:
+            obj._last_status_cache = statuses.get(full_id)
+    return objects
+
+
+def reprefix_full_ids(old_prefix, new_prefix):
+    """Rewrite stored paths under old_prefix (descendants, logs, statuses, messages) after a re-parent."""
+    new_path = Concat(Value(new_prefix), Substr('full_id', len(old_prefix) + 1))
+    for model in (ProjectGipPart, WorkOrder):
+        model.objects.filter(full_id__startswith=old_prefix).update(full_id=new_path)
+
+    # typed links above the moved level follow the new prefix
+    links = {
+        attname: pk
+        for attname, pk in HierarchyLinkedModel.links_from_full_id(new_prefix).items()
+        if pk is not None
+    }
+    for model in (ActionLog, ObjectLastStatus, Message):
+        model.objects.filter(full_id__startswith=old_prefix).update(full_id=new_path, **links)
+
+
+class StoredFullIdMixin:
+    """
+    Hierarchy models with a stored full_id column, derived from the parent's path
+    on save and re-prefixed down the tree when an object moves to another parent.
+
+    Models define build_full_id(): the parent's full_id followed by their own pk.
+    A new row takes its pk from the table's sequence first, so it is inserted
+    with its full_id already set (post_save receivers see it) instead of being
+    patched by a second UPDATE.
+    """
+
+    def save(self, *args, **kwargs):
+        if self._state.adding and self.pk is None:
+            self.pk = next_pk(type(self))
+            kwargs['force_insert'] = True
+
+        old_full_id, self.full_id = self.full_id, self.build_full_id()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and self.full_id != old_full_id:
+            kwargs['update_fields'] = {*update_fields, 'full_id'}
+        super().save(*args, **kwargs)
+
+        if old_full_id and self.full_id != old_full_id:
+            reprefix_full_ids(old_full_id, self.full_id)
+
+
+def next_pk(model):
+    """Reserve the next value of model's primary key sequence."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT nextval(pg_get_serial_sequence(%s, %s))',
+            [model._meta.db_table, model._meta.pk.column],
+        )
+        return cursor.fetchone()[0]
+
+
+class LastStatusMixin:
+    """last_status for Project / parts / work orders, served from prefetch_last_status() when available."""
+
+    @property
+    def last_status_object(self):
+        if not hasattr(self, '_last_status_cache'):
+            prefetch_last_status([self])
+        return self._last_status_cache
+
+    @property
+    def last_status(self):
+        status = self.last_status_object
+        return status.as_last_status() if status is not None else None
+
+
+def trigram_index(field, name):
+    """GIN pg_trgm index on UPPER(field): the expression Django's icontains compares against."""
+    return GinIndex(OpClass(Upper(field), name='gin_trgm_ops'), name=name)
+
+
+class ProjectQuerySet(models.QuerySet):
+
+    def visible_to(self, user, capabilities=None):
+        """Projects the user's project list shows: all for directors, else those they are a member of by role."""
+        capabilities = set(user.get_capability_names() if capabilities is None else capabilities)
+
+        # ✅ If user is Tech Director or Fin Director — see all projects
+        if 'IS_TECH_DIR' in capabilities or 'IS_FIN_DIR' in capabilities or 'IS_GEN_DIR' in capabilities:
+            return self
+
+        relations = ['CREATOR', 'GIP']
+        if 'IS_FINANCIER' in capabilities:
+            relations.append('FINANCIER')
+        if 'IS_NACH_OTDEL' in capabilities:
+            relations.append('TECH_PART_NACH')
+        if 'IS_STAFF' in capabilities:
+            relations.append('WORK_ORDER_STAFF')
+
+        memberships = ProjectMembership.objects.filter(user=user, relation__in=relations)
+        return self.filter(project_code__in=memberships.values('project'))
+
+    def search(self, term):
+        """
+        icontains match on project name, contract number, partner name and INN,
+        annotated with search_rank (best trigram similarity) for ordering.
+        """
+        term = (term or '').strip()
+        if not term:
+            return self
+        partners = Partner.objects.search(term).values('pk')
+        return self.filter(
+            models.Q(project_name__icontains=term) |
+            models.Q(contract_number__icontains=term) |
+            models.Q(partner__in=partners)
+        ).annotate(
+            search_rank=Greatest(
+                TrigramSimilarity('project_name', term),
+                TrigramSimilarity('contract_number', term),
+                TrigramSimilarity('partner__partner_name', term),
+                TrigramSimilarity('partner__partner_inn', term),
+            )
+        )
+
+    def with_list_stats(self):
+        """
+        Everything ProjectSerializer shows on a list row, read in the same SELECT:
+        part / work order counters and confirmation flags from ProjectRollup and the
+        last status of the project.
+        """
+        status = ObjectLastStatus.objects.filter(
+            full_id=Concat(Cast(OuterRef('pk'), output_field=models.CharField()), Value('/'))
+        )
+
+        return self.select_related(
+            'create_user__position', 'financier__position', 'partner', 'currency'
+        ).annotate(
+            finance_parts_count=Coalesce(models.F('rollup__finance_parts_count'), 0),
+            technical_parts_count=Coalesce(models.F('rollup__tech_parts_count'), 0),
+            all_sent_to_tech_dir=Coalesce(models.F('rollup__all_sent_to_tech_dir'), True),
+            all_tech_dir_confirmed=Coalesce(models.F('rollup__all_tech_dir_confirmed'), True),
+            work_order_count=Coalesce(models.F('rollup__work_orders_count'), 0),
+            work_order_confirmed_count=Coalesce(models.F('rollup__work_orders_finished_count'), 0),
+            last_status_action=models.Subquery(status.values('latest_action')[:1]),
+            last_status_phase_name=models.Subquery(status.values('latest_phase_type__name')[:1]),
+            last_status_updated=models.Subquery(status.values('last_updated')[:1]),
+            last_status_updated_by=models.Subquery(status.values('updated_by__fio')[:1]),
+            last_status_comment=models.Subquery(status.values('comment')[:1]),
+        )
+
+
+class Project(LastStatusMixin, models.Model):
     project_code = models.AutoField(primary_key=True)
     project_name = models.CharField(max_length=255,unique=True)
     contract_number = models.CharField(max_length=255,null=True, blank=True)
@@ -329,6 +504,8 @@ class Project(models.Model):
     update_date = models.DateTimeField(auto_now=True)
 
 
+    objects = ProjectQuerySet.as_manager()
+
     # ✅ Add this line
     
     history = HistoricalRecords(
@@ -341,6 +518,13 @@ class Project(models.Model):
         db_table = 'projects'
         verbose_name = "Project"
         verbose_name_plural = "Projects"
+        indexes = [
+            trigram_index('project_name', 'project_name_trgm_idx'),
+            trigram_index('contract_number', 'project_contract_trgm_idx'),
+            models.Index(fields=['-create_date', '-project_code'], name='project_create_date_idx'),
+            models.Index(fields=['financier', 'financier_confirm', '-create_date'], name='project_financier_queue_idx'),
+            models.Index(fields=['project_gip', 'gip_confirm', '-create_date'], name='project_gip_queue_idx'),
+        ]
 
     def __str__(self):
         return f"{self.project_code} - {self.project_name}"
@@ -352,21 +536,6 @@ class Project(models.Model):
         except Exception:
             return None
 
-    @property
-    def last_status(self):
-        from api.models import ObjectLastStatus
-        try:
-            status = ObjectLastStatus.objects.get(full_id=self.full_id)
-            return {
-                "latest_action": status.latest_action,
-                "latest_phase_type": status.latest_phase_type.name if status.latest_phase_type else None,
-                "last_updated": status.last_updated,
-                "updated_by": status.updated_by.fio if status.updated_by else None,
-                'comment':status.comment
-            }
-        except ObjectLastStatus.DoesNotExist:
-            return None
-    
     @property
     def path_type(self):
         return "PROJECT"
@@ -380,7 +549,7 @@ class HistoricalProjectFinancePartBase(models.Model):
 
        
 
-class ProjectFinancePart(models.Model):
+class ProjectFinancePart(StoredFullIdMixin, LastStatusMixin, models.Model):
     fs_part_code = models.AutoField(primary_key=True)
 
     project_code = models.ForeignKey(
@@ -411,11 +580,15 @@ class ProjectFinancePart(models.Model):
     tech_dir_confirm = models.BooleanField(default=False)
     tech_dir_confirm_date = models.DateTimeField(null=True, blank=True)
 
+    full_id = models.CharField(max_length=255, blank=True, default='', editable=False, db_index=True,
+                               help_text="Hierarchical full identifier, maintained on save")
+
     
     history = HistoricalRecords(
         bases=[HistoricalProjectFinancePartBase],
         table_name='pro_fin_part_hist',
-        custom_model_name='HistoricalProjectFinancePart'
+        custom_model_name='HistoricalProjectFinancePart',
+        excluded_fields=['full_id'],
     )
     class Meta:
         db_table = 'pro_fin_part'
@@ -430,34 +603,32 @@ class ProjectFinancePart(models.Model):
         return f"{self.fs_part_code} - {self.fs_part_name}"
     
     
-    @property
-    def full_id(self):
-        try:
-            return f"{self.project_code.project_code}/{self.fs_part_code}/"
-        except Exception:
-            return None
+    def build_full_id(self):
+        return f"{self.project_code_id}/{self.fs_part_code}/"
 
-    @property
-    def last_status(self):
-        from api.models import ObjectLastStatus
-        try:
-            status = ObjectLastStatus.objects.get(full_id=self.full_id)
-            return {
-                "latest_action": status.latest_action,
-                "latest_phase_type": status.latest_phase_type.name if status.latest_phase_type else None,
-                "last_updated": status.last_updated,
-                "updated_by": status.updated_by.fio if status.updated_by else None,
-                'comment':status.comment
-            }
-        except ObjectLastStatus.DoesNotExist:
-            return None
-        
     @property
     def path_type(self):
         return "FIN_PART"
     
 
 
+class PartnerQuerySet(models.QuerySet):
+
+    def search(self, term):
+        """icontains match on partner name / INN, annotated with search_rank."""
+        term = (term or '').strip()
+        if not term:
+            return self
+        return self.filter(
+            models.Q(partner_name__icontains=term) | models.Q(partner_inn__icontains=term)
+        ).annotate(
+            search_rank=Greatest(
+                TrigramSimilarity('partner_name', term),
+                TrigramSimilarity('partner_inn', term),
+            )
+        )
+
+
 class Partner(models.Model):
     partner_code = models.AutoField(primary_key=True)
     partner_name = models.CharField(max_length=500,unique=True)
@@ -474,6 +645,8 @@ class Partner(models.Model):
     create_time = models.DateTimeField(default=timezone.now)
     update_time = models.DateTimeField(auto_now=True)
 
+    objects = PartnerQuerySet.as_manager()
+
     def __str__(self):
         return self.partner_name
 
@@ -481,6 +654,10 @@ class Partner(models.Model):
         db_table = 'partners'
         verbose_name = "Partner"
         verbose_name_plural = "Partners"
+        indexes = [
+            trigram_index('partner_name', 'partner_name_trgm_idx'),
+            trigram_index('partner_inn', 'partner_inn_trgm_idx'),
+        ]
 
 
 
@@ -621,7 +798,7 @@ class HistoricalProjectGipPartBase(models.Model):
         abstract = True
 
 
-class ProjectGipPart(models.Model):
+class ProjectGipPart(StoredFullIdMixin, LastStatusMixin, models.Model):
     tch_part_code = models.AutoField(primary_key=True)
 
     fs_part_code = models.ForeignKey(
@@ -654,11 +831,15 @@ class ProjectGipPart(models.Model):
     nach_otd_confirm = models.BooleanField(default=False)
     nach_otd_confirm_date = models.DateTimeField(null=True, blank=True)  # ✅ New field
 
+    full_id = models.CharField(max_length=255, blank=True, default='', editable=False, db_index=True,
+                               help_text="Hierarchical full identifier, maintained on save")
+
     
     history = HistoricalRecords(
         bases=[HistoricalProjectGipPartBase],
         table_name='project_gip_parts_hist',
-        custom_model_name='HistoricalProjectGipPart'
+        custom_model_name='HistoricalProjectGipPart',
+        excluded_fields=['full_id'],
     )
     class Meta:
         db_table = 'project_gip_parts'
@@ -670,28 +851,8 @@ class ProjectGipPart(models.Model):
     
     
     
-    @property
-    def full_id(self):
-        try:
-            project = self.fs_part_code.project_code
-            return f"{project.project_code}/{self.fs_part_code.fs_part_code}/{self.tch_part_code}/"
-        except Exception:
-            return None
-
-    @property
-    def last_status(self):
-        from api.models import ObjectLastStatus
-        try:
-            status = ObjectLastStatus.objects.get(full_id=self.full_id)
-            return {
-                "latest_action": status.latest_action,
-                "latest_phase_type": status.latest_phase_type.name if status.latest_phase_type else None,
-                "last_updated": status.last_updated,
-                "updated_by": status.updated_by.fio if status.updated_by else None,
-                'comment':status.comment
-            }
-        except ObjectLastStatus.DoesNotExist:
-            return None
+    def build_full_id(self):
+        return f"{self.fs_part_code.full_id}{self.tch_part_code}/"
 
     @property
     def path_type(self):
@@ -757,7 +918,7 @@ class HistoricalWorkOrderBase(models.Model):
         abstract = True
         
 
-class WorkOrder(models.Model):
+class WorkOrder(StoredFullIdMixin, LastStatusMixin, models.Model):
     wo_id = models.AutoField(primary_key=True)
 
     tch_part_code = models.ForeignKey(
@@ -805,49 +966,355 @@ class WorkOrder(models.Model):
         null=True,
         related_name='holded_fors'
     )
-    
+
+    full_id = models.CharField(max_length=255, blank=True, default='', editable=False, db_index=True,
+                               help_text="Hierarchical full identifier, maintained on save")
+
     history = HistoricalRecords(
         bases=[HistoricalWorkOrderBase],
         table_name='work_order_hist',
-        custom_model_name='HistoricalWorkOrder'
+        custom_model_name='HistoricalWorkOrder',
+        excluded_fields=['full_id'],
         )
 
     class Meta:
         db_table = 'work_orders'
         verbose_name = 'Work Order'
         verbose_name_plural = 'Work Orders'
+        indexes = [
+            # "my work orders" (StaffWorkOrderListView)
+            models.Index(fields=['wo_staff', '-wo_start_date'], name='wo_staff_start_idx'),
+            # answered work orders waiting for the creator (CompleteWorkOrderListView)
+            models.Index(
+                fields=['create_user', '-answer_date'],
+                condition=models.Q(staff_confirm=True, wo_answer__isnull=False, answer_date__isnull=False),
+                name='wo_answered_idx',
+            ),
+        ]
         
+    def build_full_id(self):
+        return f"{self.tch_part_code.full_id}{self.wo_id}/"
+
     @property
-    def full_id(self):
+    def path_type(self):
+        return "WORK_ORDER"
+
+
+
+class ProjectRollupManager(models.Manager):
+
+    def bump(self, project_code, **deltas):
+        """Add deltas to one project's counters (touches update_time even without deltas)."""
+        if not project_code:
+            return
+        changes = {field: models.F(field) + delta for field, delta in deltas.items() if delta}
+        self.filter(project_id=project_code).update(update_time=timezone.now(), **changes)
+
+    def bump_many(self, deltas):
+        """bump() for {project_code: {counter: delta}} in one UPDATE."""
+        deltas = {project: changes for project, changes in deltas.items() if project}
+        if not deltas:
+            return
+        fields = {field for changes in deltas.values() for field, delta in changes.items() if delta}
+        changes = {
+            field: models.F(field) + models.Case(
+                *[models.When(project_id=project, then=counts[field])
+                  for project, counts in deltas.items() if counts.get(field)],
+                default=0,
+                output_field=models.IntegerField(),
+            )
+            for field in fields
+        }
+        self.filter(project_id__in=deltas).update(update_time=timezone.now(), **changes)
+
+    def rebuild(self, project_codes=None, batch_size=500):
+        """Recompute rollup rows from the source tables; all projects when project_codes is None."""
+        projects = Project.objects.order_by('pk')
+        if project_codes is not None:
+            projects = projects.filter(pk__in=project_codes)
+
+        finance_parts = ProjectFinancePart.objects.filter(project_code=OuterRef('pk'))
+        work_orders = WorkOrder.objects.filter(tch_part_code__fs_part_code__project_code=OuterRef('pk'))
+        projects = projects.annotate(
+            n_parts=_subquery_count(finance_parts),
+            n_sent=_subquery_count(finance_parts.filter(send_to_tech_dir=True)),
+            n_confirmed=_subquery_count(finance_parts.filter(tech_dir_confirm=True)),
+            n_tech_parts=_subquery_count(ProjectGipPart.objects.filter(fs_part_code__project_code=OuterRef('pk'))),
+            n_work_orders=_subquery_count(work_orders),
+            n_finished=_subquery_count(work_orders.filter(finished=True)),
+        ).values_list('pk', 'n_parts', 'n_sent', 'n_confirmed', 'n_tech_parts', 'n_work_orders', 'n_finished')
+
+        rebuilt = 0
+        last_pk = 0
+        while True:
+            rows = list(projects.filter(pk__gt=last_pk)[:batch_size])
+            if not rows:
+                return rebuilt
+            now = timezone.now()
+            self.bulk_create(
+                [
+                    ProjectRollup(
+                        project_id=pk,
+                        finance_parts_count=n_parts,
+                        parts_sent_count=n_sent,
+                        parts_confirmed_count=n_confirmed,
+                        tech_parts_count=n_tech_parts,
+                        work_orders_count=n_work_orders,
+                        work_orders_finished_count=n_finished,
+                        update_time=now,
+                    )
+                    for pk, n_parts, n_sent, n_confirmed, n_tech_parts, n_work_orders, n_finished in rows
+                ],
+                update_conflicts=True,
+                unique_fields=['project'],
+                update_fields=[
+                    'finance_parts_count', 'parts_sent_count', 'parts_confirmed_count',
+                    'tech_parts_count', 'work_orders_count', 'work_orders_finished_count', 'update_time',
+                ],
+            )
+            rebuilt += len(rows)
+            last_pk = rows[-1][0]
+
+
+class ProjectRollup(models.Model):
+    """Per-project counters kept in step with parts / work orders by api.signals."""
+    project = models.OneToOneField(
+        'Project',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='rollup',
+        db_column='project_code'
+    )
+    finance_parts_count = models.IntegerField(default=0)
+    parts_sent_count = models.IntegerField(default=0)
+    parts_confirmed_count = models.IntegerField(default=0)
+    tech_parts_count = models.IntegerField(default=0)
+    work_orders_count = models.IntegerField(default=0)
+    work_orders_finished_count = models.IntegerField(default=0)
+
+    all_sent_to_tech_dir = models.GeneratedField(
+        expression=models.Q(parts_sent_count=models.F('finance_parts_count')),
+        output_field=models.BooleanField(),
+        db_persist=True,
+    )
+    all_tech_dir_confirmed = models.GeneratedField(
+        expression=models.Q(parts_confirmed_count=models.F('finance_parts_count')),
+        output_field=models.BooleanField(),
+        db_persist=True,
+    )
+    update_time = models.DateTimeField(default=timezone.now)
+
+    objects = ProjectRollupManager()
+
+    class Meta:
+        db_table = 'project_rollups'
+        verbose_name = 'Project Rollup'
+        verbose_name_plural = 'Project Rollups'
+        indexes = [
+            models.Index(
+                fields=['all_tech_dir_confirmed'],
+                condition=models.Q(parts_sent_count__gt=0),
+                name='rollup_tech_dir_queue_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Rollup {self.project_id}"
+
+
+
+class ProjectMembershipManager(models.Manager):
+
+    # relation -> (model, lookup of its project, user field)
+    SOURCES = {
+        'CREATOR': (Project, 'pk', 'create_user'),
+        'GIP': (Project, 'pk', 'project_gip'),
+        'FINANCIER': (Project, 'pk', 'financier'),
+        'TECH_PART_NACH': (ProjectGipPart, 'fs_part_code__project_code', 'tch_part_nach'),
+        'WORK_ORDER_STAFF': (WorkOrder, 'tch_part_code__fs_part_code__project_code', 'wo_staff'),
+    }
+
+    def _members(self, relation, project_codes=None):
+        model, project_lookup, user_field = self.SOURCES[relation]
+        qs = model.objects.filter(**{f'{user_field}__isnull': False})
+        if project_codes is not None:
+            qs = qs.filter(**{f'{project_lookup}__in': project_codes})
+        return qs.values_list(user_field, project_lookup).distinct()
+
+    def sync(self, project_code, relations):
+        """Bring one project's rows for the given relations in line with the source tables."""
+        if not project_code or not relations:
+            return
+        wanted = {
+            (user_id, relation)
+            for relation in relations
+            for user_id, _ in self._members(relation, [project_code])
+        }
+        existing = set(
+            self.filter(project_id=project_code, relation__in=relations).values_list('user_id', 'relation')
+        )
+        stale = existing - wanted
+        if stale:
+            condition = models.Q()
+            for user_id, relation in stale:
+                condition |= models.Q(user_id=user_id, relation=relation)
+            self.filter(condition, project_id=project_code).delete()
+        if wanted - existing:
+            self.bulk_create(
+                [ProjectMembership(user_id=user_id, project_id=project_code, relation=relation)
+                 for user_id, relation in wanted - existing],
+                ignore_conflicts=True,
+            )
+
+    def rebuild(self, project_codes=None, batch_size=1000):
+        """Recreate membership rows from scratch; all projects when project_codes is None."""
+        stale = self.all() if project_codes is None else self.filter(project_id__in=project_codes)
+        stale.delete()
+        rows = [
+            ProjectMembership(user_id=user_id, project_id=project_code, relation=relation)
+            for relation in self.SOURCES
+            for user_id, project_code in self._members(relation, project_codes).iterator()
+        ]
+        self.bulk_create(rows, batch_size=batch_size, ignore_conflicts=True)
+        return len(rows)
+
+
+class ProjectMembership(models.Model):
+    """Who is attached to a project and how; kept in sync by api.signals."""
+    RELATION_CHOICES = [
+        ('CREATOR', 'Creator'),
+        ('GIP', 'GIP'),
+        ('FINANCIER', 'Financier'),
+        ('TECH_PART_NACH', 'Technical part head'),
+        ('WORK_ORDER_STAFF', 'Work order staff'),
+    ]
+
+    user = models.ForeignKey(
+        StaffUser,
+        on_delete=models.CASCADE,
+        related_name='project_memberships'
+    )
+    project = models.ForeignKey(
+        'Project',
+        on_delete=models.CASCADE,
+        related_name='memberships',
+        db_column='project_code'
+    )
+    relation = models.CharField(max_length=20, choices=RELATION_CHOICES)
+
+    objects = ProjectMembershipManager()
+
+    class Meta:
+        db_table = 'project_memberships'
+        verbose_name = 'Project Membership'
+        verbose_name_plural = 'Project Memberships'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'relation', 'project'],
+                name='project_membership_unique',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.relation} {self.project_id}"
+
+
+
+class HierarchyLinkedQuerySet(models.QuerySet):
+
+    @staticmethod
+    def _live_condition():
+        condition = models.Q()
+        for path_type, field in HierarchyLinkedModel.TARGET_FIELDS.items():
+            condition |= models.Q(path_type=path_type, **{f'{field}__isnull': False})
+        return condition
+
+    def live(self):
+        """Rows whose typed FK for their path_type is set, i.e. the target object exists."""
+        return self.filter(self._live_condition())
+
+    def orphaned(self):
+        """Rows without a target: left over from before deletes cascaded, or with an unresolvable full_id."""
+        return self.exclude(self._live_condition())
+
+
+class HierarchyLinkedModel(models.Model):
+    """
+    Rows addressed by (full_id, path_type). The typed FKs are parsed from full_id on
+    save so lookups can join / select_related instead of splitting the string.
+    Deleting a project / part / work order deletes the rows about it and its subtree.
+    """
+    TARGET_FIELDS = {
+        'PROJECT': 'project',
+        'FIN_PART': 'finance_part',
+        'TECH_PART': 'tech_part',
+        'WORK_ORDER': 'work_order',
+    }
+
+    project = models.ForeignKey('Project', on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    finance_part = models.ForeignKey('ProjectFinancePart', on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    tech_part = models.ForeignKey('ProjectGipPart', on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    work_order = models.ForeignKey('WorkOrder', on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+
+    objects = HierarchyLinkedQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+    @staticmethod
+    def links_from_full_id(full_id):
+        """{'project_id': .., 'finance_part_id': .., ...} for a "p/f/t/w/" path (None past its depth)."""
         try:
-            finance_part = self.tch_part_code.fs_part_code
-            project = finance_part.project_code
-            return f"{project.project_code}/{finance_part.fs_part_code}/{self.tch_part_code.tch_part_code}/{self.wo_id}/"
-        except Exception:
-            return None
+            ids = [int(part) for part in (full_id or '').strip('/').split('/') if part]
+        except ValueError:
+            ids = []
+        ids = (ids + [None] * 4)[:4]
+        return {f'{field}_id': pk for field, pk in zip(HierarchyLinkedModel.TARGET_FIELDS.values(), ids)}
+
+    def fill_hierarchy_links(self):
+        for attname, pk in self.links_from_full_id(self.full_id).items():
+            setattr(self, attname, pk)
+
+    def save(self, *args, **kwargs):
+        self.fill_hierarchy_links()
+        super().save(*args, **kwargs)
 
     @property
-    def last_status(self):
-        from api.models import ObjectLastStatus
-        try:
-            status = ObjectLastStatus.objects.get(full_id=self.full_id)
-            return {
-                "latest_action": status.latest_action,
-                "latest_phase_type": status.latest_phase_type.name if status.latest_phase_type else None,
-                "last_updated": status.last_updated,
-                "updated_by": status.updated_by.fio if status.updated_by else None,
-                'comment':status.comment
-            }
-        except ObjectLastStatus.DoesNotExist:
+    def target(self):
+        """The object this row points at (per path_type), None once it is deleted."""
+        field = self.TARGET_FIELDS.get(self.path_type)
+        return getattr(self, field) if field else None
+
+    def get_live_target(self):
+        """Fetch the target and check it still lives at full_id (for validating client input)."""
+        field = self.TARGET_FIELDS.get(self.path_type)
+        pk = getattr(self, f'{field}_id', None) if field else None
+        if pk is None:
             return None
+        target = self._meta.get_field(field).related_model.objects.filter(pk=pk).first()
+        return target if target is not None and target.full_id == self.full_id else None
 
-    @property
-    def path_type(self):
-        return "WORK_ORDER"
+
+def notification_window_start(now=None):
+    """
+    First instant of the notification window: the oldest month inside
+    ACTION_LOG_RETENTION_MONTHS, which is also where action_log_partitions
+    archives. The inbox and NotificationCounter only see logs from here on.
+    """
+    now = now or timezone.now()
+    month = now.month - 1 - settings.ACTION_LOG_RETENTION_MONTHS
+    return datetime.datetime(now.year + month // 12, month % 12 + 1, 1, tzinfo=datetime.timezone.utc)
 
 
+class ActionLogQuerySet(HierarchyLinkedQuerySet):
 
-class ActionLog(models.Model):
+    def recent(self):
+        """Logs inside the notification window, so older monthly partitions are pruned at plan time."""
+        return self.filter(performed_at__gte=notification_window_start())
+
+
+class ActionLog(HierarchyLinkedModel):
+    """Partitioned by month on performed_at (see api.partitions); the db primary key is (action_id, performed_at)."""
     action_id = models.AutoField(primary_key=True)
 
     full_id = models.CharField(max_length=255, help_text="Hierarchical full identifier")
@@ -880,18 +1347,181 @@ class ActionLog(models.Model):
     identified = models.BooleanField(default=False)
     identified_time = models.DateTimeField(null=True, blank=True)
 
+    # Coalesced repeats of this unread notification (see services.create_action_logs)
+    repeat_count = models.PositiveIntegerField(default=1)
+    last_repeated_at = models.DateTimeField(null=True, blank=True)
+
+    objects = ActionLogQuerySet.as_manager()
+
     class Meta:
         db_table = 'action_logs'
         ordering = ['-performed_at']
         verbose_name = 'Action Log'
         verbose_name_plural = 'Action Logs'
+        indexes = [
+            # notifications inbox / unread counter
+            models.Index(fields=['notify_to', 'identified', '-performed_at'], name='actionlog_inbox_idx'),
+            # inbox order: latest occurrence, a coalesced repeat included
+            models.Index(
+                models.F('notify_to'), models.F('identified'), Coalesce('last_repeated_at', 'performed_at').desc(),
+                name='actionlog_inbox_activity_idx',
+            ),
+            # full_id__startswith (LIKE 'p/%') under a non-C collation
+            models.Index(fields=['full_id'], opclasses=['varchar_pattern_ops'], name='actionlog_full_id_prefix_idx'),
+        ]
 
     def __str__(self):
         return f"{self.full_id} | {self.phase_type} by {self.performed_by}"
 
+    @property
+    def unread_by(self):
+        """notify_to user id while this log counts as an unread notification (not identified, target alive, recent)."""
+        field = self.TARGET_FIELDS.get(self.path_type)
+        if self.identified or not field or getattr(self, f'{field}_id') is None:
+            return None
+        if self.performed_at and self.performed_at < notification_window_start():
+            return None
+        return self.notify_to_id
+
+
+class NotificationCounterManager(models.Manager):
+
+    def bump(self, user_id, delta):
+        """Add delta to one user's unread counter, creating the row on first use."""
+        if not user_id or not delta:
+            return
+        changes = {'unread': models.F('unread') + delta, 'update_time': timezone.now()}
+        if not self.filter(user_id=user_id).update(**changes):
+            self.bulk_create([NotificationCounter(user_id=user_id)], ignore_conflicts=True)
+            self.filter(user_id=user_id).update(**changes)
+
+    def bump_many(self, deltas):
+        """Apply {user_id: delta} in two queries (create missing rows, then one UPDATE)."""
+        deltas = {user_id: delta for user_id, delta in deltas.items() if user_id and delta}
+        if not deltas:
+            return
+        self.bulk_create([NotificationCounter(user_id=user_id) for user_id in deltas], ignore_conflicts=True)
+        self.filter(user_id__in=deltas).update(
+            unread=models.F('unread') + models.Case(
+                *[models.When(user_id=user_id, then=delta) for user_id, delta in deltas.items()],
+                output_field=models.IntegerField(),
+            ),
+            update_time=timezone.now(),
+        )
+
+    def unread(self, user_id):
+        return self.filter(user_id=user_id).values_list('unread', flat=True).first() or 0
+
+    def unread_many(self, user_ids):
+        counts = dict(self.filter(user_id__in=user_ids).values_list('user_id', 'unread'))
+        return {user_id: counts.get(user_id, 0) for user_id in user_ids}
+
+    def rebuild(self, user_ids=None, batch_size=500):
+        """Recompute counters from action_logs; only drifted rows are written. Returns how many were fixed."""
+        users = StaffUser.objects.order_by('pk')
+        if user_ids is not None:
+            users = users.filter(pk__in=user_ids)
+
+        fixed = 0
+        last_pk = 0
+        while True:
+            batch = list(users.filter(pk__gt=last_pk).values_list('pk', flat=True)[:batch_size])
+            if not batch:
+                return fixed
+            actual = dict(
+                ActionLog.objects.live().recent()
+                .filter(notify_to__in=batch, identified=False)
+                .order_by()
+                .values('notify_to')
+                .annotate(n=models.Count('pk'))
+                .values_list('notify_to', 'n')
+            )
+            stored = dict(self.filter(user__in=batch).values_list('user', 'unread'))
+            now = timezone.now()
+            drifted = [
+                NotificationCounter(user_id=pk, unread=actual.get(pk, 0), update_time=now)
+                for pk in batch
+                if stored.get(pk, 0) != actual.get(pk, 0)
+            ]
+            self.bulk_create(
+                drifted,
+                update_conflicts=True,
+                unique_fields=['user'],
+                update_fields=['unread', 'update_time'],
+            )
+            fixed += len(drifted)
+            last_pk = batch[-1]
+
+
+class NotificationCounter(models.Model):
+    """Per-user unread notification count kept in step with action_logs by api.signals."""
+    user = models.OneToOneField(
+        StaffUser,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='notification_counter'
+    )
+    unread = models.IntegerField(default=0)
+    update_time = models.DateTimeField(default=timezone.now)
 
+    objects = NotificationCounterManager()
+
+    class Meta:
+        db_table = 'notification_counters'
+        verbose_name = 'Notification Counter'
+        verbose_name_plural = 'Notification Counters'
 
-class ObjectLastStatus(models.Model):
+    def __str__(self):
+        return f"{self.user_id}: {self.unread}"
+
+
+
+class ObjectLastStatusQuerySet(HierarchyLinkedQuerySet):
+
+    def subtree(self, full_id):
+        """Statuses of the object at full_id and of all its descendants (one prefix scan)."""
+        return self.filter(full_id__startswith=full_id)
+
+    def record(self, logs):
+        """
+        Upsert the last status of every object in logs with one INSERT ... ON CONFLICT
+        (the last log per full_id wins), so concurrent writers never race on full_id.
+        Phase keys come from the logs' cached phase_type; only uncached ones are read.
+        """
+        latest = {log.full_id: log for log in logs if log.full_id and log.path_type}
+        keys = {
+            log.phase_type_id: log.phase_type.key
+            for log in latest.values()
+            if log.phase_type_id and ActionLog.phase_type.is_cached(log)
+        }
+        missing = {log.phase_type_id for log in latest.values() if log.phase_type_id} - keys.keys()
+        if missing:
+            keys.update(PhaseType.objects.filter(pk__in=missing).values_list('pk', 'key'))
+
+        statuses = []
+        for log in latest.values():
+            status = ObjectLastStatus(
+                full_id=log.full_id,
+                path_type=log.path_type,
+                latest_action=keys.get(log.phase_type_id, 'UNKNOWN'),
+                latest_phase_type_id=log.phase_type_id,
+                updated_by_id=log.performed_by_id,
+                comment=log.comment,
+            )
+            status.fill_hierarchy_links()
+            statuses.append(status)
+        return self.bulk_create(
+            statuses,
+            update_conflicts=True,
+            unique_fields=['full_id'],
+            update_fields=[
+                'path_type', 'latest_action', 'latest_phase_type', 'updated_by', 'comment', 'last_updated',
+                *HierarchyLinkedModel.TARGET_FIELDS.values(),
+            ],
+        )
+
+
+class ObjectLastStatus(HierarchyLinkedModel):
     full_id = models.CharField(max_length=255, unique=True)
     path_type = models.CharField(max_length=50)
 
@@ -913,18 +1543,34 @@ class ObjectLastStatus(models.Model):
     )
     comment = models.TextField(null=True, blank=True)  # ✅ Add this field
 
+    objects = ObjectLastStatusQuerySet.as_manager()
+
     class Meta:
         db_table = 'object_last_status'
         verbose_name = 'Last Object Status'
         verbose_name_plural = 'Last Object Statuses'
+        indexes = [
+            # subtree() = full_id__startswith (LIKE 'p/%') under a non-C collation
+            models.Index(fields=['full_id'], opclasses=['varchar_pattern_ops'], name='laststatus_full_id_prefix_idx'),
+        ]
 
     def __str__(self):
         return f"{self.full_id} → {self.latest_action}"
+
+    def as_last_status(self):
+        """The last_status payload of the object (expects latest_phase_type / updated_by loaded)."""
+        return {
+            "latest_action": self.latest_action,
+            "latest_phase_type": self.latest_phase_type.name if self.latest_phase_type else None,
+            "last_updated": self.last_updated,
+            "updated_by": self.updated_by.fio if self.updated_by else None,
+            'comment': self.comment
+        }
     
     
     
     
-class Message(models.Model):
+class Message(HierarchyLinkedModel):
     message_id = models.AutoField(primary_key=True)
     content = models.TextField()
     sender = models.ForeignKey(
@@ -968,6 +1614,10 @@ class UserTask(models.Model):
     class Meta:
         db_table = 'user_tasks'
         ordering = ['-create_time']
+        indexes = [
+            models.Index(fields=['receiver', 'done', '-create_time'], name='task_receiver_done_idx'),
+            models.Index(fields=['create_user', 'done', '-create_time'], name='task_creator_done_idx'),
+        ]
 
     def __str__(self):
         return f"{self.create_user.fio} → {self.receiver.fio} {self.title}"
@@ -988,6 +1638,14 @@ class ChatMessage(models.Model):
     class Meta:
         db_table = 'chat_messages'
         ordering = ['send_time']
+        indexes = [
+            # unread messages per receiver, newest first
+            models.Index(
+                fields=['receiver', '-send_time'],
+                condition=models.Q(is_read=False),
+                name='chat_unread_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.sender.fio} → {self.receiver.fio} | {self.message or '📎 File'}"
@@ -1,21 +1,215 @@
 # pagination.py
+import base64
+import datetime
+import json
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(PageNumberPagination):
+    """
+    Page-number pagination that switches to keyset (cursor) pagination when the
+    request carries ?cursor= (empty for the first page, then the `next` /
+    `previous` links).
+
+    Keyset pages seek on every field of the queryset's ordering plus pk: the
+    cursor holds the (key..., pk) values of the row at the page edge and the next
+    page starts strictly after that tuple, so ties and NULLs in the ordering keys
+    neither skip nor repeat rows. Ordering fields must be row attributes (model
+    fields or annotations). NULLs sort as PostgreSQL does (above every value).
+
+    ?with_total=false skips the COUNT(*) in both modes. Both modes answer with the
+    same {count, next, previous, results} envelope.
+    """
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    with_total_query_param = 'with_total'
+    ordering = None  # default: queryset ordering + pk
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.keyset = None
+        self.page = None
+        with_total = request.query_params.get(self.with_total_query_param, '').lower() != 'false'
+        if self.cursor_query_param not in request.query_params:
+            if with_total:
+                return super().paginate_queryset(queryset, request, view)
+            return self.paginate_without_count(queryset, request)
+
+        self.keyset = self.get_keyset_ordering(queryset)
+        self.count = queryset.count() if with_total else None
+        page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request)
+
+        keys = [(field, not descending if reverse else descending) for field, descending in self.keyset]
+        queryset = queryset.order_by(*[f'-{field}' if descending else field for field, descending in keys])
+        if position is not None:
+            queryset = queryset.filter(self.seek(queryset, keys, position))
+        rows = list(queryset[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+
+        # a page reached backwards always has a next one (the page it came from), and vice versa
+        self.next_position = self.position(rows[-1]) if rows and (has_more or reverse) else None
+        self.previous_position = self.position(rows[0]) if rows and position is not None and (
+            has_more or not reverse) else None
+        return rows
+
+    def paginate_without_count(self, queryset, request):
+        """Page-number page read as page_size + 1 rows: next is known without a COUNT(*)."""
+        page_size = self.get_page_size(request)
+        page_number = request.query_params.get(self.page_query_param, 1)
+        try:
+            self.page_number = int(page_number)
+            if self.page_number < 1:
+                raise ValueError
+        except ValueError:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message='Invalid page.'))
+
+        offset = (self.page_number - 1) * page_size
+        rows = list(queryset[offset:offset + page_size + 1])
+        self.count = None
+        self.has_next = len(rows) > page_size
+        return rows[:page_size]
+
+    def get_keyset_ordering(self, queryset):
+        """[(field, descending)] of the queryset's (or self.ordering's) fields, ending with pk."""
+        ordering = self.ordering or [field for field in queryset.query.order_by if isinstance(field, str)]
+        pk_name = queryset.model._meta.pk.name
+        keys = []
+        for field in ordering:
+            name = field.lstrip('-')
+            keys.append((pk_name if name == 'pk' else name, field.startswith('-')))
+        if not any(name == pk_name for name, _ in keys):
+            keys.append((pk_name, keys[0][1] if keys else True))
+        return keys
+
+    def seek(self, queryset, keys, position):
+        """Rows strictly after position in the (key..., pk) order of keys."""
+        after = Q(pk__in=[])
+        equal = Q()
+        for (field, descending), value in zip(keys, position):
+            nullable = self.is_nullable(queryset, field)
+            # NULL sorts above every value: first in descending order, last in ascending order
+            if value is None:
+                if descending:
+                    after |= equal & Q(**{f'{field}__isnull': False})
+                equal &= Q(**{f'{field}__isnull': True})
+                continue
+            beyond = Q(**{f'{field}__lt' if descending else f'{field}__gt': value})
+            if nullable and not descending:
+                beyond |= Q(**{f'{field}__isnull': True})
+            after |= equal & beyond
+            equal &= Q(**{field: value})
+
+        # a plain range on the leading key lets its index bound the scan
+        (field, descending), value = keys[0], position[0]
+        if value is not None and (descending or not self.is_nullable(queryset, field)):
+            after &= Q(**{f'{field}__lte' if descending else f'{field}__gte': value})
+        return after
+
+    def is_nullable(self, queryset, field):
+        if field in queryset.query.annotations:
+            return True
+        try:
+            return queryset.model._meta.get_field(field).null
+        except FieldDoesNotExist:
+            return True
+
+    def position(self, row):
+        values = []
+        for field, _ in self.keyset:
+            try:
+                field = row._meta.get_field(field).attname  # a foreign key seeks on its id
+            except FieldDoesNotExist:
+                pass
+            value = getattr(row, field)
+            # full precision: DjangoJSONEncoder would cut datetimes to milliseconds
+            if isinstance(value, (datetime.date, datetime.time)):
+                value = value.isoformat()
+            elif value is not None and not isinstance(value, (int, float, str, bool)):
+                value = str(value)
+            values.append(value)
+        return values
+
+    def encode_cursor(self, position, reverse):
+        payload = json.dumps({'p': position, 'r': int(reverse)}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def decode_cursor(self, request):
+        """(position, reverse) of ?cursor=; (None, False) for the first page."""
+        raw = request.query_params.get(self.cursor_query_param)
+        if not raw:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(raw.encode()))
+            position, reverse = payload['p'], bool(payload['r'])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound('Invalid cursor')
+        if not isinstance(position, list) or len(position) != len(self.keyset):
+            raise NotFound('Invalid cursor')
+        return position, reverse
+
+    def cursor_link(self, position, reverse):
+        if position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(position, reverse))
+
+    def get_next_link(self):
+        if self.keyset is not None:
+            return self.cursor_link(self.next_position, False)
+        if self.page is None:
+            if not self.has_next:
+                return None
+            return replace_query_param(self.request.build_absolute_uri(), self.page_query_param, self.page_number + 1)
+        return super().get_next_link()
+
+    def get_previous_link(self):
+        if self.keyset is not None:
+            return self.cursor_link(self.previous_position, True)
+        if self.page is None:
+            if self.page_number <= 1:
+                return None
+            url = self.request.build_absolute_uri()
+            if self.page_number == 2:
+                return remove_query_param(url, self.page_query_param)
+            return replace_query_param(url, self.page_query_param, self.page_number - 1)
+        return super().get_previous_link()
+
+    def get_paginated_response(self, data):
+        if self.keyset is None and self.page is not None:
+            return super().get_paginated_response(data)
+        return Response({
+            'count': self.count,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
 
 
-class ProjectsPagination(PageNumberPagination):
+class ProjectsPagination(KeysetPagination):
     page_size = 10  # Har sahifada 10 ta project
     page_size_query_param = 'page_size'  # Klient tomonidan o‘zgaruvchi page_size
     max_page_size = 10  # Maksimal ruxsat etilgan hajm
 
 
 
-class ProjectListCreatePagination(PageNumberPagination):
+class ProjectListCreatePagination(KeysetPagination):
     page_size = 13  # Har sahifada 10 ta project
     page_size_query_param = 'page_size'  # Klient tomonidan o‘zgaruvchi page_size
     max_page_size = 13  # Maksimal ruxsat etilgan hajm
 
 
-class ProjectsFiancierConfirmPagination(PageNumberPagination):
+class ProjectsFiancierConfirmPagination(KeysetPagination):
     page_size = 8  # Har sahifada 10 ta project
     page_size_query_param = 'page_size'  # Klient tomonidan o‘zgaruvchi page_size
     max_page_size = 8  # Maksimal ruxsat etilgan hajm
@@ -34,7 +228,7 @@ class TranslationsPagination(PageNumberPagination):
     max_page_size = 15  # Maksimal ruxsat etilgan hajm
     
     
-class GipConfirmPagination(PageNumberPagination):
+class GipConfirmPagination(KeysetPagination):
     page_size = 10  # Har sahifada 10 ta project
     page_size_query_param = 'page_size'  # Klient tomonidan o‘zgaruvchi page_size
     max_page_size = 10  # Maksimal ruxsat etilgan hajm
@@ -53,7 +247,7 @@ class CompleteWorkOrderPagination(PageNumberPagination):
     max_page_size = 10
     
     
-class NotificationsPagination(PageNumberPagination):
+class NotificationsPagination(KeysetPagination):
     page_size = 10
     page_size_query_param = 'page_size'
     max_page_size =10
@@ -80,7 +274,7 @@ class AdminUserPagination(PageNumberPagination):
 
 
 
-class ProjectLogPagination(PageNumberPagination):
+class ProjectLogPagination(KeysetPagination):
     page_size = 15
     page_size_query_param = 'page_size'
     max_page_size = 15  
@@ -0,0 +1,188 @@
+# partitions.py
+"""
+Monthly range partitions of action_logs on performed_at (set up by migration
+0073). Partitions are named action_logs_pYYYYMM and cover one UTC calendar
+month; action_logs_default catches anything outside them and should stay empty.
+"""
+import datetime
+import gzip
+import json
+import re
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+
+from api.models import ActionLog, NotificationCounter
+
+TABLE = 'action_logs'
+DEFAULT_PARTITION = 'action_logs_default'
+DEFAULT_MOVE_TABLE = 'action_logs_default_move'
+PARTITION_NAME = re.compile(r'^action_logs_p(\d{4})(\d{2})$')
+
+
+def month_start(value):
+    return datetime.datetime(value.year, value.month, 1, tzinfo=datetime.timezone.utc)
+
+
+def add_months(value, months):
+    month = value.month - 1 + months
+    return value.replace(year=value.year + month // 12, month=month % 12 + 1, day=1)
+
+
+def partition_name(month):
+    return f'{TABLE}_p{month:%Y%m}'
+
+
+def create_partition_sql(month):
+    qn = connection.ops.quote_name
+    return (
+        f"CREATE TABLE IF NOT EXISTS {qn(partition_name(month))} PARTITION OF {qn(TABLE)} "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    )
+
+
+def list_partitions():
+    """[(month, name)] of the attached monthly partitions, oldest first."""
+    return _monthly(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(%s)"
+    )
+
+
+def list_detached():
+    """[(month, name)] of monthly tables no longer attached (left by --detach-only), oldest first."""
+    return _monthly(
+        "SELECT c.relname FROM pg_class c WHERE c.relkind = 'r' AND c.relname LIKE %s || '\\_p%%' "
+        "AND c.relnamespace = current_schema()::regnamespace "
+        "AND NOT EXISTS (SELECT 1 FROM pg_inherits i WHERE i.inhrelid = c.oid)"
+    )
+
+
+def _monthly(sql):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [TABLE])
+        names = [row[0] for row in cursor.fetchall()]
+    months = []
+    for name in names:
+        match = PARTITION_NAME.match(name)
+        if match:
+            months.append((datetime.datetime(int(match[1]), int(match[2]), 1, tzinfo=datetime.timezone.utc), name))
+    return sorted(months)
+
+
+def ensure_partitions(months_ahead=3, now=None):
+    """
+    Create the partitions from the current month to months_ahead months ahead. Returns the new names.
+
+    Rows of a new partition's month that landed in action_logs_default are moved
+    into it: PostgreSQL refuses to create a partition whose range the default
+    partition already holds rows for.
+    """
+    current = month_start(now or datetime.datetime.now(datetime.timezone.utc))
+    existing = {name for _, name in list_partitions()}
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if partition_name(month) not in existing:
+            with transaction.atomic():
+                moved = _take_from_default(month)
+                with connection.cursor() as cursor:
+                    cursor.execute(create_partition_sql(month))
+                    if moved:
+                        cursor.execute(f"INSERT INTO {TABLE} SELECT * FROM {DEFAULT_MOVE_TABLE}")
+                        cursor.execute(f"DROP TABLE {DEFAULT_MOVE_TABLE}")
+            created.append(partition_name(month))
+    return created
+
+
+def _take_from_default(month):
+    """Move month's rows out of the default partition into a temp table; returns how many."""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [DEFAULT_PARTITION])
+        if not cursor.fetchone()[0]:
+            return 0
+        cursor.execute(f"CREATE TEMP TABLE {DEFAULT_MOVE_TABLE} (LIKE {TABLE}) ON COMMIT DROP")
+        cursor.execute(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE performed_at >= %s AND performed_at < %s "
+            f"RETURNING *) INSERT INTO {DEFAULT_MOVE_TABLE} SELECT * FROM moved",
+            [month, add_months(month, 1)],
+        )
+        moved = cursor.rowcount
+        if not moved:
+            cursor.execute(f"DROP TABLE {DEFAULT_MOVE_TABLE}")
+        return moved
+
+
+def archive_partition(month, name, path=None):
+    """
+    Archive one monthly partition: dump it to gzip JSONL at path, detach and drop
+    it, all in one transaction, so a failed dump leaves the partition attached.
+    Without a path it is only detached (see archive_detached). Returns the number
+    of archived rows. Counters are left to expire_notifications().
+    """
+    qn = connection.ops.quote_name
+    with transaction.atomic():
+        rows = 0
+        if path is not None:
+            with connection.cursor() as cursor:
+                cursor.execute(f"LOCK TABLE {qn(name)} IN SHARE MODE")  # no mark-read between dump and detach
+            rows = _dump(name, path)
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"ALTER TABLE {qn(TABLE)} DETACH PARTITION {qn(name)}")
+
+        if path is not None:
+            _drop(name)
+    return rows
+
+
+def expiring_notifications(before):
+    """Ids of the users with unread logs older than before: collect them ahead of archiving."""
+    return list(
+        ActionLog.objects.filter(performed_at__lt=before, identified=False, notify_to__isnull=False)
+        .order_by().values_list('notify_to', flat=True).distinct()
+    )
+
+
+def expire_notifications(user_ids):
+    """
+    Recount users from expiring_notifications(): logs that left the notification
+    window (api.models.notification_window_start) or were archived no longer count.
+    Returns how many counters changed.
+    """
+    return NotificationCounter.objects.rebuild(user_ids) if user_ids else 0
+
+
+def archive_detached(name, path):
+    """Dump and drop a partition detached earlier; its logs were recounted when it was detached."""
+    with transaction.atomic():
+        rows = _dump(name, path)
+        _drop(name)
+    return rows
+
+
+def _dump(name, path):
+    qn = connection.ops.quote_name
+    rows = 0
+    with connection.chunked_cursor() as cursor, gzip.open(path, 'wt', encoding='utf-8') as out:
+        cursor.execute(f"SELECT * FROM {qn(name)} ORDER BY action_id")
+        while batch := cursor.fetchmany(2000):
+            columns = [column[0] for column in cursor.description]  # set after the first fetch (server-side cursor)
+            for row in batch:
+                out.write(json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder, ensure_ascii=False) + '\n')
+            rows += len(batch)
+    return rows
+
+
+def _drop(name):
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        # FK checks of rows written earlier in this transaction are deferred and would block the DROP
+        cursor.execute(
+            "SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(%s) AND contype = 'f' AND condeferrable",
+            [name],
+        )
+        foreign_keys = [row[0] for row in cursor.fetchall()]
+        if foreign_keys:
+            cursor.execute(f"SET CONSTRAINTS {', '.join(qn(fk) for fk in foreign_keys)} IMMEDIATE")
+        cursor.execute(f"DROP TABLE {qn(name)}")
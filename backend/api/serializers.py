@@ -1,12 +1,26 @@
 # api/serializers.py
 
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
-from api.models import StaffUser,Project,ProjectFinancePart,Partner,UserTask,Currency,Translation,Department,ProjectGipPart,ChatMessage,ActionLog,WorkOrder,WorkOrderFile,PhaseType,Role,JobPosition,ChatMessageFile
+from api.models import StaffUser,Project,ProjectFinancePart,Partner,UserTask,Currency,Translation,Department,ProjectGipPart,ChatMessage,ActionLog,WorkOrder,WorkOrderFile,PhaseType,Role,JobPosition,ChatMessageFile,prefetch_last_status
 from rest_framework import serializers
 from django.utils.timezone import now
 from datetime import date
 
 
+class LastStatusListSerializer(serializers.ListSerializer):
+    """
+    many=True for hierarchy serializers: resolves last_status for the whole list
+    (and the Meta.last_status_related objects of each row) in one query.
+    """
+    def to_representation(self, data):
+        rows = list(data.all() if hasattr(data, 'all') else data)
+        related = getattr(self.child.Meta, 'last_status_related', ())
+        objects = rows + [getattr(row, attr, None) for row in rows for attr in related]
+        # rows already resolved by an outer prefetch (e.g. a whole project tree) are not read again
+        prefetch_last_status([obj for obj in objects if obj is not None and not hasattr(obj, '_last_status_cache')])
+        return super().to_representation(rows)
+
+
 class StaffUserTokenSerializer(TokenObtainPairSerializer):
     @classmethod
     def get_token(cls, user: StaffUser):
@@ -66,25 +80,49 @@ class ProjectSerializer(serializers.ModelSerializer):
         return None
 
 
+    # Project.objects.with_list_stats() annotates the values below; single objects
+    # (create / update responses) fall back to querying.
     def get_last_status(self, obj):
+        if hasattr(obj, 'last_status_action'):
+            if obj.last_status_action is None:
+                return None
+            return {
+                "latest_action": obj.last_status_action,
+                "latest_phase_type": obj.last_status_phase_name,
+                "last_updated": obj.last_status_updated,
+                "updated_by": obj.last_status_updated_by,
+                'comment': obj.last_status_comment,
+            }
         return getattr(obj, 'last_status', None)
     
     def get_finance_parts_count(self, obj):
+        if hasattr(obj, 'finance_parts_count'):
+            return obj.finance_parts_count
         return obj.finance_parts.count() if hasattr(obj, 'finance_parts') and obj.finance_parts is not None else 0
     
     def get_technical_parts_count(self, obj):
+        if hasattr(obj, 'technical_parts_count'):
+            return obj.technical_parts_count
         return ProjectGipPart.objects.filter(fs_part_code__project_code=obj).count()
     
     def get_all_sent_to_tech_dir(self, obj):
+        if hasattr(obj, 'all_sent_to_tech_dir'):
+            return obj.all_sent_to_tech_dir
         return obj.finance_parts.filter(send_to_tech_dir=False).count() == 0
     
     def get_all_tech_dir_confirmed(self, obj):
+        if hasattr(obj, 'all_tech_dir_confirmed'):
+            return obj.all_tech_dir_confirmed
         return all(part.tech_dir_confirm for part in obj.finance_parts.all())        
     
     def get_work_order_count(self, obj):
+        if hasattr(obj, 'work_order_count'):
+            return obj.work_order_count
         return WorkOrder.objects.filter(tch_part_code__fs_part_code__project_code=obj).count()
 
     def get_work_order_confirmed_count(self, obj):
+        if hasattr(obj, 'work_order_confirmed_count'):
+            return obj.work_order_confirmed_count
         return WorkOrder.objects.filter(
             tch_part_code__fs_part_code__project_code=obj,
             finished=True
@@ -304,6 +342,7 @@ class ProjectGipPartSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = ProjectGipPart
+        list_serializer_class = LastStatusListSerializer
         fields = [
             'tch_part_code',
             'fs_part_code',
@@ -328,17 +367,15 @@ class ProjectGipPartSerializer(serializers.ModelSerializer):
         return obj.work_orders.count()
 
     def get_last_status(self, obj):
-        from .models import ObjectLastStatus
-        try:
-            status = ObjectLastStatus.objects.get(full_id=obj.full_id)
-            return {
-                "latest_action": status.latest_action,
-                "latest_phase_type": status.latest_phase_type.name if status.latest_phase_type else None,
-                "last_updated": status.last_updated,
-                "updated_by": status.updated_by.fio if status.updated_by else None,
-            }
-        except ObjectLastStatus.DoesNotExist:
+        status = obj.last_status_object
+        if status is None:
             return None
+        return {
+            "latest_action": status.latest_action,
+            "latest_phase_type": status.latest_phase_type.name if status.latest_phase_type else None,
+            "last_updated": status.last_updated,
+            "updated_by": status.updated_by.fio if status.updated_by else None,
+        }
 
 
 
@@ -428,6 +465,8 @@ class CompleteWorkOrderSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = WorkOrder
+        list_serializer_class = LastStatusListSerializer
+        last_status_related = ['tch_part_code']
         fields = [
             'wo_id',
             'wo_no',
@@ -453,19 +492,17 @@ class CompleteWorkOrderSerializer(serializers.ModelSerializer):
         ]
 
     def get_last_status(self, obj):
-        from .models import ObjectLastStatus
-        try:
-            status = ObjectLastStatus.objects.get(full_id=obj.full_id)
-            return {
-                "latest_action": status.latest_action,
-                "latest_phase_type": status.latest_phase_type.name if status.latest_phase_type else None,
-                "is_refused": status.latest_phase_type.is_refusal if status.latest_phase_type else False,
-                "updated_by": status.updated_by.fio if status.updated_by else None,
-                "last_updated": status.last_updated,
-                'comment':status.comment,
-            }
-        except ObjectLastStatus.DoesNotExist:
+        status = obj.last_status_object
+        if status is None:
             return None
+        return {
+            "latest_action": status.latest_action,
+            "latest_phase_type": status.latest_phase_type.name if status.latest_phase_type else None,
+            "is_refused": status.latest_phase_type.is_refusal if status.latest_phase_type else False,
+            "updated_by": status.updated_by.fio if status.updated_by else None,
+            "last_updated": status.last_updated,
+            'comment':status.comment,
+        }
 
 
 class HoldWorkOrderStaffSerializer(serializers.ModelSerializer):
@@ -483,7 +520,39 @@ class PhaseTypeSerializer(serializers.ModelSerializer):
 
 
 
+class ActionLogNotificationListSerializer(serializers.ListSerializer):
+    """many=True notifications: resolves object_data names with one query per path_type on the page."""
+    def to_representation(self, data):
+        rows = list(data.all() if hasattr(data, 'all') else data)
+        targets = {}
+        for row in rows:
+            field = ActionLog.TARGET_FIELDS.get(row.path_type)
+            pk = getattr(row, f'{field}_id') if field else None
+            if pk is not None:
+                targets.setdefault(row.path_type, set()).add(pk)
+
+        names = {}
+        for path_type, pks in targets.items():
+            model = ActionLog._meta.get_field(ActionLog.TARGET_FIELDS[path_type]).related_model
+            name_field = ActionLogNotificationSerializer.OBJECT_NAME_FIELDS[path_type]
+            names[path_type] = dict(model.objects.filter(pk__in=pks).values_list('pk', name_field))
+
+        for row in rows:
+            field = ActionLog.TARGET_FIELDS.get(row.path_type)
+            pk = getattr(row, f'{field}_id') if field else None
+            found = pk is not None and pk in names.get(row.path_type, {})
+            row._object_data_cache = {"name": names[row.path_type][pk]} if found else None
+        return super().to_representation(rows)
+
+
 class ActionLogNotificationSerializer(serializers.ModelSerializer):
+    OBJECT_NAME_FIELDS = {
+        "PROJECT": "project_name",
+        "FIN_PART": "fs_part_name",
+        "TECH_PART": "tch_part_name",
+        "WORK_ORDER": "wo_name",
+    }
+
     performed_by_fio = serializers.CharField(source='performed_by.fio', read_only=True)
     object_data = serializers.SerializerMethodField()
     phase_type = PhaseTypeSerializer(read_only=True)  # nested serializer here
@@ -499,32 +568,18 @@ class ActionLogNotificationSerializer(serializers.ModelSerializer):
             'performed_at',
             'performed_by_fio',
             'object_data',
+            'repeat_count',
+            'last_repeated_at',
         ]
+        list_serializer_class = ActionLogNotificationListSerializer
 
     def get_object_data(self, obj):
-        try:
-            parts = obj.full_id.strip('/').split('/')
-            if obj.path_type == "PROJECT":
-                project_code = int(parts[0])
-                project = Project.objects.get(project_code=project_code)
-                return {"name": project.project_name}
-
-            elif obj.path_type == "FIN_PART":
-                project_code, fs_part_code = map(int, parts[:2])
-                part = ProjectFinancePart.objects.get(fs_part_code=fs_part_code)
-                return {"name": part.fs_part_name}
-
-            elif obj.path_type == "TECH_PART":
-                project_code, fs_part_code, tch_part_code = map(int, parts[:3])
-                tech = ProjectGipPart.objects.get(tch_part_code=tch_part_code)
-                return {"name": tech.tch_part_name}
-
-            elif obj.path_type == "WORK_ORDER":
-                project_code, fs_part_code, tch_part_code, wo_id = map(int, parts[:4])
-                wo = WorkOrder.objects.get(wo_id=wo_id)
-                return {"name": wo.wo_name}
-        except Exception as e:
+        if hasattr(obj, '_object_data_cache'):
+            return obj._object_data_cache
+        target = obj.target
+        if target is None:
             return None
+        return {"name": getattr(target, self.OBJECT_NAME_FIELDS[obj.path_type])}
 
 
 
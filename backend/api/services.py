@@ -0,0 +1,200 @@
+# services.py
+import contextlib
+import contextvars
+import datetime
+from collections import Counter, defaultdict
+
+from django.db import connection, transaction
+from django.db import models
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from api.events import publish_many
+from api.inbox import invalidate_inbox
+from api.models import ActionLog, NotificationCounter, ObjectLastStatus, ProjectMembership, ProjectRollup
+
+# Repeats only fold into rows inside this window: well within the archive retention
+# (ACTION_LOG_RETENTION_MONTHS) and on the newest partitions only.
+COALESCE_WINDOW = datetime.timedelta(days=7)
+
+
+class DeferredWrites:
+    """Side effects collected by deferred_writes(), applied set-based by flush()."""
+
+    def __init__(self):
+        self.logs = {False: [], True: []}  # coalesce -> ActionLogs
+        self.rollups = defaultdict(Counter)  # project_code -> {counter: delta}
+        self.rebuilds = set()  # project_codes whose rollup is recounted
+        self.memberships = defaultdict(set)  # project_code -> relations to sync
+
+    def flush(self):
+        for coalesce, logs in self.logs.items():
+            _create_action_logs(logs, coalesce)
+        ProjectRollup.objects.bump_many(self.rollups)
+        if self.rebuilds:
+            ProjectRollup.objects.rebuild(self.rebuilds)  # after the deltas, so recounts win
+        for project_code, relations in self.memberships.items():
+            ProjectMembership.objects.sync(project_code, sorted(relations))
+
+
+_deferred = contextvars.ContextVar('deferred_writes', default=None)
+
+
+@contextlib.contextmanager
+def deferred_writes():
+    """
+    Inside the block, ActionLog inserts (create_action_logs / notify_many) and the
+    ProjectRollup / ProjectMembership upkeep of hierarchy saves are collected and
+    applied once when it exits, so a view writing N rows issues those statements
+    once instead of N times and takes the project rollup lock just before commit.
+    Use it inside transaction.atomic(); a nested block joins the outer one.
+    """
+    if _deferred.get() is not None:
+        yield
+        return
+    buffer = DeferredWrites()
+    token = _deferred.set(buffer)
+    try:
+        yield
+    finally:
+        _deferred.reset(token)
+    # Skipped on error and when the block caught a database error itself (e.g. an
+    # IntegrityError turned into a 400): the transaction rolls back either way.
+    if not connection.needs_rollback:
+        buffer.flush()
+
+
+def bump_rollup(project_code, **deltas):
+    """ProjectRollup.objects.bump, deferred inside deferred_writes()."""
+    buffer = _deferred.get()
+    if buffer is None:
+        ProjectRollup.objects.bump(project_code, **deltas)
+    elif project_code:
+        buffer.rollups[project_code].update(deltas)
+
+
+def rebuild_rollups(project_codes):
+    """ProjectRollup.objects.rebuild, deferred inside deferred_writes()."""
+    buffer = _deferred.get()
+    if buffer is None:
+        ProjectRollup.objects.rebuild(project_codes)
+    else:
+        buffer.rebuilds.update(code for code in project_codes if code)
+
+
+def sync_memberships(project_code, relations):
+    """ProjectMembership.objects.sync, deferred inside deferred_writes()."""
+    buffer = _deferred.get()
+    if buffer is None:
+        ProjectMembership.objects.sync(project_code, relations)
+    elif project_code and relations:
+        buffer.memberships[project_code].update(relations)
+
+
+def coalesce_action_logs(logs):
+    """
+    Fold logs into the recipient's unread notification with the same (notify_to,
+    full_id, phase_type): that row's repeat_count and last_repeated_at are bumped
+    (and it takes the new comment / performer) instead of inserting a new row.
+    Only rows performed within COALESCE_WINDOW are candidates.
+    Returns the logs still to insert; folded logs get the pk of the row they joined.
+    """
+    candidates = [log for log in logs if log.unread_by and log.phase_type_id]
+    if not candidates:
+        return logs
+
+    rows = (
+        ActionLog.objects.live()
+        .filter(
+            identified=False,
+            performed_at__gte=timezone.now() - COALESCE_WINDOW,
+            notify_to__in={log.notify_to_id for log in candidates},
+            full_id__in={log.full_id for log in candidates},
+            phase_type__in={log.phase_type_id for log in candidates},
+        )
+        .order_by('performed_at')
+        .values_list('pk', 'notify_to', 'full_id', 'phase_type')
+    )
+    existing = {(notify_to, full_id, phase_type): pk for pk, notify_to, full_id, phase_type in rows}  # newest wins
+
+    remaining = []
+    folded = {}  # pk -> the logs folded into it, in order
+    for log in logs:
+        pk = existing.get((log.notify_to_id, log.full_id, log.phase_type_id)) if log.unread_by else None
+        if pk is None:
+            remaining.append(log)
+        else:
+            log.pk = pk
+            folded.setdefault(pk, []).append(log)
+
+    if folded:
+        ActionLog.objects.filter(pk__in=folded).update(
+            repeat_count=F('repeat_count') + Case(
+                *[When(pk=pk, then=Value(len(group))) for pk, group in folded.items()],
+                output_field=models.PositiveIntegerField(),
+            ),
+            last_repeated_at=timezone.now(),
+            comment=Case(
+                *[When(pk=pk, then=Value(group[-1].comment)) for pk, group in folded.items()],
+                output_field=models.TextField(),
+            ),
+            performed_by=Case(
+                *[When(pk=pk, then=Value(group[-1].performed_by_id)) for pk, group in folded.items()],
+                output_field=models.IntegerField(),
+            ),
+        )
+    return remaining
+
+
+def create_action_logs(logs, coalesce=False):
+    """
+    Insert ActionLog rows with one bulk_create and apply what the per-row signals
+    would (bulk_create sends none): one ObjectLastStatus upsert, the unread
+    counters, the cached inboxes and the stream events, all in the caller's transaction.
+    With coalesce=True repeated unread notifications are folded (coalesce_action_logs).
+    Inside deferred_writes() the logs are only queued (no pk yet) and inserted on exit.
+    """
+    logs = [log for log in logs if log is not None]
+    buffer = _deferred.get()
+    if buffer is not None:
+        buffer.logs[coalesce].extend(logs)
+        return logs
+    return _create_action_logs(logs, coalesce)
+
+
+def _create_action_logs(logs, coalesce):
+    if not logs:
+        return []
+
+    with transaction.atomic():
+        for log in logs:
+            log.fill_hierarchy_links()
+        new_logs = coalesce_action_logs(logs) if coalesce else logs
+        ActionLog.objects.bulk_create(new_logs)
+        ObjectLastStatus.objects.record(logs)
+
+        invalidate_inbox(log.notify_to_id for log in logs)
+        unread = Counter(log.unread_by for log in new_logs if log.unread_by)
+        NotificationCounter.objects.bump_many(unread)
+        notified = [log for log in logs if log.unread_by]
+        counts = NotificationCounter.objects.unread_many(list({log.unread_by for log in notified}))
+        publish_many([
+            (log.unread_by, 'notification', {'action_id': log.pk, 'unread': counts[log.unread_by]})
+            for log in notified
+        ])
+    return logs
+
+
+def notify_many(target, phase_type, performed_by, recipients, comment=None, coalesce=False):
+    """Log one action on target (project / part / work order) and notify each recipient."""
+    return create_action_logs([
+        ActionLog(
+            full_id=target.full_id,
+            path_type=target.path_type,
+            phase_type=phase_type,
+            performed_by=performed_by,
+            notify_to_id=getattr(recipient, 'pk', recipient),
+            comment=comment,
+        )
+        for recipient in recipients
+    ], coalesce=coalesce)
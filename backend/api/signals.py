@@ -1,29 +1,207 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, pre_save, post_delete, pre_delete
+from django.db.models import Count, Q
 from django.dispatch import receiver
-from .models import ActionLog, ObjectLastStatus
+from .events import publish
+from .inbox import invalidate_inbox
+from .services import bump_rollup, rebuild_rollups, sync_memberships
+from .models import ActionLog, ChatMessage, NotificationCounter, ObjectLastStatus, Project, ProjectFinancePart, ProjectGipPart, WorkOrder, WorkOrderFile, ProjectRollup
 from simple_history.signals import pre_create_historical_record
 
 
 
 @receiver(post_save, sender=ActionLog)
 def update_object_last_status(sender, instance, created, **kwargs):
-    if not instance.full_id or not instance.path_type:
+    # Only a new log moves the status (mark-read and other updates must not rewrite it)
+    if not created:
         return
+    # One INSERT ... ON CONFLICT (full_id) DO UPDATE, see ObjectLastStatusQuerySet.record
+    ObjectLastStatus.objects.record([instance])
 
-    latest_action = instance.phase_type.key if instance.phase_type else 'UNKNOWN'
 
-    ObjectLastStatus.objects.update_or_create(
-        full_id=instance.full_id,
-        path_type=instance.path_type,
-        defaults={
-            'latest_action': latest_action,
-            'latest_phase_type': instance.phase_type,
-            'updated_by': instance.performed_by,
-            'comment': instance.comment,  # ✅ moved here
-        }
+
+# ---- NotificationCounter maintenance ----
+# A log counts while unread_by is set; every save moves the counter by the difference.
+# Logs are deleted by their target's cascade, counted below at the target's pre_delete. ActionLog
+# has no delete receivers, so that cascade stays a single DELETE (other deletes: rebuild_notification_counters).
+@receiver(pre_save, sender=ActionLog)
+def remember_notification_state(sender, instance, raw=False, **kwargs):
+    old = None
+    if instance.pk and not raw:
+        fields = ['notify_to', 'identified', 'path_type', 'performed_at', *ActionLog.TARGET_FIELDS.values()]
+        old = ActionLog.objects.only(*fields).filter(pk=instance.pk).first()
+    instance._unread_by_old = old.unread_by if old else None
+
+
+@receiver(post_save, sender=ActionLog)
+def apply_notification_save(sender, instance, created, raw=False, **kwargs):
+    old = instance.__dict__.pop('_unread_by_old', None)
+    new = None if raw else instance.unread_by
+    if not raw:
+        invalidate_inbox([instance.notify_to_id, old])
+    if old != new:
+        NotificationCounter.objects.bump(old, -1)
+        NotificationCounter.objects.bump(new, 1)
+    if created and new:
+        publish(new, 'notification', action_id=instance.pk, unread=NotificationCounter.objects.unread(new))
+
+
+@receiver(post_save, sender=ChatMessage)
+def publish_chat_message(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        publish(instance.receiver_id, 'chat_message', message_id=instance.pk, task_id=instance.task_id,
+                sender_id=instance.sender_id)
+
+
+def remember_deleted_notifications(sender, instance, **kwargs):
+    # The target's own logs go with it (CASCADE); its descendants count theirs in their own pre_delete.
+    field = ActionLog.TARGET_FIELDS[instance.path_type]
+    logs = ActionLog.objects.recent().filter(path_type=instance.path_type, notify_to__isnull=False, **{field: instance})
+    instance._deleted_unread = list(
+        logs.order_by().values('notify_to')
+        .annotate(n=Count('pk', filter=Q(identified=False)))
+        .values_list('notify_to', 'n')
     )
 
 
+def apply_deleted_notifications(sender, instance, **kwargs):
+    deleted = instance.__dict__.pop('_deleted_unread', [])
+    for user_id, count in deleted:
+        NotificationCounter.objects.bump(user_id, -count)
+    invalidate_inbox(user_id for user_id, _ in deleted)
+
+
+for _model in (Project, ProjectFinancePart, ProjectGipPart, WorkOrder):
+    pre_delete.connect(remember_deleted_notifications, sender=_model)
+    post_delete.connect(apply_deleted_notifications, sender=_model)
+
+
+# ---- ProjectRollup / ProjectMembership maintenance ----
+# For every tracked model: (parent fk attname, lookup from the model to its project, rollup counter,
+# {counter: bool field}, (member user fk attname, membership relation) or None)
+HIERARCHY_SOURCES = {
+    ProjectFinancePart: ('project_code_id', 'project_code', 'finance_parts_count', {
+        'parts_sent_count': 'send_to_tech_dir',
+        'parts_confirmed_count': 'tech_dir_confirm',
+    }, None),
+    ProjectGipPart: ('fs_part_code_id', 'fs_part_code__project_code', 'tech_parts_count', {},
+                     ('tch_part_nach_id', 'TECH_PART_NACH')),
+    WorkOrder: ('tch_part_code_id', 'tch_part_code__fs_part_code__project_code', 'work_orders_count', {
+        'work_orders_finished_count': 'finished',
+    }, ('wo_staff_id', 'WORK_ORDER_STAFF')),
+}
+
+# Membership relations that move with an object when it is re-parented to another project
+MOVED_RELATIONS = {
+    ProjectFinancePart: ['TECH_PART_NACH', 'WORK_ORDER_STAFF'],
+    ProjectGipPart: ['TECH_PART_NACH', 'WORK_ORDER_STAFF'],
+    WorkOrder: ['WORK_ORDER_STAFF'],
+}
+
+
+def _hierarchy_project(sender, instance):
+    if sender is ProjectFinancePart:
+        return instance.project_code_id
+    if sender is ProjectGipPart:
+        parents = ProjectFinancePart.objects.filter(pk=instance.fs_part_code_id)
+        return parents.values_list('project_code', flat=True).first()
+    parents = ProjectGipPart.objects.filter(pk=instance.tch_part_code_id)
+    return parents.values_list('fs_part_code__project_code', flat=True).first()
+
+
+def _rollup_counters(sender, instance):
+    counter, flags = HIERARCHY_SOURCES[sender][2:4]
+    counters = {counter: 1}
+    counters.update({name: int(bool(getattr(instance, field))) for name, field in flags.items()})
+    return counters
+
+
+@receiver(post_save, sender=Project)
+def sync_project_rollup_and_members(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        ProjectRollup.objects.get_or_create(project=instance)
+    sync_memberships(instance.pk, ['CREATOR', 'GIP', 'FINANCIER'])
+
+
+def remember_hierarchy_state(sender, instance, raw=False, **kwargs):
+    if raw or instance._state.adding:
+        return
+    parent_attr, project_lookup, counter, flags, member = HIERARCHY_SOURCES[sender]
+    member_attr = member[0] if member else None
+    fields = [parent_attr, project_lookup, *flags.values()] + ([member_attr] if member else [])
+    old = sender.objects.filter(pk=instance.pk).values(*fields).first()
+    if old:
+        instance._hierarchy_old = {
+            'parent': old[parent_attr],
+            'project': old[project_lookup],
+            'member': old[member_attr] if member else None,
+            'counters': {counter: 1, **{name: int(bool(old[field])) for name, field in flags.items()}},
+        }
+
+
+def apply_hierarchy_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    old = instance.__dict__.pop('_hierarchy_old', None)
+    parent_attr, member = HIERARCHY_SOURCES[sender][0], HIERARCHY_SOURCES[sender][4]
+    member_id = getattr(instance, member[0]) if member else None
+    counters = _rollup_counters(sender, instance)
+
+    if old is None:
+        project = _hierarchy_project(sender, instance)
+        bump_rollup(project, **counters)
+        if member_id:
+            sync_memberships(project, [member[1]])
+        return
+
+    moved = old['parent'] != getattr(instance, parent_attr)
+    project = _hierarchy_project(sender, instance) if moved else old['project']
+    if project == old['project']:
+        bump_rollup(project, **{k: v - old['counters'][k] for k, v in counters.items()})
+        if member and old['member'] != member_id:
+            sync_memberships(project, [member[1]])
+    else:
+        # descendants moved along with the object, so recount both projects
+        rebuild_rollups([old['project'], project])
+        sync_memberships(old['project'], MOVED_RELATIONS[sender])
+        sync_memberships(project, MOVED_RELATIONS[sender])
+
+
+def remember_hierarchy_delete(sender, instance, **kwargs):
+    # Parents may already be gone by post_delete, so resolve the project now.
+    instance._hierarchy_old = (_hierarchy_project(sender, instance), _rollup_counters(sender, instance))
+
+
+def apply_hierarchy_delete(sender, instance, **kwargs):
+    old = instance.__dict__.pop('_hierarchy_old', None)
+    if old:
+        project, counters = old
+        bump_rollup(project, **{k: -v for k, v in counters.items()})
+        member = HIERARCHY_SOURCES[sender][4]
+        if member and getattr(instance, member[0]):
+            sync_memberships(project, [member[1]])
+
+
+for _model in HIERARCHY_SOURCES:
+    pre_save.connect(remember_hierarchy_state, sender=_model)
+    post_save.connect(apply_hierarchy_save, sender=_model)
+    pre_delete.connect(remember_hierarchy_delete, sender=_model)
+    post_delete.connect(apply_hierarchy_delete, sender=_model)
+
+
+@receiver(post_save, sender=WorkOrderFile)
+@receiver(post_delete, sender=WorkOrderFile)
+def touch_project_on_file_change(sender, instance, raw=False, **kwargs):
+    # Files are part of the project tree payload; touching the rollup changes its ETag.
+    if raw:
+        return
+    project = WorkOrder.objects.filter(pk=instance.work_order_id).values_list(
+        'tch_part_code__fs_part_code__project_code', flat=True
+    ).first()
+    if project:
+        bump_rollup(project)
+
 
 
 
@@ -1,5 +1,98 @@
+from django.db.models import Count, Exists, OuterRef, Prefetch, Q, prefetch_related_objects
 from rest_framework import serializers
-from api.models import Project, ProjectFinancePart, ProjectGipPart, WorkOrder, WorkOrderFile,Message
+from api.models import Project, ProjectFinancePart, ProjectGipPart, WorkOrder, WorkOrderFile,Message, prefetch_last_status
+from api.serializers import LastStatusListSerializer
+
+# Capabilities that see every part and work order of a project they can open
+FULL_TREE_CAPABILITIES = {'IS_TECH_DIR', 'IS_FIN_DIR', 'IS_FINANCIER', 'IS_GIP', 'IS_GEN_DIR'}
+
+
+def visible_tree_querysets(project, user, caps):
+    """
+    (finance_parts, gip_parts, work_orders) that user may see in project's tree,
+    each level filtered on its own (nest them to get the visible tree), or None
+    when the whole tree is visible.
+    """
+    if caps & FULL_TREE_CAPABILITIES:
+        return None
+    nach = 'IS_NACH_OTDEL' in caps
+    staff = 'IS_STAFF' in caps
+    own_work_orders = WorkOrder.objects.filter(tch_part_code=OuterRef('pk'), wo_staff=user)
+
+    # NACH_OTDEL: every work order of their own tech parts; STAFF: their own work orders
+    visible = Q(pk__in=[])
+    if nach:
+        visible |= Q(tch_part_code__tch_part_nach=user)
+    if staff:
+        visible |= Q(wo_staff=user)
+    work_orders = WorkOrder.objects.filter(visible)
+
+    if nach:
+        gip_parts = ProjectGipPart.objects.filter(tch_part_nach=user)
+    elif staff:
+        gip_parts = ProjectGipPart.objects.filter(Exists(own_work_orders))
+    else:
+        gip_parts = ProjectGipPart.objects.none()
+
+    finance_parts = ProjectFinancePart.objects.all()
+    if project.create_user_id != user.pk:
+        parts_of = ProjectGipPart.objects.filter(fs_part_code=OuterRef('pk'))
+        if nach:
+            finance_parts = finance_parts.filter(Exists(parts_of.filter(tch_part_nach=user)))
+        elif staff:
+            finance_parts = finance_parts.filter(Exists(parts_of.filter(Exists(own_work_orders))))
+        else:
+            finance_parts = finance_parts.none()
+
+    return finance_parts, gip_parts, work_orders
+
+
+def project_tree_prefetch(project, user, caps):
+    """
+    Prefetch of the parts / work orders of project that user may see, into
+    visible_finance_parts -> visible_gip_parts -> visible_work_orders (+ files).
+    """
+    finance_parts, gip_parts, work_orders = visible_tree_querysets(project, user, caps) or (
+        ProjectFinancePart.objects.all(), ProjectGipPart.objects.all(), WorkOrder.objects.all()
+    )
+    work_orders = work_orders.select_related('wo_staff').prefetch_related('files').order_by('pk')
+    gip_parts = gip_parts.select_related('create_user_id', 'tch_part_nach').order_by('pk').prefetch_related(
+        Prefetch('work_orders', queryset=work_orders, to_attr='visible_work_orders')
+    )
+    finance_parts = finance_parts.select_related('create_user_id').order_by('pk').prefetch_related(
+        Prefetch('gip_parts', queryset=gip_parts, to_attr='visible_gip_parts')
+    )
+    return Prefetch('finance_parts', queryset=finance_parts, to_attr='visible_finance_parts')
+
+
+def prepare_project_tree(project, context):
+    """
+    Load everything the tree serializers read, with a fixed number of queries:
+    the visible parts / work orders, every node's last_status and the message
+    counts (context['message_counts']). Capabilities are read once per context.
+    """
+    user = context['request'].user
+    if 'capabilities' not in context:
+        context['capabilities'] = set(user.get_capability_names())
+    prefetch_related_objects([project], project_tree_prefetch(project, user, context['capabilities']))
+
+    nodes = [project]
+    for finance_part in project.visible_finance_parts:
+        nodes.append(finance_part)
+        for gip_part in finance_part.visible_gip_parts:
+            nodes.append(gip_part)
+            nodes.extend(gip_part.visible_work_orders)
+    prefetch_last_status(nodes)
+
+    counts = Message.objects.filter(project=project).order_by().values_list('full_id', 'path_type').annotate(n=Count('pk'))
+    context['message_counts'] = {(full_id, path_type): n for full_id, path_type, n in counts}
+
+
+class TreeMessageCountMixin:
+    """message_count from the counts prepare_project_tree() put in the context."""
+
+    def get_message_count(self, obj):
+        return self.context['message_counts'].get((obj.full_id, obj.path_type), 0)
 
 
 class WorkOrderFileSerializer(serializers.ModelSerializer):
@@ -16,13 +109,14 @@ class WorkOrderFileSerializer(serializers.ModelSerializer):
         return obj.file.url
     
     
-class WorkOrderSerializer(serializers.ModelSerializer):
+class WorkOrderSerializer(TreeMessageCountMixin, serializers.ModelSerializer):
     files = WorkOrderFileSerializer(many=True, read_only=True)
     wo_staff_fio = serializers.CharField(source='wo_staff.fio', read_only=True)
     message_count = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = WorkOrder
+        list_serializer_class = LastStatusListSerializer
         fields = [
             'wo_id', 'wo_no', 'wo_name', 'wo_start_date', 'wo_finish_date',
             'wo_staff', 'staff_confirm', 'full_id', 'files', 'last_status',
@@ -31,12 +125,9 @@ class WorkOrderSerializer(serializers.ModelSerializer):
 
     def get_last_status(self, obj):
         return getattr(obj, 'last_status', None)
-    
-    def get_message_count(self, obj):
-        return Message.objects.filter(full_id=obj.full_id, path_type=obj.path_type).count()
 
 
-class TechnicalPartSerializer(serializers.ModelSerializer):
+class TechnicalPartSerializer(TreeMessageCountMixin, serializers.ModelSerializer):
     work_orders = serializers.SerializerMethodField()
     full_id = serializers.CharField(read_only=True)
     path_type = serializers.CharField(read_only=True)
@@ -47,6 +138,7 @@ class TechnicalPartSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = ProjectGipPart
+        list_serializer_class = LastStatusListSerializer
         fields = [
              'tch_part_code', 'tch_part_no', 'tch_part_name',
             'tch_part_nach', 'tch_start_date', 'tch_finish_date',
@@ -64,26 +156,12 @@ class TechnicalPartSerializer(serializers.ModelSerializer):
     def get_last_status(self, obj):
         return getattr(obj, 'last_status', None)
 
-    def get_message_count(self, obj):
-        return Message.objects.filter(full_id=obj.full_id, path_type=obj.path_type).count()
-
     def get_work_orders(self, obj):
-        user = self.context['request'].user
-        caps = set(user.get_capability_names())
+        # visibility is applied by project_tree_prefetch()
+        return WorkOrderSerializer(obj.visible_work_orders, many=True, context=self.context).data
 
-        if caps & {'IS_TECH_DIR', 'IS_FIN_DIR', 'IS_FINANCIER', 'IS_GIP','IS_GEN_DIR'}:
-            return WorkOrderSerializer(obj.work_orders.all(), many=True, context=self.context).data
 
-        if 'IS_NACH_OTDEL' in caps and obj.tch_part_nach == user:
-            return WorkOrderSerializer(obj.work_orders.all(), many=True, context=self.context).data
-
-        if 'IS_STAFF' in caps:
-            return WorkOrderSerializer(obj.work_orders.filter(wo_staff=user), many=True, context=self.context).data
-
-        return []
-
-
-class FinancePartSerializer(serializers.ModelSerializer):
+class FinancePartSerializer(TreeMessageCountMixin, serializers.ModelSerializer):
     gip_parts = serializers.SerializerMethodField()
     full_id = serializers.CharField(read_only=True)
     last_status = serializers.SerializerMethodField()
@@ -93,6 +171,7 @@ class FinancePartSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = ProjectFinancePart
+        list_serializer_class = LastStatusListSerializer
         fields = [
             'fs_part_code', 'fs_part_no', 'fs_part_name',
             'fs_part_price', 'fs_start_date', 'fs_finish_date',
@@ -104,32 +183,15 @@ class FinancePartSerializer(serializers.ModelSerializer):
     def get_fs_create_user(self, obj):
         return getattr(obj.create_user_id, 'fio', None) if obj.create_user_id else None
 
-    def get_message_count(self, obj):
-        return Message.objects.filter(full_id=obj.full_id, path_type=obj.path_type).count()
-
     def get_last_status(self, obj):
         return getattr(obj, 'last_status', None)
 
     def get_gip_parts(self, obj):
-        user = self.context['request'].user
-        caps = set(user.get_capability_names())
-        all_parts = obj.gip_parts.all()
+        # visibility is applied by project_tree_prefetch()
+        return TechnicalPartSerializer(obj.visible_gip_parts, many=True, context=self.context).data
 
-        if caps & {'IS_TECH_DIR', 'IS_FIN_DIR', 'IS_FINANCIER', 'IS_GIP','IS_GEN_DIR'}:
-            return TechnicalPartSerializer(all_parts, many=True, context=self.context).data
 
-        if 'IS_NACH_OTDEL' in caps:
-            filtered = all_parts.filter(tch_part_nach=user)
-            return TechnicalPartSerializer(filtered, many=True, context=self.context).data
-
-        if 'IS_STAFF' in caps:
-            filtered = all_parts.filter(work_orders__wo_staff=user).distinct()
-            return TechnicalPartSerializer(filtered, many=True, context=self.context).data
-
-        return []
-
-
-class SpecialProjectSerializer(serializers.ModelSerializer):
+class SpecialProjectSerializer(TreeMessageCountMixin, serializers.ModelSerializer):
     finance_parts = serializers.SerializerMethodField()
     full_id = serializers.CharField(read_only=True)
     last_status = serializers.SerializerMethodField()
@@ -147,12 +209,14 @@ class SpecialProjectSerializer(serializers.ModelSerializer):
             'full_id', 'finance_parts', 'last_status','path_type','p_create_user_fio',
             'p_financier_fio','p_gip_fio'
         ]
+    def to_representation(self, instance):
+        # the whole visible tree is loaded up front, so its size does not change the query count
+        prepare_project_tree(instance, self.context)
+        return super().to_representation(instance)
+
     def get_last_status(self, obj):
         return getattr(obj, 'last_status', None)
 
-    def get_message_count(self, obj):
-        return Message.objects.filter(full_id=obj.full_id, path_type=obj.path_type).count()
-
     def get_p_create_user_fio(self, obj):
         return obj.create_user.fio if obj.create_user and obj.create_user.fio else "—"
         
@@ -163,22 +227,8 @@ class SpecialProjectSerializer(serializers.ModelSerializer):
         return obj.financier.fio if obj.financier and obj.financier.fio else "—"
         
     def get_finance_parts(self, obj):
-        user = self.context['request'].user
-        caps = set(user.get_capability_names())
-        all_parts = obj.finance_parts.all()
-
-        if caps & {'IS_TECH_DIR', 'IS_FIN_DIR', 'IS_FINANCIER', 'IS_GIP','IS_GEN_DIR'} or obj.create_user == user:
-            return FinancePartSerializer(all_parts, many=True, context=self.context).data
-
-        if 'IS_NACH_OTDEL' in caps:
-            filtered = [part for part in all_parts if part.gip_parts.filter(tch_part_nach=user).exists()]
-            return FinancePartSerializer(filtered, many=True, context=self.context).data
-
-        if 'IS_STAFF' in caps:
-            filtered = [part for part in all_parts if part.gip_parts.filter(work_orders__wo_staff=user).exists()]
-            return FinancePartSerializer(filtered, many=True, context=self.context).data
-
-        return []
+        # visibility is applied by project_tree_prefetch()
+        return FinancePartSerializer(obj.visible_finance_parts, many=True, context=self.context).data
 
 
 
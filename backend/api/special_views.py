@@ -5,26 +5,44 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import status
-from api.models import Project,Message
-from api.special_serializers import SpecialProjectSerializer,MessageSerializer
+from django.db.models import Q
+from api.models import Project,Message,ProjectMembership,ObjectLastStatus
+from api.special_serializers import SpecialProjectSerializer,MessageSerializer,visible_tree_querysets
+from api.conditional import ConditionalGetMixin, project_tree_version, subtree_status_version
 
 
 
-class SpecialProjectRetrieveView(RetrieveAPIView):
-    queryset = Project.objects.all()
+class SpecialProjectRetrieveView(ConditionalGetMixin, RetrieveAPIView):
+    queryset = Project.objects.select_related('create_user', 'project_gip', 'financier')
     serializer_class = SpecialProjectSerializer
     permission_classes = [IsAuthenticated]
     lookup_field = 'project_code'
 
+    def get_version(self, request, *args, **kwargs):
+        # get_object() runs the access checks, so a 304 is never sent to someone without access
+        self.project = self.get_object()
+        return project_tree_version(self.project)
+
+    def get_object(self):
+        if getattr(self, 'project', None) is not None:
+            return self.project
+        return self.check_project_access(super().get_object())
+
     def get_serializer_context(self):
         context = super().get_serializer_context()
         context['request'] = self.request
+        context['capabilities'] = self.get_capabilities()
         return context
 
-    def get_object(self):
-        project = super().get_object()
+    def get_capabilities(self):
+        # read once per request: the access check and the whole tree share it
+        if not hasattr(self, 'capabilities'):
+            self.capabilities = set(self.request.user.get_capability_names())
+        return self.capabilities
+
+    def check_project_access(self, project):
         user = self.request.user
-        capabilities = set(user.get_capability_names())
+        capabilities = self.get_capabilities()
 
         # ✅ Full access: creator, project_gip, or key capability holders
         if (
@@ -40,21 +58,75 @@ class SpecialProjectRetrieveView(RetrieveAPIView):
         if project.financier == user and 'IS_FINANCIER' in capabilities:
             return project
 
-        # ✅ NACH_OTDEL with relevant tech parts
-        if 'IS_NACH_OTDEL' in capabilities and project.finance_parts.filter(
-            gip_parts__tch_part_nach=user
-        ).exists():
-            return project
+        # ✅ NACH_OTDEL with relevant tech parts, STAFF with linked work orders
+        relations = []
+        if 'IS_NACH_OTDEL' in capabilities:
+            relations.append('TECH_PART_NACH')
+        if 'IS_STAFF' in capabilities:
+            relations.append('WORK_ORDER_STAFF')
 
-        # ✅ STAFF with linked work orders
-        if 'IS_STAFF' in capabilities and project.finance_parts.filter(
-            gip_parts__work_orders__wo_staff=user
+        if relations and ProjectMembership.objects.filter(
+            user=user, project=project, relation__in=relations
         ).exists():
             return project
 
         raise PermissionDenied("You do not have permission to view this project.")
 
 
+class ProjectStatusTreeView(SpecialProjectRetrieveView):
+    """
+    Last status of the project and of every part / work order under it that the
+    user may see in the project tree, read with one prefix scan on full_id, plus
+    per-level counts over those rows: {path_type: {total, refused, by_phase:
+    {latest_action: n}}}. Answered with 304 until the next ActionLog in the
+    visible subtree changes a status.
+    """
+
+    def get_version(self, request, *args, **kwargs):
+        self.project = self.get_object()
+        return subtree_status_version(self.get_statuses())
+
+    def get_statuses(self):
+        project = self.get_object()
+        statuses = ObjectLastStatus.objects.subtree(project.full_id)
+        visible = visible_tree_querysets(project, self.request.user, self.get_capabilities())
+        if visible is None:
+            return statuses
+
+        # the same nesting as the tree: parts of visible finance parts, orders of visible tech parts
+        finance_parts, gip_parts, work_orders = visible
+        finance_parts = finance_parts.filter(project_code=project)
+        gip_parts = gip_parts.filter(fs_part_code__in=finance_parts)
+        work_orders = work_orders.filter(tch_part_code__in=gip_parts)
+        return statuses.filter(
+            Q(full_id=project.full_id) |
+            Q(full_id__in=finance_parts.values('full_id')) |
+            Q(full_id__in=gip_parts.values('full_id')) |
+            Q(full_id__in=work_orders.values('full_id'))
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        project = self.get_object()
+        statuses = self.get_statuses().select_related('latest_phase_type', 'updated_by').order_by('full_id')
+
+        nodes = []
+        levels = {}
+        for status in statuses:
+            refused = bool(status.latest_phase_type and status.latest_phase_type.is_refusal)
+            nodes.append({
+                'full_id': status.full_id,
+                'path_type': status.path_type,
+                'is_refusal': refused,
+                **status.as_last_status(),
+            })
+            level = levels.setdefault(status.path_type, {'total': 0, 'refused': 0, 'by_phase': {}})
+            level['total'] += 1
+            level['refused'] += refused
+            level['by_phase'][status.latest_action] = level['by_phase'].get(status.latest_action, 0) + 1
+
+        return Response({'project_code': project.project_code, 'statuses': nodes, 'levels': levels})
+
+
 
 
 
@@ -69,12 +141,16 @@ class SendMessageView(APIView):
         if not all([content, full_id, path_type]):
             return Response({"detail": "Missing fields."}, status=status.HTTP_400_BAD_REQUEST)
 
-        msg = Message.objects.create(
+        msg = Message(
             content=content,
             full_id=full_id,
             path_type=path_type,
             sender=request.user
         )
+        msg.fill_hierarchy_links()
+        if msg.get_live_target() is None:
+            return Response({"detail": "Object not found."}, status=status.HTTP_404_NOT_FOUND)
+        msg.save()
         return Response({"detail": "Message sent.", "message_id": msg.message_id}, status=status.HTTP_201_CREATED)
 
 
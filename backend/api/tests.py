@@ -1,3 +1,1247 @@
-from django.test import TestCase
+import datetime
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
+from urllib.parse import parse_qsl, urlsplit
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import DatabaseError, connection, transaction
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_save
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import NotFound
+from rest_framework.generics import ListAPIView
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api import event_views, partitions
+from api.conditional import ConditionalGetMixin
+from api.models import (
+    ActionLog,
+    Capability,
+    ChatMessage,
+    Currency,
+    HierarchyLinkedModel,
+    Message,
+    NotificationCounter,
+    ObjectLastStatus,
+    Partner,
+    PhaseType,
+    Project,
+    ProjectFinancePart,
+    ProjectGipPart,
+    ProjectMembership,
+    ProjectRollup,
+    Role,
+    StaffUser,
+    UserTask,
+    WorkOrder,
+    prefetch_last_status,
+)
+from api.pagination import KeysetPagination
+from api.services import COALESCE_WINDOW, deferred_writes, notify_many
+
+PHASE_KEYS = [
+    'CREATED', 'SENT_TO_FINANCIER', 'FINANCIER_CONFIRMED', 'FIN_PARTS_CREATED', 'SENT_TO_TECH_DIR',
+    'TECH_DIR_CONFIRMED_AND_ATTACHED_GIP', 'SENT_TO_GIP', 'GIP_CONFIRMED', 'GIP_CREATED_TECHNICAL_PARTS',
+    'WORK_ORDER_CREATED', 'TECH_PART_CREATED', 'WORK_ORDER_UPDATED', 'GIP_UPDATED_TECHNICAL_PARTS',
+    'TECH_PART_UPDATED', 'FIN_PARTS_UPDATED', 'PROJECT_UPDATED', 'TECH_DIR_REFUSED', 'FINANCIER_REFUSED',
+    'TECH_PART_CONFIRMED', 'WORK_ORDER_CONFIRMED', 'WORK_ORDER_COMPLETED', 'WORK_ORDER_FINISHED',
+    'WORK_ORDER_REFUSED',
+]
+
+
+def make_user(username, capabilities):
+    role = Role.objects.create(role_name=f'role_{username}')
+    for name in capabilities:
+        capability, _ = Capability.objects.get_or_create(capability_name=name)
+        role.capabilities.add(capability)
+    return StaffUser.objects.create_user(username, 'password', fio=username.upper(), phone_number='1', role=role)
+
+
+class WorkflowTestCase(TestCase):
+    """Phase types, one user per role and build_projects() walking projects through the workflow API."""
+
+    @classmethod
+    def setUpTestData(cls):
+        PhaseType.objects.bulk_create(
+            PhaseType(key=key, name=key.title(), order=order, is_refusal='REFUSED' in key)
+            for order, key in enumerate(PHASE_KEYS, start=1)
+        )
+        cls.currency, _ = Currency.objects.get_or_create(currency_name='UZS')
+        cls.creator = make_user('creator', ['CAN_CREATE_PROJECT'])
+        cls.financier = make_user('financier', ['IS_FINANCIER', 'CAN_CONFIRM_PROJECT_FINANCIER', 'CAN_DIVIDE_FS_PARTS'])
+        cls.tech_dir = make_user('tech_dir', ['IS_TECH_DIR', 'CAN_CHECK_AND_GIP_ATTACH'])
+        cls.gip = make_user('gip', ['IS_GIP', 'CAN_CREATE_TECH_PARTS'])
+        cls.nach = make_user('nach', ['IS_NACH_OTDEL', 'CAN_CREATE_WORK_ORDER', 'CAN_CONFIRM_FINISHED_WORK_ORDER'])
+        cls.staff = make_user('staff', ['IS_STAFF', 'CAN_COMPLETE_WORK_ORDER'])
+        cls.outsider = make_user('outsider', ['IS_STAFF'])
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def get(self, user, url, **extra):
+        """GET url as user; returns (response, number of queries)."""
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client_for(user).get(url, **extra)
+        return response, len(ctx.captured_queries)
+
+    def build_projects(self, count=1, finance_parts=2, work_orders=2):
+        """Projects with finance parts, one tech part each and work orders for self.staff."""
+        codes = []
+        for index in range(Project.objects.count(), Project.objects.count() + count):
+            response = self.client_for(self.creator).post('/api/project-list-create/', {
+                'project_name': f'Project {index}', 'total_price': 100, 'start_date': '2030-01-01',
+                'end_date': '2031-01-01', 'financier': self.financier.pk, 'currency': self.currency.pk,
+            }, format='json')
+            self.assertEqual(response.status_code, 201, response.content)
+            code = Project.objects.get(project_name=f'Project {index}').pk
+            codes.append(code)
+
+            financier = self.client_for(self.financier)
+            financier.post('/api/projects-confirm/financier/confirm/', {'project_code': code}, format='json')
+            response = financier.post('/api/projects-financial-parts/create/', {'project_code': code, 'parts': [
+                {'fs_part_name': f'F{n}', 'fs_part_price': 1, 'fs_start_date': '2030-01-01',
+                 'fs_finish_date': '2030-12-01'} for n in range(finance_parts)
+            ]}, format='json')
+            self.assertEqual(response.status_code, 201, response.content)
+            financier.put(f'/api/projects-financial-parts/{code}/send-to-tech-dir/', format='json')
+            self.client_for(self.tech_dir).post('/api/projects/tech-dir/verify/', {
+                'project_code': code, 'gip_user_id': self.gip.pk}, format='json')
+
+            gip = self.client_for(self.gip)
+            gip.post('/api/gip-projects/confirm-gip/', {'project_code': code}, format='json')
+            for finance_part in ProjectFinancePart.objects.filter(project_code=code):
+                response = gip.post('/api/gip-projects/create-technical-parts/', {
+                    'fs_part_code': finance_part.pk, 'parts': [
+                        {'tch_part_no': '1', 'tch_part_name': 'T1', 'tch_part_nach': self.nach.pk,
+                         'tch_start_date': '2030-01-01', 'tch_finish_date': '2030-02-01'}]}, format='json')
+                self.assertEqual(response.status_code, 201, response.content)
+
+            nach = self.client_for(self.nach)
+            for tech_part in ProjectGipPart.objects.filter(fs_part_code__project_code=code):
+                response = nach.post('/api/work-order/create/', {'tch_part_code': tech_part.pk, 'orders': [
+                    {'wo_no': n + 1, 'wo_name': f'W{n + 1}', 'wo_start_date': '2030-01-01',
+                     'wo_finish_date': '2030-01-05', 'wo_staff': self.staff.pk} for n in range(work_orders)
+                ]}, format='json')
+                self.assertEqual(response.status_code, 201, response.content)
+        return codes
+
+    def log(self, full_id, path_type, phase_key, **fields):
+        return ActionLog.objects.create(
+            full_id=full_id, path_type=path_type, phase_type=PhaseType.objects.get(key=phase_key), **fields
+        )
+
+
+class ConditionalGetTests(WorkflowTestCase):
+    def assert_etag_cycle(self, url):
+        response, _ = self.get(self.creator, url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        response, queries = self.get(self.creator, url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertLessEqual(queries, 6)
+
+        self.log(f'{self.code}/', 'PROJECT', 'PROJECT_UPDATED', performed_by=self.creator)
+        response, _ = self.get(self.creator, url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        return response['ETag']
+
+    def setUp(self):
+        self.code = self.build_projects()[0]
+
+    def test_project_list(self):
+        self.assert_etag_cycle('/api/projects/')
+
+    def test_project_list_follows_rendered_names(self):
+        etag = self.assert_etag_cycle('/api/projects/')
+        for row in (self.financier, self.currency):
+            with self.subTest(row=type(row).__name__):
+                row.save()
+                response = self.get(self.creator, '/api/projects/', HTTP_IF_NONE_MATCH=etag)[0]
+                self.assertEqual(response.status_code, 200)
+                etag = response['ETag']
+
+    def test_special_project_tree(self):
+        url = f'/api/projects/special/{self.code}/'
+        etag = self.assert_etag_cycle(url)
+
+        # any level of the tree moves its version
+        work_order = WorkOrder.objects.filter(full_id__startswith=f'{self.code}/').first()
+        self.log(work_order.full_id, 'WORK_ORDER', 'WORK_ORDER_COMPLETED', performed_by=self.staff)
+        self.assertEqual(self.get(self.creator, url, HTTP_IF_NONE_MATCH=etag)[0].status_code, 200)
+
+    def test_etag_is_per_user(self):
+        url = f'/api/projects/special/{self.code}/'
+        etag = self.get(self.creator, url)[0]['ETag']
+        self.assertEqual(self.get(self.financier, url, HTTP_IF_NONE_MATCH=etag)[0].status_code, 200)
+        self.assertEqual(self.get(self.outsider, url, HTTP_IF_NONE_MATCH=etag)[0].status_code, 403)
+
+    def test_missing_get_version(self):
+        class UnversionedView(ConditionalGetMixin, ListAPIView):
+            queryset = Project.objects.none()
+            permission_classes = []
+
+        with self.assertRaisesMessage(ImproperlyConfigured, 'UnversionedView'):
+            UnversionedView.as_view()(APIRequestFactory().get('/'))
+
+
+class StoredFullIdTests(WorkflowTestCase):
+    def test_insert_writes_full_id_once(self):
+        code = self.build_projects(work_orders=1)[0]
+        tech_part = ProjectGipPart.objects.filter(fs_part_code__project_code=code).first()
+        seen = []
+
+        def receiver(sender, instance, created, **kwargs):
+            seen.append(instance.full_id)
+
+        post_save.connect(receiver, sender=WorkOrder)
+        try:
+            with CaptureQueriesContext(connection) as ctx:
+                work_order = WorkOrder.objects.create(
+                    tch_part_code=tech_part, wo_no=9, wo_name='W9', wo_start_date='2030-01-01',
+                    wo_finish_date='2030-01-05', wo_staff=self.staff,
+                )
+        finally:
+            post_save.disconnect(receiver, sender=WorkOrder)
+
+        self.assertEqual(work_order.full_id, f'{tech_part.full_id}{work_order.pk}/')
+        self.assertEqual(seen, [work_order.full_id])
+        self.assertEqual(WorkOrder.objects.get(pk=work_order.pk).full_id, work_order.full_id)
+        self.assertFalse([q for q in ctx.captured_queries if q['sql'].startswith('UPDATE "work_orders"')])
+
+    def test_reparent_reprefixes_descendants(self):
+        code = self.build_projects(work_orders=1)[0]
+        tech_part = ProjectGipPart.objects.filter(fs_part_code__project_code=code).first()
+        target = ProjectFinancePart.objects.filter(project_code=code).exclude(pk=tech_part.fs_part_code_id).get()
+
+        tech_part.fs_part_code = target
+        tech_part.save()
+
+        self.assertEqual(tech_part.full_id, f'{target.full_id}{tech_part.pk}/')
+        for full_id in WorkOrder.objects.filter(tch_part_code=tech_part).values_list('full_id', flat=True):
+            self.assertTrue(full_id.startswith(tech_part.full_id), full_id)
+        self.assertFalse(ActionLog.objects.filter(full_id__startswith=f'{code}/', tech_part=tech_part)
+                         .exclude(full_id__startswith=tech_part.full_id).exists())
+
+
+class ActionLogPartitionTests(WorkflowTestCase):
+    def setUp(self):
+        self.code = self.build_projects()[0]
+        self.old_month = partitions.add_months(partitions.month_start(timezone.now()), -14)
+        with connection.cursor() as cursor:
+            cursor.execute(partitions.create_partition_sql(self.old_month))
+        self.old_ids = list(
+            ActionLog.objects.filter(notify_to=self.staff, identified=False).values_list('pk', flat=True)[:3]
+        )
+        ActionLog.objects.filter(pk__in=self.old_ids).update(performed_at=self.old_month + datetime.timedelta(days=2))
+        self.archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.archive_dir)
+
+    def old_partition(self):
+        return (self.old_month, partitions.partition_name(self.old_month))
+
+    def test_archive_drops_partition_and_counters(self):
+        call_command('action_log_partitions', '--archive-dir', self.archive_dir, stdout=io.StringIO())
+
+        self.assertNotIn(self.old_partition(), partitions.list_partitions())
+        self.assertFalse(ActionLog.objects.filter(pk__in=self.old_ids).exists())
+        with gzip.open(os.path.join(self.archive_dir, f'{self.old_partition()[1]}.jsonl.gz'), 'rt') as archive:
+            self.assertEqual(sorted(json.loads(line)['action_id'] for line in archive), sorted(self.old_ids))
+        self.assertEqual(NotificationCounter.objects.rebuild(), 0)
+
+    def test_failed_dump_keeps_partition_attached(self):
+        month, name = self.old_partition()
+        unread = NotificationCounter.objects.unread(self.staff.pk)
+        with self.assertRaises(OSError):
+            partitions.archive_partition(month, name, os.path.join(self.archive_dir, 'missing', 'x.jsonl.gz'))
+
+        self.assertIn(self.old_partition(), partitions.list_partitions())
+        self.assertEqual(ActionLog.objects.filter(pk__in=self.old_ids).count(), len(self.old_ids))
+        self.assertEqual(NotificationCounter.objects.unread(self.staff.pk), unread)
+
+    def test_window_hides_old_logs_and_the_command_recounts(self):
+        url = '/api/action-logs/my-notifications/?page_size=50'
+        listed = [row['action_id'] for row in self.get(self.staff, url)[0].json()['results']]
+        self.assertFalse(set(self.old_ids) & set(listed))
+        self.assertEqual(self.client_for(self.staff).post('/api/action-logs/mark-identified/', {
+            'action_ids': self.old_ids}, format='json').json()['marked'], 0)
+
+        # nothing is archived under a longer retention, but the old logs still leave the counter
+        out = io.StringIO()
+        call_command('action_log_partitions', '--retention-months', '24', stdout=out)
+        self.assertIn(self.old_partition(), partitions.list_partitions())
+        self.assertIn('Recounted notifications of 1 users (1 changed)', out.getvalue())
+        self.assertEqual(NotificationCounter.objects.unread(self.staff.pk), len(listed))
+        self.assertEqual(NotificationCounter.objects.rebuild(), 0)
+
+    def test_detached_partition_is_archived_on_next_run(self):
+        call_command('action_log_partitions', '--detach-only', stdout=io.StringIO())
+        self.assertEqual(partitions.list_detached(), [self.old_partition()])
+        self.assertEqual(NotificationCounter.objects.rebuild(), 0)
+
+        call_command('action_log_partitions', '--archive-dir', self.archive_dir, stdout=io.StringIO())
+        self.assertEqual(partitions.list_detached(), [])
+        self.assertTrue(os.path.exists(os.path.join(self.archive_dir, f'{self.old_partition()[1]}.jsonl.gz')))
+
+    def test_new_partition_takes_rows_from_default(self):
+        month = partitions.add_months(partitions.month_start(timezone.now()), 6)
+        log = self.log(f'{self.code}/', 'PROJECT', 'PROJECT_UPDATED', notify_to=self.staff)
+        ActionLog.objects.filter(pk=log.pk).update(performed_at=month + datetime.timedelta(days=1))
+
+        self.assertIn(partitions.partition_name(month), partitions.ensure_partitions(months_ahead=6))
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT tableoid::regclass::text FROM action_logs WHERE action_id = %s', [log.pk])
+            self.assertEqual(cursor.fetchone()[0], partitions.partition_name(month))
+
+
+class CoalesceTests(WorkflowTestCase):
+    def setUp(self):
+        code = self.build_projects(work_orders=1)[0]
+        self.work_order = WorkOrder.objects.filter(full_id__startswith=f'{code}/').first()
+        self.phase = PhaseType.objects.get(key='WORK_ORDER_UPDATED')
+        ActionLog.objects.filter(notify_to=self.staff).update(identified=True)
+        NotificationCounter.objects.rebuild()
+
+    def notify(self, comment):
+        return notify_many(self.work_order, self.phase, self.nach, [self.staff], comment=comment, coalesce=True)[0]
+
+    def repeats(self):
+        return list(ActionLog.objects.filter(notify_to=self.staff, phase_type=self.phase)
+                    .order_by('performed_at').values_list('repeat_count', 'comment'))
+
+    def test_repeat_folds_into_unread_row(self):
+        first = self.notify('first')
+        second = self.notify('second')
+
+        self.assertEqual(second.pk, first.pk)
+        self.assertEqual(self.repeats(), [(2, 'second')])
+        self.assertEqual(NotificationCounter.objects.unread(self.staff.pk), 1)
+        self.assertEqual(NotificationCounter.objects.rebuild(), 0)
+
+    def test_identified_row_is_not_folded_into(self):
+        first = self.notify('first')
+        ActionLog.objects.filter(pk=first.pk).update(identified=True)
+
+        self.notify('second')
+        self.assertEqual(self.repeats(), [(1, 'first'), (1, 'second')])
+
+    def test_rows_outside_window_are_not_folded_into(self):
+        first = self.notify('first')
+        ActionLog.objects.filter(pk=first.pk).update(
+            performed_at=timezone.now() - COALESCE_WINDOW - datetime.timedelta(minutes=1)
+        )
+
+        self.notify('second')
+        self.assertEqual(self.repeats(), [(1, 'first'), (1, 'second')])
+        self.assertEqual(NotificationCounter.objects.unread(self.staff.pk), 2)
+
+    def test_repeat_moves_row_to_top_of_inbox(self):
+        repeated = self.notify('first')
+        ActionLog.objects.filter(pk=repeated.pk).update(performed_at=timezone.now() - datetime.timedelta(days=1))
+        newer = self.log(f'{self.work_order.full_id}', 'WORK_ORDER', 'WORK_ORDER_COMPLETED', notify_to=self.staff)
+        self.notify('second')
+
+        for url in ['/api/action-logs/my-notifications/?identified=false',
+                    '/api/action-logs/my-notifications/?identified=false&cursor=']:
+            results = self.get(self.staff, url)[0].json()['results']
+            self.assertEqual([row['action_id'] for row in results], [repeated.pk, newer.pk], url)
+
+
+class ObjectLastStatusTests(WorkflowTestCase):
+    def test_status_follows_new_logs_only(self):
+        code = self.build_projects(work_orders=1)[0]
+        work_order = WorkOrder.objects.filter(full_id__startswith=f'{code}/').first()
+        log = self.log(work_order.full_id, 'WORK_ORDER', 'WORK_ORDER_COMPLETED', notify_to=self.nach)
+        self.log(work_order.full_id, 'WORK_ORDER', 'WORK_ORDER_CONFIRMED', notify_to=self.staff)
+        status = ObjectLastStatus.objects.get(full_id=work_order.full_id)
+
+        response = self.client_for(self.nach).post(f'/api/action-logs/{log.pk}/mark-identified/')
+        self.assertEqual(response.status_code, 200)
+
+        after = ObjectLastStatus.objects.get(full_id=work_order.full_id)
+        self.assertEqual(after.latest_action, 'WORK_ORDER_CONFIRMED')
+        self.assertEqual(after.last_updated, status.last_updated)
+
+
+class ObjectLastStatusRaceTests(TransactionTestCase):
+    def test_concurrent_upserts_leave_one_row_last_writer_wins(self):
+        first, second = PhaseType.objects.bulk_create([
+            PhaseType(key='FIRST', name='First', order=1), PhaseType(key='SECOND', name='Second', order=2),
+        ])
+        currency, _ = Currency.objects.get_or_create(currency_name='UZS')
+        project = Project.objects.create(project_name='Race', total_price=1, start_date='2030-01-01',
+                                         end_date='2030-02-01', currency=currency)
+        holding = threading.Event()
+        errors = []
+
+        def first_writer():
+            try:
+                with transaction.atomic():
+                    ObjectLastStatus.objects.record([ActionLog(full_id=project.full_id, path_type='PROJECT',
+                                                               phase_type=first, comment='first')])
+                    holding.set()
+                    # commit only once the second writer is blocked on the same full_id
+                    with connection.cursor() as cursor:
+                        for _ in range(100):
+                            cursor.execute("SELECT count(*) FROM pg_stat_activity "
+                                           "WHERE wait_event_type = 'Lock' AND datname = current_database()")
+                            if cursor.fetchone()[0]:
+                                break
+                            time.sleep(0.05)
+            except Exception as error:
+                errors.append(error)
+                holding.set()
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=first_writer)
+        thread.start()
+        holding.wait()
+        ObjectLastStatus.objects.record([ActionLog(full_id=project.full_id, path_type='PROJECT',
+                                                   phase_type=second, comment='second')])
+        thread.join()
+
+        self.assertEqual(errors, [])
+        status = ObjectLastStatus.objects.get(full_id=project.full_id)
+        self.assertEqual((status.latest_action, status.comment), ('SECOND', 'second'))
+        self.assertEqual(ObjectLastStatus.objects.filter(full_id=project.full_id).count(), 1)
+
+
+class ProjectStatusTreeTests(WorkflowTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other_nach = make_user('other_nach', ['IS_NACH_OTDEL', 'CAN_CREATE_WORK_ORDER'])
+
+    def setUp(self):
+        self.code = self.build_projects()[0]
+        # one tech part (and its orders) belongs to another head of department, one order to another employee
+        tech_part = ProjectGipPart.objects.filter(fs_part_code__project_code=self.code).order_by('pk').last()
+        tech_part.tch_part_nach = self.other_nach
+        tech_part.save()
+        work_order = WorkOrder.objects.filter(full_id__startswith=f'{self.code}/').order_by('pk').first()
+        work_order.wo_staff = self.outsider
+        work_order.save()
+        self.url = f'/api/projects/special/{self.code}/status-tree/'
+
+    def tree_full_ids(self, user):
+        """full_ids of the nodes with a last status in the special project tree of user."""
+        project = self.get(user, f'/api/projects/special/{self.code}/')[0].json()
+        nodes = [project]
+        for finance_part in project['finance_parts']:
+            nodes.append(finance_part)
+            for gip_part in finance_part['gip_parts']:
+                nodes.append(gip_part)
+                nodes.extend(gip_part['work_orders'])
+        return sorted(node['full_id'] for node in nodes if node['last_status'])
+
+    def test_statuses_match_the_visible_tree(self):
+        for user in (self.creator, self.gip, self.nach, self.other_nach, self.staff, self.outsider):
+            response, _ = self.get(user, self.url)
+            self.assertEqual(response.status_code, 200, user.username)
+            data = response.json()
+            full_ids = [status['full_id'] for status in data['statuses']]
+            self.assertEqual(full_ids, self.tree_full_ids(user), user.username)
+            self.assertEqual(sum(level['total'] for level in data['levels'].values()), len(full_ids))
+
+        staff_ids = [status['full_id'] for status in self.get(self.staff, self.url)[0].json()['statuses']]
+        hidden = WorkOrder.objects.filter(full_id__startswith=f'{self.code}/', wo_staff=self.outsider).get()
+        self.assertNotIn(hidden.full_id, staff_ids)
+        self.assertEqual(self.get(self.tech_dir, self.url)[0].json()['levels']['WORK_ORDER']['total'], 4)
+
+    def test_hidden_changes_keep_the_etag(self):
+        etag = self.get(self.nach, self.url)[0]['ETag']
+        hidden = ProjectGipPart.objects.get(fs_part_code__project_code=self.code, tch_part_nach=self.other_nach)
+        self.log(hidden.full_id, 'TECH_PART', 'TECH_PART_UPDATED', performed_by=self.gip)
+        self.assertEqual(self.get(self.nach, self.url, HTTP_IF_NONE_MATCH=etag)[0].status_code, 304)
+
+        visible = ProjectGipPart.objects.get(fs_part_code__project_code=self.code, tch_part_nach=self.nach)
+        self.log(visible.full_id, 'TECH_PART', 'TECH_PART_UPDATED', performed_by=self.gip)
+        self.assertEqual(self.get(self.nach, self.url, HTTP_IF_NONE_MATCH=etag)[0].status_code, 200)
+
+    def test_no_access(self):
+        other = make_user('stranger', [])
+        self.assertEqual(self.get(other, self.url)[0].status_code, 403)
+
+
+class StreamTicketTests(WorkflowTestCase):
+    def test_ticket_is_single_use(self):
+        response = self.client_for(self.staff).post('/api/events/ticket/')
+        self.assertEqual(response.status_code, 200)
+        ticket = response.json()['ticket']
+
+        user, expires = event_views._redeem(ticket)
+        self.assertEqual(user, self.staff)
+        self.assertGreater(expires, time.time())
+        self.assertEqual(event_views._redeem(ticket), (None, None))
+
+    def test_ticket_expires(self):
+        ticket = self.client_for(self.staff).post('/api/events/ticket/').json()['ticket']
+        with mock.patch('time.time', return_value=time.time() + event_views.TICKET_MAX_AGE + 1):
+            self.assertEqual(event_views._redeem(ticket), (None, None))
+
+    def test_stream_rejects_access_tokens(self):
+        self.assertEqual(APIClient().post('/api/events/ticket/').status_code, 401)
+        token = str(AccessToken.for_user(self.staff))
+        self.assertEqual(self.client.get('/api/events/stream/', {'token': token}).status_code, 401)
+        self.assertEqual(self.client.get('/api/events/stream/', {'ticket': token}).status_code, 401)
+
+    def test_reading_a_chat_publishes_the_unread_count(self):
+        tasks = [UserTask.objects.create(title=title, receiver=self.staff, create_user=self.nach) for title in 'AB']
+        for task in tasks:
+            ChatMessage.objects.create(task=task, sender=self.nach, receiver=self.staff, message='hi')
+        client = self.client_for(self.staff)
+        with mock.patch('api.views.publish') as publish:
+            client.post(f'/api/chat/messages/task/{tasks[0].pk}/mark-read/')
+            client.post(f'/api/chat/messages/task/{tasks[0].pk}/mark-read/')  # nothing left to read
+        publish.assert_called_once_with(self.staff.pk, 'chat_read', task_id=tasks[0].pk, unread=1)
+
+
+class HotPathIndexTests(WorkflowTestCase):
+    """EXPLAIN of the hot list queries with seqscan disabled: each must be served by its index."""
+
+    def setUp(self):
+        self.build_projects()
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assert_uses_index(self, queryset, index):
+        plan = queryset.explain()
+        with connection.cursor() as cursor:
+            # on partitioned action_logs each partition has its own copy of the index
+            cursor.execute(
+                "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = to_regclass(%s)",
+                [index],
+            )
+            names = [index] + [row[0] for row in cursor.fetchall()]
+        self.assertTrue(any(name in plan for name in names), f'{index} not used:\n{plan}')
+
+    def test_project_lists(self):
+        self.assert_uses_index(Project.objects.order_by('-create_date', '-project_code')[:10], 'project_create_date_idx')
+        self.assert_uses_index(
+            Project.objects.filter(financier=self.financier, financier_confirm=False).order_by('-create_date')[:8],
+            'project_financier_queue_idx',
+        )
+        self.assert_uses_index(
+            Project.objects.filter(project_gip=self.gip, gip_confirm=True).order_by('-create_date')[:10],
+            'project_gip_queue_idx',
+        )
+
+    def test_work_orders(self):
+        self.assert_uses_index(
+            WorkOrder.objects.filter(wo_staff=self.staff).order_by('-wo_start_date')[:10], 'wo_staff_start_idx'
+        )
+        self.assert_uses_index(
+            WorkOrder.objects.filter(
+                create_user=self.nach, staff_confirm=True, wo_answer__isnull=False, answer_date__isnull=False
+            ).order_by('-answer_date')[:10],
+            'wo_answered_idx',
+        )
+
+    def test_inbox_and_chat(self):
+        inbox = ActionLog.objects.filter(notify_to=self.staff, identified=False).annotate(
+            activity_at=Coalesce('last_repeated_at', 'performed_at')
+        ).order_by('-activity_at')[:10]
+        self.assert_uses_index(inbox, 'actionlog_inbox_activity_idx')
+        self.assert_uses_index(ActionLog.objects.filter(full_id__startswith='1/'), 'actionlog_full_id_prefix_idx')
+        self.assert_uses_index(
+            ChatMessage.objects.filter(receiver=self.staff, is_read=False).order_by('-send_time')[:10],
+            'chat_unread_idx',
+        )
+        self.assert_uses_index(
+            UserTask.objects.filter(receiver=self.staff, done=False).order_by('-create_time')[:10],
+            'task_receiver_done_idx',
+        )
+
+
+class KeysetPaginationTests(WorkflowTestCase):
+    class Pagination(KeysetPagination):
+        page_size = 2
+
+    def setUp(self):
+        currency, _ = Currency.objects.get_or_create(currency_name='UZS')
+        day = timezone.now().replace(microsecond=123456)
+        # a nullable, non-unique leading key: NULLs and ties across page edges
+        dates = [None, None, day, day, day, day - datetime.timedelta(days=1), None]
+        for index, confirm_date in enumerate(dates):
+            project = Project.objects.create(project_name=f'K{index}', total_price=1, start_date='2030-01-01',
+                                             end_date='2030-02-01', currency=currency)
+            Project.objects.filter(pk=project.pk).update(financier_confirm_date=confirm_date)
+        self.queryset = Project.objects.order_by('-financier_confirm_date')
+        self.expected = list(self.queryset.order_by('-financier_confirm_date', '-project_code')
+                             .values_list('pk', flat=True))
+
+    def page(self, params):
+        paginator = self.Pagination()
+        request = Request(APIRequestFactory().get('/api/projects/', params))
+        queryset = self.queryset
+        if 'cursor' not in params:
+            queryset = queryset.order_by('-financier_confirm_date', '-project_code')  # OFFSET needs a total order
+        rows = paginator.paginate_queryset(queryset, request)
+        return paginator.get_paginated_response([row.pk for row in rows]).data
+
+    def follow(self, link):
+        return self.page(dict(parse_qsl(urlsplit(link).query)))
+
+    def test_cursor_walks_every_row_once_both_ways(self):
+        data = self.page({'cursor': ''})
+        self.assertEqual(data['count'], len(self.expected))
+        self.assertIsNone(data['previous'])
+        pages = [data['results']]
+        while data['next']:
+            data = self.follow(data['next'])
+            pages.append(data['results'])
+        self.assertEqual([pk for page in pages for pk in page], self.expected)
+
+        backwards = [data['results']]
+        while data['previous']:
+            data = self.follow(data['previous'])
+            backwards.append(data['results'])
+        self.assertEqual(backwards[::-1], pages)
+
+    def test_without_total(self):
+        data = self.page({'cursor': '', 'with_total': 'false'})
+        self.assertIsNone(data['count'])
+
+        data = self.page({'with_total': 'false'})
+        self.assertIsNone(data['count'])
+        pages = [data['results']]
+        while data['next']:
+            data = self.follow(data['next'])
+            pages.append(data['results'])
+        self.assertEqual([pk for page in pages for pk in page], self.expected)
+        self.assertEqual(len(pages), 4)
+        self.assertIsNotNone(data['previous'])
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(NotFound):
+            self.page({'cursor': 'garbage'})
+
+
+class NotifyFailureTests(WorkflowTestCase):
+    def test_failed_fan_out_rolls_the_request_back(self):
+        code = self.build_projects(work_orders=1)[0]
+        part = ProjectFinancePart.objects.create(
+            project_code_id=code, fs_part_no='9', fs_part_name='Late', fs_part_price=1,
+            fs_start_date='2030-01-01', fs_finish_date='2030-12-01',
+        )
+
+        with mock.patch('api.views.notify_many', side_effect=DatabaseError('insert failed')):
+            with self.assertRaises(DatabaseError):
+                self.client_for(self.financier).put(f'/api/projects-financial-parts/{code}/send-to-tech-dir/')
+
+        part.refresh_from_db()
+        self.assertFalse(part.send_to_tech_dir)
+
+
+class ProjectRollupTests(WorkflowTestCase):
+    COUNTERS = ['project_id', 'finance_parts_count', 'parts_sent_count', 'parts_confirmed_count', 'tech_parts_count',
+                'work_orders_count', 'work_orders_finished_count', 'all_sent_to_tech_dir', 'all_tech_dir_confirmed']
+
+    def rollups(self):
+        return list(ProjectRollup.objects.order_by('project_id').values_list(*self.COUNTERS))
+
+    def assert_rollups_consistent(self):
+        maintained = self.rollups()
+        ProjectRollup.objects.rebuild()
+        self.assertEqual(maintained, self.rollups())
+
+    def test_counters_after_workflow(self):
+        code = self.build_projects()[0]
+        rollup = ProjectRollup.objects.get(project_id=code)
+        self.assertEqual(
+            (rollup.finance_parts_count, rollup.parts_sent_count, rollup.tech_parts_count, rollup.work_orders_count),
+            (2, 2, 2, 4),
+        )
+        self.assertTrue(rollup.all_sent_to_tech_dir)
+        self.assert_rollups_consistent()
+
+    def test_send_counts_the_rows_it_updated(self):
+        code = self.build_projects(work_orders=1)[0]
+        client = self.client_for(self.financier)
+        self.assertEqual(client.put(f'/api/projects-financial-parts/{code}/send-to-tech-dir/').status_code, 200)
+        self.assert_rollups_consistent()
+
+        ProjectFinancePart.objects.create(
+            project_code_id=code, fs_part_no='9', fs_part_name='Late', fs_part_price=1,
+            fs_start_date='2030-01-01', fs_finish_date='2030-12-01',
+        )
+        with mock.patch.object(ProjectRollup.objects, 'bump', wraps=ProjectRollup.objects.bump) as bump:
+            client.put(f'/api/projects-financial-parts/{code}/send-to-tech-dir/')
+        bump.assert_called_once_with(code, parts_sent_count=1)
+        self.assert_rollups_consistent()
+
+    def test_counters_follow_updates_and_deletes(self):
+        first, second = self.build_projects(2)
+        work_orders = WorkOrder.objects.filter(full_id__startswith=f'{first}/').order_by('pk')
+
+        work_order = work_orders[0]
+        work_order.finished = True
+        work_order.save()
+        self.assert_rollups_consistent()
+
+        finance_part = ProjectFinancePart.objects.filter(project_code=first).first()
+        finance_part.tech_dir_confirm = True
+        finance_part.save()
+        self.assert_rollups_consistent()
+
+        # a tech part moved to another project's finance part takes its work orders along
+        tech_part = ProjectGipPart.objects.filter(fs_part_code__project_code=first).last()
+        tech_part.fs_part_code = ProjectFinancePart.objects.filter(project_code=second).first()
+        tech_part.save()
+        self.assert_rollups_consistent()
+
+        work_orders[0].delete()
+        self.assert_rollups_consistent()
+        ProjectFinancePart.objects.filter(project_code=second).first().delete()
+        self.assert_rollups_consistent()
+
+        # removed through the work order update API
+        tech_part = ProjectGipPart.objects.filter(fs_part_code__project_code=second).first()
+        keep = WorkOrder.objects.filter(tch_part_code=tech_part).first()
+        response = self.client_for(self.nach).put('/api/work-order/update/', {'tch_part_code': tech_part.pk, 'orders': [
+            {'wo_id': keep.pk, 'wo_no': keep.wo_no, 'wo_name': keep.wo_name, 'wo_start_date': '2030-01-01',
+             'wo_finish_date': '2030-01-05', 'wo_staff': self.staff.pk}]}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assert_rollups_consistent()
+
+
+class ProjectMembershipTests(WorkflowTestCase):
+    def memberships(self):
+        return sorted(ProjectMembership.objects.values_list('user_id', 'project_id', 'relation'))
+
+    def assert_memberships_consistent(self):
+        maintained = self.memberships()
+        ProjectMembership.objects.rebuild()
+        self.assertEqual(maintained, self.memberships())
+
+    def test_relations_after_workflow(self):
+        code = self.build_projects()[0]
+        self.assertEqual(
+            {relation for user, project, relation in self.memberships() if project == code},
+            {'CREATOR', 'GIP', 'FINANCIER', 'TECH_PART_NACH', 'WORK_ORDER_STAFF'},
+        )
+        self.assert_memberships_consistent()
+
+    def test_reassignments_and_deletes(self):
+        code = self.build_projects()[0]
+        url = f'/api/projects/special/{code}/'
+        self.assertEqual(self.get(self.outsider, url)[0].status_code, 403)
+
+        work_order = WorkOrder.objects.filter(full_id__startswith=f'{code}/').first()
+        work_order.wo_staff = self.outsider
+        work_order.save()
+        self.assert_memberships_consistent()
+        self.assertEqual(self.get(self.outsider, url)[0].status_code, 200)
+
+        for tech_part in ProjectGipPart.objects.filter(fs_part_code__project_code=code):
+            tech_part.tch_part_nach = self.outsider
+            tech_part.save()
+        self.assert_memberships_consistent()
+        self.assertEqual(self.get(self.nach, url)[0].status_code, 403)
+
+        work_order.delete()
+        self.assert_memberships_consistent()
+        self.assertEqual(self.get(self.outsider, url)[0].status_code, 403)
+
+        project = Project.objects.get(pk=code)
+        project.financier = self.outsider
+        project.save()
+        self.assert_memberships_consistent()
+
+        ProjectFinancePart.objects.filter(project_code=code).delete()
+        self.assert_memberships_consistent()
+        self.assertFalse(ProjectMembership.objects.filter(project=code, relation='WORK_ORDER_STAFF').exists())
+
+
+class LastStatusTests(WorkflowTestCase):
+    def test_statuses_match_latest_logs(self):
+        self.build_projects()
+        for status in ObjectLastStatus.objects.select_related('latest_phase_type'):
+            latest = ActionLog.objects.filter(full_id=status.full_id).order_by('-performed_at', '-pk').first()
+            self.assertEqual(status.latest_action, latest.phase_type.key, status.full_id)
+            self.assertEqual(status.latest_phase_type_id, latest.phase_type_id)
+
+    def test_one_query_for_a_list(self):
+        self.build_projects(2)
+        nodes = [*Project.objects.all(), *ProjectFinancePart.objects.all(), *WorkOrder.objects.all()]
+        with self.assertNumQueries(1):
+            prefetch_last_status(nodes)
+            statuses = [node.last_status for node in nodes]
+        recorded = set(ObjectLastStatus.objects.values_list('full_id', flat=True))
+        self.assertEqual([status is not None for status in statuses], [node.full_id in recorded for node in nodes])
+        self.assertTrue(all(node.last_status for node in nodes if node.path_type in ('PROJECT', 'WORK_ORDER')))
+
+    def test_project_list_queries_do_not_grow(self):
+        self.build_projects(1)
+        response, one = self.get(self.creator, '/api/projects/')
+        self.assertTrue(all(row['last_status'] for row in response.json()['results']))
+        self.build_projects(2)
+        response, three = self.get(self.creator, '/api/projects/')
+        self.assertEqual(len(response.json()['results']), 3)
+        self.assertEqual(one, three)
+
+
+class HierarchyLinkTests(WorkflowTestCase):
+    def setUp(self):
+        self.code = self.build_projects(work_orders=1)[0]
+        self.work_order = WorkOrder.objects.filter(full_id__startswith=f'{self.code}/').select_related(
+            'tch_part_code__fs_part_code').first()
+
+    def links(self, row):
+        return row.project_id, row.finance_part_id, row.tech_part_id, row.work_order_id
+
+    def test_links_parsed_from_full_id(self):
+        tech_part = self.work_order.tch_part_code
+        expected = (self.code, tech_part.fs_part_code_id, tech_part.pk, self.work_order.pk)
+        log = self.log(self.work_order.full_id, 'WORK_ORDER', 'WORK_ORDER_COMPLETED')
+        self.assertEqual(self.links(log), expected)
+        self.assertEqual(self.links(ObjectLastStatus.objects.get(full_id=self.work_order.full_id)), expected)
+        self.assertEqual(log.target, self.work_order)
+
+        project_log = self.log(f'{self.code}/', 'PROJECT', 'PROJECT_UPDATED')
+        self.assertEqual(self.links(project_log), (self.code, None, None, None))
+        self.assertEqual(HierarchyLinkedModel.links_from_full_id('x/1/'),
+                         {'project_id': None, 'finance_part_id': None, 'tech_part_id': None, 'work_order_id': None})
+
+    def test_messages_need_a_live_target(self):
+        client = self.client_for(self.staff)
+        response = client.post('/api/messages/send/', {
+            'content': 'hi', 'full_id': self.work_order.full_id, 'path_type': 'WORK_ORDER'}, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        message = Message.objects.get(pk=response.json()['message_id'])
+        self.assertEqual(message.work_order_id, self.work_order.pk)
+
+        response = client.post('/api/messages/send/', {
+            'content': 'hi', 'full_id': f'{self.code}/999999/', 'path_type': 'FIN_PART'}, format='json')
+        self.assertEqual(response.status_code, 404)
+
+    def test_live_and_orphaned(self):
+        log = self.log(self.work_order.full_id, 'WORK_ORDER', 'WORK_ORDER_COMPLETED')
+        stray = self.log('abc/', 'PROJECT', 'PROJECT_UPDATED')
+        self.assertTrue(ActionLog.objects.live().filter(pk=log.pk).exists())
+        self.assertEqual(list(ActionLog.objects.orphaned().values_list('pk', flat=True)), [stray.pk])
+
+
+class NotificationListTests(WorkflowTestCase):
+    url = '/api/action-logs/my-notifications/?page_size=10'
+
+    def setUp(self):
+        self.code = self.build_projects(work_orders=1)[0]
+        ActionLog.objects.filter(notify_to=self.staff).delete()
+        self.work_order = WorkOrder.objects.select_related('tch_part_code__fs_part_code').filter(
+            full_id__startswith=f'{self.code}/').first()
+        tech_part = self.work_order.tch_part_code
+        self.targets = [(f'{self.code}/', 'PROJECT'), (tech_part.fs_part_code.full_id, 'FIN_PART'),
+                        (tech_part.full_id, 'TECH_PART'), (self.work_order.full_id, 'WORK_ORDER')]
+
+    def test_orphans_are_filtered_in_sql(self):
+        for full_id, path_type in self.targets:
+            self.log(full_id, path_type, 'PROJECT_UPDATED', notify_to=self.staff)
+        self.log('abc/', 'PROJECT', 'PROJECT_UPDATED', notify_to=self.staff)
+        self.log(f'{self.code}/', 'FIN_PART', 'FIN_PARTS_UPDATED', notify_to=self.staff)
+
+        data = self.get(self.staff, self.url)[0].json()
+        self.assertEqual(data['count'], len(self.targets))
+        self.assertTrue(all(row['object_data'] for row in data['results']))
+
+    def test_queries_do_not_grow_with_the_page(self):
+        for full_id, path_type in self.targets:
+            self.log(full_id, path_type, 'PROJECT_UPDATED', notify_to=self.staff, performed_by=self.creator)
+        _, small = self.get(self.staff, self.url)
+
+        for performer in (self.gip, self.nach):
+            for full_id, path_type in self.targets:
+                self.log(full_id, path_type, 'PROJECT_UPDATED', notify_to=self.staff, performed_by=performer)
+        response, large = self.get(self.staff, self.url)
+        self.assertEqual(len(response.json()['results']), 10)
+        self.assertEqual(small, large)
+
+
+class NotificationCounterTests(WorkflowTestCase):
+    def assert_counters_consistent(self):
+        self.assertEqual(NotificationCounter.objects.rebuild(), 0)
+        for user in (self.creator, self.financier, self.tech_dir, self.gip, self.nach, self.staff):
+            unread = ActionLog.objects.live().filter(notify_to=user, identified=False).count()
+            response = self.client_for(user).get('/api/action-logs/unread-count/')
+            self.assertEqual(response.json()['count'], unread)
+
+    def setUp(self):
+        self.code, self.other = self.build_projects(count=2)
+
+    def test_create(self):
+        self.assertGreater(NotificationCounter.objects.unread(self.staff.pk), 0)
+        self.assert_counters_consistent()
+
+    def test_mark_read(self):
+        log = ActionLog.objects.filter(notify_to=self.staff, identified=False).first()
+        client = self.client_for(self.staff)
+        client.post(f'/api/action-logs/{log.pk}/mark-identified/')
+        client.post(f'/api/action-logs/{log.pk}/mark-identified/')  # marking twice counts once
+        self.assert_counters_consistent()
+
+        log.identified = False
+        log.save(update_fields=['identified'])
+        self.assert_counters_consistent()
+
+    def test_delete(self):
+        # a log deleted on its own is not counted (no ActionLog delete receivers): the command repairs it
+        ActionLog.objects.filter(notify_to=self.staff, identified=False).first().delete()
+        out = io.StringIO()
+        call_command('rebuild_notification_counters', stdout=out)
+        self.assertIn('Fixed 1 ', out.getvalue())
+        self.assert_counters_consistent()
+
+        WorkOrder.objects.filter(full_id__startswith=f'{self.code}/').first().delete()
+        self.assert_counters_consistent()
+        ProjectGipPart.objects.filter(full_id__startswith=f'{self.code}/').first().delete()
+        self.assert_counters_consistent()
+
+        before = NotificationCounter.objects.unread(self.staff.pk)
+        Project.objects.get(pk=self.code).delete()
+        self.assertLess(NotificationCounter.objects.unread(self.staff.pk), before)
+        self.assert_counters_consistent()
+
+
+class BulkMarkIdentifiedTests(WorkflowTestCase):
+    url = '/api/action-logs/mark-identified/'
+
+    def setUp(self):
+        self.code, self.other = self.build_projects(count=2)
+        self.unread = ActionLog.objects.filter(notify_to=self.staff, identified=False)
+
+    def mark(self, body, user=None):
+        return self.client_for(user or self.staff).post(self.url, body, format='json')
+
+    def assert_marked(self, response, expected):
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['marked'], expected)
+        self.assertEqual(response.json()['count'], self.unread.count())
+        self.assertEqual(NotificationCounter.objects.rebuild(), 0)
+
+    def test_action_ids(self):
+        ids = list(self.unread.values_list('pk', flat=True)[:2])
+        foreign = ActionLog.objects.exclude(notify_to=self.staff).values_list('pk', flat=True).first()
+        self.assert_marked(self.mark({'action_ids': ids + [foreign]}), 2)
+        self.assertFalse(ActionLog.objects.get(pk=foreign).identified)
+        self.assert_marked(self.mark({'action_ids': ids}), 0)
+
+    def test_full_id_and_phase_type(self):
+        in_project = self.unread.filter(full_id__startswith=f'{self.other}/')
+        expected = in_project.filter(phase_type__key='WORK_ORDER_CREATED').count()
+        self.assertGreater(expected, 0)
+        self.assert_marked(self.mark({'full_id': f'{self.other}/', 'phase_type': 'WORK_ORDER_CREATED'}), expected)
+        self.assertTrue(self.unread.filter(full_id__startswith=f'{self.code}/').exists())
+
+    def test_all(self):
+        expected = self.unread.count()
+        self.assert_marked(self.mark({'all': True}), expected)
+        self.assertFalse(self.unread.exists())
+
+    def test_invalid(self):
+        self.assertEqual(self.mark({}).status_code, 400)
+        self.assertEqual(self.mark({'action_ids': ['1']}).status_code, 400)
+
+
+class HierarchyCascadeTests(WorkflowTestCase):
+    def setUp(self):
+        self.code = self.build_projects(work_orders=1)[0]
+        self.work_order = WorkOrder.objects.select_related('tch_part_code').filter(
+            full_id__startswith=f'{self.code}/').first()
+        self.tech_part = self.work_order.tch_part_code
+        for full_id, path_type in ((self.work_order.full_id, 'WORK_ORDER'), (self.tech_part.full_id, 'TECH_PART')):
+            Message.objects.create(content='hi', sender=self.gip, full_id=full_id, path_type=path_type)
+
+    def rows(self, prefix):
+        return [model.objects.filter(full_id__startswith=prefix).count() for model in (ActionLog, ObjectLastStatus, Message)]
+
+    def test_work_order(self):
+        work_order_rows = self.rows(self.work_order.full_id)
+        self.assertTrue(all(work_order_rows))
+        tech_part_rows = self.rows(self.tech_part.full_id)
+        self.work_order.delete()
+        # only the work order's rows go; its parent keeps its own
+        self.assertEqual(self.rows(self.work_order.full_id), [0, 0, 0])
+        self.assertEqual(self.rows(self.tech_part.full_id), [n - m for n, m in zip(tech_part_rows, work_order_rows)])
+
+    def test_tech_part_and_project(self):
+        self.tech_part.delete()
+        self.assertEqual(self.rows(self.tech_part.full_id), [0, 0, 0])
+        self.assertTrue(all(self.rows(f'{self.code}/')[:2]))
+
+        Project.objects.get(pk=self.code).delete()
+        self.assertEqual(self.rows(f'{self.code}/'), [0, 0, 0])
+        self.assertFalse(ActionLog.objects.orphaned().exists())
+
+
+class PurgeOrphanLogsTests(WorkflowTestCase):
+    def setUp(self):
+        self.code = self.build_projects(finance_parts=1, work_orders=1)[0]
+        self.log('abc/', 'PROJECT', 'PROJECT_UPDATED')
+        for n in range(3):
+            self.log(f'{self.code}/', 'FIN_PART', 'FIN_PARTS_UPDATED', comment=str(n))
+        Message.objects.create(content='hi', sender=self.gip, full_id=f'{self.code}/', path_type='TECH_PART')
+        self.live = [model.objects.live().count() for model in (ActionLog, ObjectLastStatus, Message)]
+
+    def purge(self, *args):
+        out = io.StringIO()
+        call_command('purge_orphan_logs', *args, '--pause=0', stdout=out)
+        return out.getvalue()
+
+    def test_dry_run(self):
+        out = self.purge('--dry-run')
+        self.assertIn('ActionLog: 4 orphans', out)
+        self.assertIn('Message: 1 orphans', out)
+        self.assertEqual(ActionLog.objects.orphaned().count(), 4)
+
+    def test_purge_in_batches(self):
+        out = self.purge('--batch-size=1')
+        self.assertIn('ActionLog: purged 4 orphans', out)
+        self.assertIn('Message: purged 1 orphans', out)
+        for model in (ActionLog, ObjectLastStatus, Message):
+            self.assertFalse(model.objects.orphaned().exists())
+        self.assertEqual([model.objects.live().count() for model in (ActionLog, ObjectLastStatus, Message)], self.live)
+
+
+class InboxCacheTests(WorkflowTestCase):
+    url = '/api/action-logs/my-notifications/?page=1&identified=false'
+
+    def setUp(self):
+        cache.clear()
+        self.code = self.build_projects(work_orders=1)[0]
+
+    def test_hit(self):
+        miss, miss_queries = self.get(self.staff, self.url)
+        hit, hit_queries = self.get(self.staff, self.url)
+        self.assertEqual(hit.json(), miss.json())
+        self.assertLess(hit_queries, miss_queries)
+
+        # other pages and page sizes are not cached
+        self.assertEqual(self.get(self.staff, self.url + '&page_size=5')[1], miss_queries)
+
+    def test_page_without_total_is_not_cached(self):
+        data = self.get(self.staff, self.url + '&with_total=false')[0].json()
+        self.assertIsNone(data['count'])
+        self.assertEqual(self.get(self.staff, self.url)[0].json()['count'], len(data['results']))
+
+    def test_invalidated_by_mark_read(self):
+        first = self.get(self.staff, self.url)[0].json()
+        action_id = first['results'][0]['action_id']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client_for(self.staff).post(f'/api/action-logs/{action_id}/mark-identified/')
+        data = self.get(self.staff, self.url)[0].json()
+        self.assertEqual(data['count'], first['count'] - 1)
+        self.assertNotIn(action_id, [row['action_id'] for row in data['results']])
+
+    def test_invalidated_by_bulk_mark(self):
+        self.get(self.staff, self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client_for(self.staff).post('/api/action-logs/mark-identified/', {'all': True}, format='json')
+        self.assertEqual(self.get(self.staff, self.url)[0].json()['count'], 0)
+
+    def test_invalidated_by_new_log(self):
+        count = self.get(self.staff, self.url)[0].json()['count']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.log(f'{self.code}/', 'PROJECT', 'PROJECT_UPDATED', notify_to=self.staff)
+        self.assertEqual(self.get(self.staff, self.url)[0].json()['count'], count + 1)
+
+    def test_lost_version_does_not_revive_old_pages(self):
+        count = self.get(self.staff, self.url)[0].json()['count']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.log(f'{self.code}/', 'PROJECT', 'PROJECT_UPDATED', notify_to=self.staff)
+        cache.delete(f'inbox:{self.staff.pk}:version')  # e.g. culled by the file cache
+        self.assertEqual(self.get(self.staff, self.url)[0].json()['count'], count + 1)
+
+
+class DeferredWritesTests(WorkflowTestCase):
+    def setUp(self):
+        self.code = self.build_projects(finance_parts=1)[0]
+        self.tech_part = ProjectGipPart.objects.get(fs_part_code__project_code=self.code)
+
+    def statements(self, queries, prefix):
+        return sum(query['sql'].startswith(prefix) for query in queries)
+
+    def update_work_orders(self, new_orders):
+        orders = [
+            {'wo_id': wo.pk, 'wo_no': wo.wo_no, 'wo_name': f'{wo.wo_name}*', 'wo_start_date': '2030-01-01',
+             'wo_finish_date': '2030-01-05', 'wo_staff': self.outsider.pk}
+            for wo in WorkOrder.objects.filter(tch_part_code=self.tech_part)
+        ] + [
+            {'wo_no': 10 + n, 'wo_name': f'N{n}', 'wo_start_date': '2030-01-01', 'wo_finish_date': '2030-01-05',
+             'wo_staff': self.staff.pk} for n in range(new_orders)
+        ]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client_for(self.nach).put('/api/work-order/update/', {
+                'tch_part_code': self.tech_part.pk, 'orders': orders}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return ctx.captured_queries
+
+    def assert_derived_rows_consistent(self):
+        rollup = ProjectRollup.objects.filter(project_id=self.code).values().get()
+        memberships = set(ProjectMembership.objects.values_list('user_id', 'project_id', 'relation'))
+        ProjectRollup.objects.rebuild()
+        ProjectMembership.objects.rebuild()
+        rollup.pop('update_time', None)
+        rebuilt = ProjectRollup.objects.filter(project_id=self.code).values().get()
+        rebuilt.pop('update_time', None)
+        self.assertEqual(rollup, rebuilt)
+        self.assertEqual(memberships, set(ProjectMembership.objects.values_list('user_id', 'project_id', 'relation')))
+
+    def test_side_effects_are_flushed_once(self):
+        for new_orders in (1, 4):
+            queries = self.update_work_orders(new_orders)
+            self.assertEqual(self.statements(queries, 'INSERT INTO "action_logs"'), 1)
+            self.assertEqual(self.statements(queries, 'UPDATE "project_rollups"'), 1)
+            self.assert_derived_rows_consistent()
+
+        self.assertEqual(ProjectRollup.objects.get(project_id=self.code).work_orders_count, 2 + 1 + 4)
+        self.assertTrue(ProjectMembership.objects.filter(
+            user=self.outsider, project_id=self.code, relation='WORK_ORDER_STAFF').exists())
+
+    def test_writes_wait_for_the_block(self):
+        work_order = WorkOrder.objects.filter(tch_part_code=self.tech_part).first()
+        logs = ActionLog.objects.filter(full_id=work_order.full_id)
+        before = logs.count()
+        with transaction.atomic():
+            with deferred_writes():
+                notify_many(work_order, PhaseType.objects.get(key='WORK_ORDER_UPDATED'), self.nach, [self.staff])
+                self.assertEqual(logs.count(), before)
+            self.assertEqual(logs.count(), before + 1)
+
+    def test_error_discards_the_buffer(self):
+        work_order = WorkOrder.objects.filter(tch_part_code=self.tech_part).first()
+        before = ActionLog.objects.count()
+        with self.assertRaises(ValueError), transaction.atomic(), deferred_writes():
+            notify_many(work_order, PhaseType.objects.get(key='WORK_ORDER_UPDATED'), self.nach, [self.staff])
+            raise ValueError
+        self.assertEqual(ActionLog.objects.count(), before)
+
+    def test_caught_integrity_error_skips_the_flush(self):
+        self.client_for(self.creator).post('/api/project-list-create/', {
+            'project_name': 'Duplicates', 'total_price': 100, 'start_date': '2030-01-01', 'end_date': '2031-01-01',
+            'financier': self.financier.pk, 'currency': self.currency.pk,
+        }, format='json')
+        code = Project.objects.get(project_name='Duplicates').pk
+        part = {'fs_part_no': 'P1', 'fs_part_name': 'F', 'fs_part_price': 1, 'fs_start_date': '2030-01-01',
+                'fs_finish_date': '2030-12-01'}
+        response = self.client_for(self.financier).post('/api/projects-financial-parts/create/', {
+            'project_code': code, 'parts': [part, dict(part, fs_part_name='G')]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['key'],
+                         'create_fpart.duplicate_fs_part_name_or_fs_part_no_for_the_same_project')
+        self.assertFalse(ProjectFinancePart.objects.filter(project_code=code).exists())
+        self.assertEqual(ProjectRollup.objects.get(project_id=code).finance_parts_count, 0)
+
+
+class SpecialProjectTreeQueryTests(WorkflowTestCase):
+    def setUp(self):
+        self.small = self.build_projects(finance_parts=1, work_orders=1)[0]
+        self.large = self.build_projects(finance_parts=3, work_orders=3)[0]
+        for model in (ProjectFinancePart, ProjectGipPart, WorkOrder):
+            for node in model.objects.filter(full_id__startswith=f'{self.large}/'):
+                Message.objects.create(content='hi', sender=self.gip, full_id=node.full_id, path_type=node.path_type)
+
+    def test_query_count_is_independent_of_tree_size(self):
+        for user in (self.creator, self.financier, self.tech_dir, self.gip, self.nach, self.staff):
+            with self.subTest(user=user.username):
+                response, queries = self.get(user, f'/api/projects/special/{self.small}/')
+                self.assertEqual(response.status_code, 200)
+                client = self.client_for(user)
+                with self.assertNumQueries(queries):
+                    response = client.get(f'/api/projects/special/{self.large}/')
+                self.assertEqual(response.status_code, 200)
+
+    def test_large_tree_is_complete(self):
+        data = self.get(self.financier, f'/api/projects/special/{self.large}/')[0].json()
+        self.assertEqual(len(data['finance_parts']), 3)
+        work_orders = [wo for fp in data['finance_parts'] for gp in fp['gip_parts'] for wo in gp['work_orders']]
+        self.assertEqual(len(work_orders), 9)
+
+
+class SearchTests(WorkflowTestCase):
+    def setUp(self):
+        self.acme = Partner.objects.create(partner_name='Acme', partner_inn='301234567')
+        self.acme_group = Partner.objects.create(partner_name='Acme Industrial Group', partner_inn='309999999')
+        client = self.client_for(self.creator)
+        for name, contract, partner in (
+            ('Bridge', 'DG-77/2030', self.acme_group), ('Tunnel', None, self.acme), ('Road', 'K-1', None),
+        ):
+            response = client.post('/api/project-list-create/', {
+                'project_name': name, 'contract_number': contract, 'partner': partner and partner.pk,
+                'total_price': 100, 'start_date': '2030-01-01', 'end_date': '2031-01-01',
+                'financier': self.financier.pk, 'currency': self.currency.pk,
+            }, format='json')
+            self.assertEqual(response.status_code, 201, response.content)
+
+    def projects(self, search):
+        response = self.get(self.creator, f'/api/projects/?search={search}')[0]
+        return [row['project_name'] for row in response.json()['results']]
+
+    def test_project_matches(self):
+        self.assertEqual(self.projects('dg-77'), ['Bridge'])  # contract number, any case
+        self.assertEqual(self.projects('30123'), ['Tunnel'])  # partner INN
+        self.assertEqual(self.projects('nonexistent'), [])
+
+    def test_project_rank(self):
+        # both partners match "acme"; the exact name ranks first
+        self.assertEqual(self.projects('acme'), ['Tunnel', 'Bridge'])
+        self.assertEqual(Project.objects.search('acme').order_by('-search_rank')[0].project_name, 'Tunnel')
+
+    def test_blank_search_lists_everything(self):
+        everything = self.projects('')
+        self.assertEqual(sorted(everything), ['Bridge', 'Road', 'Tunnel'])
+        self.assertEqual(self.projects('%20%20'), everything)
+        self.assertIs(Project.objects.search('  ').query.annotations.get('search_rank'), None)
+
+    def test_partner_search(self):
+        admin = make_user('partner_admin', ['CAN_ADD_PARTNERS'])
+        response = self.get(admin, '/api/partners/?search=ACME')[0]
+        self.assertEqual([row['partner_name'] for row in response.json()['results']], ['Acme', 'Acme Industrial Group'])
+        response = self.get(admin, '/api/partners/?search=30999')[0]
+        self.assertEqual([row['partner_name'] for row in response.json()['results']], ['Acme Industrial Group'])
+        self.assertEqual(list(Partner.objects.search(' ')), list(Partner.objects.all()))
+
+
+class PhaseProgressBatchTests(WorkflowTestCase):
+    def setUp(self):
+        self.code = self.build_projects(work_orders=1)[0]
+        other = make_user('other_creator', ['CAN_CREATE_PROJECT'])
+        self.client_for(other).post('/api/project-list-create/', {
+            'project_name': 'Elsewhere', 'total_price': 100, 'start_date': '2030-01-01', 'end_date': '2031-01-01',
+            'financier': self.financier.pk, 'currency': self.currency.pk,
+        }, format='json')
+        self.other = Project.objects.get(project_name='Elsewhere').pk
+
+    def progress(self, user):
+        response = self.get(user, f'/api/projects/phase-progress/?project_codes={self.code},{self.other}')[0]
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_only_listed_projects(self):
+        def shown(user):
+            return sorted(code for code, phases in self.progress(user).items() if phases)
+
+        data = self.progress(self.creator)
+        self.assertEqual(data[str(self.other)], [])
+        self.assertIn('CREATED', [phase['phase_key'] for phase in data[str(self.code)]])
+
+        self.assertEqual(shown(self.staff), [str(self.code)])
+        self.assertEqual(shown(self.outsider), [])
+        self.assertEqual(shown(self.tech_dir), sorted([str(self.code), str(self.other)]))
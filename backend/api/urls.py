@@ -43,8 +43,10 @@ from .views import (StaffUserLoginView,
                     CompleteOrUpdateWorkOrderView,
                     MyNotificationLogsView,
                     MarkActionLogIdentifiedView,
+                    MarkActionLogsIdentifiedBulkView,
                     NotificationCountView,
                     ProjectPhaseProgressView,
+                    ProjectPhaseProgressBatchView,
                     FinishedWorkOrderListView,
                     ConfirmFinishedWorkOrderView,
                     UnlockFinishedWorkOrderView,
@@ -76,8 +78,9 @@ from .views import (StaffUserLoginView,
           
           
           
-from .special_views import SpecialProjectRetrieveView,SendMessageView, MessageListView      
+from .special_views import SpecialProjectRetrieveView,SendMessageView, MessageListView, ProjectStatusTreeView      
 from .admin_views import AdminUserListView,CreateUserView,AdminRoleListView,AdminUpdateUserView,AdminSetUserPasswordView,PauseUserView,ActivateUserView,ProjectLogListView,ProjectSnapshotView,AdminUserDeleteView,UserSnapshotView,UserLogListView
+from .event_views import StreamTicketView, event_stream
 
 urlpatterns = [
     path('login/', StaffUserLoginView.as_view(), name='jwt_login'),
@@ -159,6 +162,7 @@ urlpatterns = [
     
     #special
     path('projects/special/<int:project_code>/', SpecialProjectRetrieveView.as_view(), name='special_project_detail'),
+    path('projects/special/<int:project_code>/status-tree/', ProjectStatusTreeView.as_view(), name='special_project_status_tree'),
     
     #messages
     path('messages/send/', SendMessageView.as_view(), name='send_message'),
@@ -169,10 +173,14 @@ urlpatterns = [
     #notifications
     path('action-logs/my-notifications/', MyNotificationLogsView.as_view(), name='my_action_notifications'),
     path('action-logs/<int:action_id>/mark-identified/', MarkActionLogIdentifiedView.as_view(), name='mark_action_identified'),
+    path('action-logs/mark-identified/', MarkActionLogsIdentifiedBulkView.as_view(), name='mark_actions_identified_bulk'),
     path('action-logs/unread-count/', NotificationCountView.as_view(), name='notification-count'),
+    path('events/ticket/', StreamTicketView.as_view(), name='event-stream-ticket'),
+    path('events/stream/', event_stream, name='event-stream'),  # ASGI only (see docker-compose "events")
     
     #phase progress
     path('projects/<int:project_code>/phase-progress/', ProjectPhaseProgressView.as_view()),
+    path('projects/phase-progress/', ProjectPhaseProgressBatchView.as_view(), name='project_phase_progress_batch'),
     
     #for nach otdel confirm finisged jobs
     path('work-order/finished-for-confirm/', FinishedWorkOrderListView.as_view()),
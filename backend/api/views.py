@@ -20,7 +20,7 @@ import json
 from django.contrib.auth import update_session_auth_hash
 
 # Generated by Django 5.2.1 on 2025-06-19 07:30
-from api.models import StaffUser,Project,ProjectFinancePart,Partner,Translation,Department,PhaseType,Currency, ChatMessage,ProjectGipPart,ActionLog,WorkOrder,WorkOrderFile,JobPosition,UserTask,ChatMessageFile
+from api.models import StaffUser,Project,ProjectFinancePart,Partner,Translation,Department,PhaseType,Currency, ChatMessage,ProjectGipPart,ActionLog,WorkOrder,WorkOrderFile,JobPosition,UserTask,ChatMessageFile,ProjectRollup,NotificationCounter
 from .serializers import (ProjectSerializer,
                           StaffUserSimpleSerializer,
                           ProjectFinancePartCreateSerializer,
@@ -48,13 +48,18 @@ from .serializers import (ProjectSerializer,
 from rest_framework.generics import ListCreateAPIView, RetrieveUpdateAPIView,ListAPIView,UpdateAPIView,CreateAPIView,DestroyAPIView,UpdateAPIView
 from api.serializers import StaffUserTokenSerializer
 from django.utils.dateparse import parse_date
-from django.db.models import Count, Q,Subquery,OuterRef,F
+from django.db.models import Q,Subquery,OuterRef
+from django.db.models.functions import Coalesce
 from django.db import transaction
 from .pagination import ProjectsPagination,ProjectsFiancierConfirmPagination,PartnersPagination,CompleteWorkOrderPagination,TranslationsPagination,GipConfirmPagination,ProjectListCreatePagination,ProjectGipPartPagination,NotificationsPagination,StaffManagementPagination,DepartmentPagination
 from django.utils import timezone
 from rest_framework.views import APIView
 from rest_framework.exceptions import ValidationError
 from rest_framework.filters import SearchFilter
+from .conditional import ConditionalGetMixin, project_list_version
+from .services import create_action_logs, deferred_writes, notify_many
+from .inbox import cached_inbox_page, inbox_variant, invalidate_inbox
+from .events import publish
 
 
 
@@ -185,7 +190,7 @@ class ProjectListNotificationFinancierView(generics.ListAPIView):
         return Project.objects.filter(
             financier=user,
             financier_confirm=False
-        )
+        ).with_list_stats()
 
 
 
@@ -207,7 +212,7 @@ class ProjectListFinancierConfirmView(generics.ListAPIView):
             qs = qs.filter(financier_confirm=True).order_by('-financier_confirm_date')
         else:
             qs = qs.filter(financier_confirm=False).order_by('-create_date')
-        return qs
+        return qs.with_list_stats()
     
     
 
@@ -258,29 +263,16 @@ class UsersWithCapabilityAPIView(generics.ListAPIView):
         
 
 
-class ProjectListAPIView(generics.ListAPIView):
+class ProjectListAPIView(ConditionalGetMixin, generics.ListAPIView):
     serializer_class = ProjectSerializer
     pagination_class = ProjectsPagination
     permission_classes = [IsAuthenticated]
 
-    def get_queryset(self):
-        user = self.request.user
-        capabilities = set(user.get_capability_names())
-
-        # ✅ If user is Tech Director or Fin Director — see all projects
-        if 'IS_TECH_DIR' in capabilities or 'IS_FIN_DIR' in capabilities or 'IS_GEN_DIR' in capabilities:
-            qs = Project.objects.all()
-        else:
-            base_q = Q(create_user=user) | Q(project_gip=user)
-
-            if 'IS_FINANCIER' in capabilities:
-                base_q |= Q(financier=user)
-            if 'IS_NACH_OTDEL' in capabilities:
-                base_q |= Q(finance_parts__gip_parts__tch_part_nach=user)
-            if 'IS_STAFF' in capabilities:
-                base_q |= Q(finance_parts__gip_parts__work_orders__wo_staff=user)
+    def get_version(self, request, *args, **kwargs):
+        return project_list_version(self.get_queryset())
 
-            qs = Project.objects.filter(base_q).distinct()
+    def get_queryset(self):
+        qs = Project.objects.visible_to(self.request.user)
 
         # 🔍 Filtrlarni olish
         start_date_from = self.request.query_params.get('start_date_from')
@@ -289,7 +281,7 @@ class ProjectListAPIView(generics.ListAPIView):
         end_date_to = self.request.query_params.get('end_date_to')
         financier_confirmed = self.request.query_params.get('financier_confirmed')
         gip_confirmed = self.request.query_params.get('gip_confirmed')
-        search = self.request.query_params.get('search')
+        search = self.request.query_params.get('search', '').strip()
         total_price_from = self.request.query_params.get('total_price_from')
         total_price_to = self.request.query_params.get('total_price_to')
 
@@ -311,7 +303,7 @@ class ProjectListAPIView(generics.ListAPIView):
 
         # 🔎 Qidiruv
         if search:
-            qs = qs.filter(project_name__icontains=search)
+            qs = qs.search(search)
 
         # ☑️ Holat filtrlari
         if financier_confirmed == 'true':
@@ -324,7 +316,8 @@ class ProjectListAPIView(generics.ListAPIView):
         elif gip_confirmed == 'false':
             qs = qs.filter(gip_confirm=False)
 
-        return qs.order_by('-create_date')
+        ordering = ('-search_rank', '-create_date') if search else ('-create_date',)
+        return qs.with_list_stats().order_by(*ordering)
 
 
 class ProjectListCreateView(ListCreateAPIView):
@@ -336,10 +329,10 @@ class ProjectListCreateView(ListCreateAPIView):
     ]
 
     def get_queryset(self):
-        queryset = Project.objects.all().order_by('-create_date')
-        search = self.request.query_params.get('search')
+        queryset = Project.objects.with_list_stats().order_by('-create_date')
+        search = self.request.query_params.get('search', '').strip()
         if search:
-            queryset = queryset.filter(Q(project_name__icontains=search))
+            queryset = queryset.search(search).order_by('-search_rank', '-create_date')
         return queryset
 
 
@@ -485,6 +478,7 @@ class CreateFinancialPartsView(APIView):
 
 
     @transaction.atomic
+    @deferred_writes()
     def post(self, request):
         project_code = request.data.get('project_code')
         parts_data = request.data.get('parts', [])
@@ -565,6 +559,7 @@ class ProjectFinancePartsUpdateAPIView(APIView):
     permission_classes = [IsAuthenticated]
     
     @transaction.atomic
+    @deferred_writes()
     def put(self, request, project_code):
         parts_data = request.data  # expect list
         updated_parts = []
@@ -610,19 +605,10 @@ class ProjectFinancePartsUpdateAPIView(APIView):
                 role__capabilities__capability_name='CAN_CHECK_AND_GIP_ATTACH'
             ).distinct()
 
-            for user in notify_users:
-                ActionLog.objects.create(
-                    full_id=project.full_id,
-                    path_type=project.path_type,
-                    phase_type=phase_type,
-                    performed_by=request.user,
-                    notify_to=user,
-                    comment='Финансовые части обновлены'  # Financial parts updated
-                )
+            notify_many(project, phase_type, request.user, notify_users,
+                        comment='Финансовые части обновлены', coalesce=True)  # Financial parts updated
         except PhaseType.DoesNotExist:
             return Response({'error': "Тип этапа 'FIN_PARTS_UPDATED' не найден"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)  # PhaseType not found
-        except Exception as e:
-            print(f"❌ Ошибка при создании ActionLog: {e}")  # Error creating ActionLog
         
         return Response(ProjectFinancePartSerializer(updated_parts, many=True).data, status=200)
     
@@ -643,10 +629,11 @@ class SendToTechDirAPIView(APIView):
             project_code=project_code,
             send_to_tech_dir=False
         )
-        count = parts.count()
+        # The UPDATE's own row count: a concurrent send can change what a separate count() saw
+        count = parts.update(send_to_tech_dir=True, send_to_tech_dir_date=now())
         if count == 0:
             return Response({'message': "Новых частей для отправки нет"}, status=status.HTTP_200_OK)
-        parts.update(send_to_tech_dir=True, send_to_tech_dir_date=now())
+        ProjectRollup.objects.bump(project.pk, parts_sent_count=count)  # .update() skips the rollup signals
         
         try:
             phase_type = PhaseType.objects.get(key='SENT_TO_TECH_DIR')
@@ -659,18 +646,9 @@ class SendToTechDirAPIView(APIView):
             role__capabilities__capability_name='CAN_CHECK_AND_GIP_ATTACH'
         ).distinct()
         
-        for user in notify_users:
-            try:
-                ActionLog.objects.create(
-                    full_id=project.full_id,
-                    path_type=project.path_type,
-                    phase_type=phase_type,
-                    performed_by=request.user,
-                    notify_to=user,
-                    comment="Финансовые части отправлены техническому директору"  # Financial parts sent to Tech Director
-                )
-            except Exception as e:
-                print(f"❌ Ошибка при создании ActionLog для {user.fio}: {e}")  # Error creating ActionLog
+        # one bulk insert for all recipients: a failure rolls the whole request back instead of being skipped
+        notify_many(project, phase_type, request.user, notify_users,
+                    comment="Финансовые части отправлены техническому директору")  # Financial parts sent to Tech Director
 
         return Response({'message': f"{count} частей отправлено техническому директору"}, status=status.HTTP_200_OK)  # parts sent to Tech Director
     
@@ -687,24 +665,17 @@ class ProjectListTechDirConfirmView(generics.ListAPIView):
         tech_dir_confirmed = self.request.query_params.get('tech_dir_confirmed')
 
         # Base queryset: only projects with parts sent to technical director
-        qs = Project.objects.filter(finance_parts__send_to_tech_dir=True).distinct()
+        qs = Project.objects.filter(rollup__parts_sent_count__gt=0)
 
         if tech_dir_confirmed == 'true':
             # All parts confirmed
-            qs = qs.annotate(
-                unconfirmed_parts=Count('finance_parts', filter=Q(finance_parts__tech_dir_confirm=False))
-            ).filter(unconfirmed_parts=0)
+            qs = qs.filter(rollup__all_tech_dir_confirmed=True)
 
         elif tech_dir_confirmed == 'false':
             # Some parts not confirmed → includes refused too
-            qs = qs.annotate(
-                total_parts=Count('finance_parts'),
-                confirmed_parts=Count('finance_parts', filter=Q(finance_parts__tech_dir_confirm=True)),
-            ).filter(
-                confirmed_parts__lt=F('total_parts')
-            )
+            qs = qs.filter(rollup__all_tech_dir_confirmed=False)
 
-        return qs.order_by('-create_date')
+        return qs.with_list_stats().order_by('-create_date')
     
     
 
@@ -743,6 +714,7 @@ class TechDirVerifyAPIView(APIView):
             tech_dir_confirm=True,
             tech_dir_confirm_date=timezone.now()
         )
+        ProjectRollup.objects.rebuild([project.pk])  # .update() skips the rollup signals
 
         # ✅ Лог №1: TECH_DIR_CONFIRMED_AND_ATTACHED_GIP (Tech dir confirmed and attached GIP)
         try:
@@ -826,6 +798,7 @@ class TechDirRefuseAPIView(APIView):
             tech_dir_confirm=False,
             tech_dir_confirm_date=None
         )
+        ProjectRollup.objects.rebuild([project.pk])  # .update() skips the rollup signals
         
         try:
             phase_type = PhaseType.objects.get(key='TECH_DIR_REFUSED')
@@ -866,6 +839,13 @@ class PartnerListCreateView(ListCreateAPIView):
                           HasCapabilityPermission('CAN_ADD_PARTNERS'),  # Optional if needed
                           ]
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        search = self.request.query_params.get('search', '').strip()
+        if search:
+            queryset = queryset.search(search).order_by('-search_rank', '-update_time')
+        return queryset
+
     def perform_create(self, serializer):
         serializer.save(create_user=self.request.user)
 
@@ -1008,9 +988,10 @@ class GIPProjectListView(generics.ListAPIView):
             qs = qs.filter(gip_confirm=False)
 
         if search:
-            qs = qs.filter(Q(project_name__icontains=search))
+            qs = qs.search(search)
 
-        return qs.order_by('-create_date')
+        ordering = ('-search_rank', '-create_date') if search else ('-create_date',)
+        return qs.with_list_stats().order_by(*ordering)
 
 
 
@@ -1052,21 +1033,8 @@ class GIPConfirmAPIView(APIView):
         notify_users = StaffUser.objects.filter(
                 role__capabilities__capability_name='CAN_CHECK_AND_GIP_ATTACH'
             ).distinct()
-        for user in notify_users:
-            try:
-                ActionLog.objects.create(
-                    full_id=project.full_id,
-                    path_type=project.path_type,
-                    phase_type=phase_type,
-                    performed_by=request.user,
-                    notify_to=user,
-                    comment="ГИП подтвердил проект"  # GIP confirmed the project
-                )
-            except Exception as e:
-                return Response(
-                    {'error': f"Ошибка при создании ActionLog для пользователя {user.fio}: {str(e)}"},  # Error creating ActionLog for user
-                    status=500
-                )
+        notify_many(project, phase_type, request.user, notify_users,
+                    comment="ГИП подтвердил проект")  # GIP confirmed the project
 
         return Response(
             {'message': 'Проект подтвержден ГИПом и уведомления отправлены'},  # Project confirmed by GIP and notifications sent
@@ -1099,6 +1067,7 @@ class GipCreateTechnicalPartsView(APIView):
     permission_classes = [IsAuthenticated, HasCapabilityPermission('CAN_CREATE_TECH_PARTS')]
 
     @transaction.atomic
+    @deferred_writes()
     def post(self, request):
         fs_part_code = request.data.get('fs_part_code')
         parts_data = request.data.get('parts', [])
@@ -1128,6 +1097,7 @@ class GipCreateTechnicalPartsView(APIView):
 
         try:
             created_parts = []
+            logs = []
 
             for part in parts_data:
                 tch_user = StaffUser.objects.get(pk=part['tch_part_nach'])
@@ -1144,23 +1114,24 @@ class GipCreateTechnicalPartsView(APIView):
                 created_parts.append(obj)
 
                 # 🔔 Create ActionLog for each technical part to notify tch_part_nach
-                ActionLog.objects.create(
+                logs.append(ActionLog(
                     full_id=obj.full_id,
                     path_type=obj.path_type,
                     phase_type=tech_phase_type,
                     comment="ГИП создал техническую часть",  # GIP created technical part
                     performed_by=request.user,
                     notify_to=tch_user
-                )
+                ))
 
             # 🧾 General ActionLog for the project (no notification)
-            ActionLog.objects.create(
+            logs.append(ActionLog(
                 full_id=finance_part.project_code.full_id,
                 path_type=finance_part.project_code.path_type,
                 phase_type=phase_type,
                 comment="ГИП создал все технические части",  # GIP created all technical parts
                 performed_by=request.user
-            )
+            ))
+            create_action_logs(logs)
 
         except Exception as e:
             return Response(
@@ -1204,7 +1175,8 @@ class GipUpdateTechnicalPartsView(APIView):
             return Response({'error': "Тип этапа 'GIP_UPDATED_TECHNICAL_PARTS'/'TECH_PART_UPDATED' не найден"}, status=500)  # PhaseType not found
 
         try:
-            with transaction.atomic():
+            with transaction.atomic(), deferred_writes():
+                logs = []
                 for part in parts_data:
                     start = datetime.strptime(part['tch_start_date'], "%Y-%m-%d").date()
                     end = datetime.strptime(part['tch_finish_date'], "%Y-%m-%d").date()
@@ -1222,7 +1194,9 @@ class GipUpdateTechnicalPartsView(APIView):
                     if part_code:
                         incoming_codes.add(part_code)
                         try:
-                            obj = ProjectGipPart.objects.get(tch_part_code=part_code)
+                            obj = ProjectGipPart.objects.select_related('create_user_id', 'tch_part_nach').get(
+                                tch_part_code=part_code
+                            )
                             obj.tch_part_no = part['tch_part_no']
                             obj.tch_part_name = part['tch_part_name']
                             obj.tch_part_nach_id = part['tch_part_nach']
@@ -1253,14 +1227,14 @@ class GipUpdateTechnicalPartsView(APIView):
                         incoming_codes.add(part_obj.tch_part_code)
 
                     # 🔔 Log for each technical part update
-                    ActionLog.objects.create(
+                    logs.append(ActionLog(
                         full_id=part_obj.full_id,
                         path_type=part_obj.path_type,
                         phase_type=tech_phase_type,
                         comment="ГИП обновил техническую часть",  # GIP updated technical part
                         performed_by=request.user,
-                        notify_to=part_obj.tch_part_nach
-                    )
+                        notify_to_id=part_obj.tch_part_nach_id
+                    ))
 
                 # 🗑️ Delete removed parts
                 ProjectGipPart.objects.filter(
@@ -1268,13 +1242,14 @@ class GipUpdateTechnicalPartsView(APIView):
                 ).exclude(tch_part_code__in=incoming_codes).delete()
 
                 # 📘 Log project level update
-                ActionLog.objects.create(
+                logs.append(ActionLog(
                     full_id=finance_part.project_code.full_id,
                     path_type=finance_part.project_code.path_type,
                     phase_type=phase_type,
                     comment="ГИП обновил технические части проекта",  # GIP updated project technical parts
                     performed_by=request.user
-                )
+                ))
+                create_action_logs(logs, coalesce=True)  # repeated edits fold into the unread notification
 
         except Exception as e:
             return Response({'error': f'❌ Ошибка при обновлении технических частей: {str(e)}'}, status=400)  # Failed to update technical parts
@@ -1409,6 +1384,7 @@ class CreateWorkOrderView(APIView):
     permission_classes = [IsAuthenticated,HasCapabilityPermission('CAN_CREATE_WORK_ORDER')]
 
     @transaction.atomic
+    @deferred_writes()
     def post(self, request):
         tch_part_code = request.data.get('tch_part_code')
         orders = request.data.get('orders', [])
@@ -1426,6 +1402,7 @@ class CreateWorkOrderView(APIView):
         except PhaseType.DoesNotExist:
             phase_type = None
 
+        logs = []
         for order_data in orders:
             serializer = WorkOrderCreateSerializer(data=order_data)
             serializer.is_valid(raise_exception=True)
@@ -1436,22 +1413,23 @@ class CreateWorkOrderView(APIView):
             )
 
             # ➕ Create ActionLog
-            ActionLog.objects.create(
+            logs.append(ActionLog(
                 full_id=work_order.full_id,
                 path_type=work_order.path_type,
                 phase_type=phase_type,
                 performed_by=request.user,
-                notify_to=work_order.wo_staff,  # 👈 Notify the assigned staff
+                notify_to_id=work_order.wo_staff_id,  # 👈 Notify the assigned staff
                 comment=f"Наряд №{work_order.wo_no} создан"
-            )
+            ))
          # 🧾 Project-level ActionLog (no notify)
-        ActionLog.objects.create(
+        logs.append(ActionLog(
             full_id=tech_part.fs_part_code.project_code.full_id,
             path_type=tech_part.fs_part_code.project_code.path_type,
             phase_type=phase_type,
             performed_by=request.user,
             comment='Созданы наряды по технической части'  # Work orders created for technical part
-        )
+        ))
+        create_action_logs(logs)
 
 
         return Response({'detail': '✅ Наряды успешно созданы'}, status=status.HTTP_201_CREATED)
@@ -1491,14 +1469,18 @@ class UpdateWorkOrdersView(APIView):
         except PhaseType.DoesNotExist:
             phase_type = None
 
-        with transaction.atomic():
+        with transaction.atomic(), deferred_writes():
             # Get all existing orders for the part
-            existing_wos = WorkOrder.objects.filter(tch_part_code=part)
+            # Related rows the history snapshot reads (set_history_display_fields) come with the orders
+            existing_wos = WorkOrder.objects.filter(tch_part_code=part).select_related(
+                'tch_part_code', 'wo_staff', 'create_user', 'holded_for'
+            )
             existing_map = {wo.pk: wo for wo in existing_wos}
             incoming_ids = {o.get('wo_id') for o in orders if o.get('wo_id')}
             print('incoming_ids',incoming_ids)
 
             # Process updates and creates
+            logs = []
             for o in orders:
                 wo_id = o.get('wo_id')
 
@@ -1524,14 +1506,15 @@ class UpdateWorkOrdersView(APIView):
                     )
 
                 # Action log
-                ActionLog.objects.create(
+                logs.append(ActionLog(
                     full_id=wo.full_id,
                     path_type=wo.path_type,
                     phase_type=phase_type,
                     performed_by=request.user,
-                    notify_to=wo.wo_staff,
+                    notify_to_id=wo.wo_staff_id,
                     comment=f"Наряд №{wo.wo_no} обновлен или создан"
-                )
+                ))
+            create_action_logs(logs, coalesce=True)  # repeated edits fold into the unread notification
 
             # Delete those not in incoming
             to_delete = [wo for wo_id, wo in existing_map.items() if wo_id not in incoming_ids]
@@ -1717,7 +1700,15 @@ class MyNotificationLogsView(ListAPIView):
         user = self.request.user
         identified_param = self.request.query_params.get('identified')
 
-        queryset = ActionLog.objects.filter(notify_to=user).order_by('-performed_at')
+        # live() drops logs whose target was deleted and recent() keeps to the hot partitions
+        # (the window NotificationCounter counts), so the page is sliced in SQL
+        # object_data names are resolved per page by ActionLogNotificationListSerializer
+        # a coalesced repeat (last_repeated_at) brings its row back to the top
+        queryset = ActionLog.objects.live().recent().filter(notify_to=user).select_related(
+            'phase_type', 'performed_by'
+        ).annotate(
+            activity_at=Coalesce('last_repeated_at', 'performed_at')
+        ).order_by('-activity_at')
 
         # Optional: apply filtering based on 'identified' query param
         if identified_param is not None:
@@ -1726,23 +1717,16 @@ class MyNotificationLogsView(ListAPIView):
             elif identified_param.lower() == 'false':
                 queryset = queryset.filter(identified=False)
 
-        # Filter out logs with missing related objects
-        valid_logs = []
-        for log in queryset:
-            try:
-                parts = log.full_id.strip('/').split('/')
-                if log.path_type == "PROJECT" and Project.objects.filter(project_code=int(parts[0])).exists():
-                    valid_logs.append(log)
-                elif log.path_type == "FIN_PART" and ProjectFinancePart.objects.filter(fs_part_code=int(parts[1])).exists():
-                    valid_logs.append(log)
-                elif log.path_type == "TECH_PART" and ProjectGipPart.objects.filter(tch_part_code=int(parts[2])).exists():
-                    valid_logs.append(log)
-                elif log.path_type == "WORK_ORDER" and WorkOrder.objects.filter(wo_id=int(parts[3])).exists():
-                    valid_logs.append(log)
-            except Exception:
-                continue
+        return queryset
 
-        return valid_logs
+    def list(self, request, *args, **kwargs):
+        # The first page (what the inbox opens on) is served from the per-user cache, see api.inbox
+        variant = inbox_variant(request)
+        if variant is None:
+            return super().list(request, *args, **kwargs)
+        return Response(cached_inbox_page(
+            request.user.pk, variant, lambda: super(MyNotificationLogsView, self).list(request, *args, **kwargs).data
+        ))
 
 
 class MarkActionLogIdentifiedView(APIView):
@@ -1752,86 +1736,126 @@ class MarkActionLogIdentifiedView(APIView):
         log = get_object_or_404(ActionLog, pk=action_id)
         log.identified = True
         log.identified_time = timezone.now()
-        log.save()
+        log.save(update_fields=['identified', 'identified_time'])
         return Response({'success': True})
 
 
+class MarkActionLogsIdentifiedBulkView(APIView):
+    """
+    Mark many of the user's notifications as identified in one UPDATE.
+    Body: {"action_ids": [..]} or {"all": true}, optionally narrowed by
+    "full_id" (prefix, e.g. "12/" for a whole project) and "phase_type" (key).
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        user = request.user
+        action_ids = request.data.get('action_ids')
+        full_id = request.data.get('full_id')
+        phase_type = request.data.get('phase_type')
+
+        if not (action_ids or request.data.get('all') or full_id or phase_type):
+            return Response(
+                {"detail": "action_ids, all, full_id or phase_type is required"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if action_ids is not None and not (
+            isinstance(action_ids, list) and all(isinstance(pk, int) for pk in action_ids)
+        ):
+            return Response({"detail": "action_ids must be a list of integers"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Orphaned and older logs are never listed, so only live, recent ones are marked (and counted)
+        logs = ActionLog.objects.live().recent().filter(notify_to=user, identified=False)
+        if action_ids:
+            logs = logs.filter(pk__in=action_ids)
+        if full_id:
+            logs = logs.filter(full_id__startswith=full_id)
+        if phase_type:
+            logs = logs.filter(phase_type__key=phase_type)
+
+        with transaction.atomic():
+            marked = logs.update(identified=True, identified_time=timezone.now())
+            NotificationCounter.objects.bump(user.pk, -marked)
+            invalidate_inbox([user.pk])
+
+        return Response({"marked": marked, "count": NotificationCounter.objects.unread(user.pk)})
+
+
 
 class NotificationCountView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        user = request.user
-        queryset = ActionLog.objects.filter(notify_to=user,identified=False)
-                # Filter out logs with missing related objects
-        valid_logs = []
-        for log in queryset:
-            try:
-                parts = log.full_id.strip('/').split('/')
-                if log.path_type == "PROJECT" and Project.objects.filter(project_code=int(parts[0])).exists():
-                    valid_logs.append(log)
-                elif log.path_type == "FIN_PART" and ProjectFinancePart.objects.filter(fs_part_code=int(parts[1])).exists():
-                    valid_logs.append(log)
-                elif log.path_type == "TECH_PART" and ProjectGipPart.objects.filter(tch_part_code=int(parts[2])).exists():
-                    valid_logs.append(log)
-                elif log.path_type == "WORK_ORDER" and WorkOrder.objects.filter(wo_id=int(parts[3])).exists():
-                    valid_logs.append(log)
-            except Exception:
-                continue
-        count=len(valid_logs)
-        print('count:',count)
-        return Response({"count": count})
-
-
-# 🔢 Define your custom phase order
-PHASE_ORDER_MAP = {
-    'CREATED': 1,
-    'SENT_TO_FINANCIER': 2,
-    'FINANCIER_CONFIRMED': 3,
-    'FIN_PARTS_CREATED': 4,
-    'SENT_TO_TECH_DIR': 5,
-    'TECH_DIR_CONFIRMED_AND_ATTACHED_GIP': 6,
-    'SENT_TO_GIP': 7,
-    'GIP_CONFIRMED': 8,
-    'GIP_CREATED_TECHNICAL_PARTS': 9,
-    'WORK_ORDER_CREATED': 10,
-}
+        # Kept in step with action_logs by api.signals (rebuild_notification_counters repairs drift)
+        return Response({"count": NotificationCounter.objects.unread(request.user.pk)})
+
+
+# 🔢 Phases shown on the project timeline (ProjectStatusLine); their order comes from PhaseType.order
+TIMELINE_PHASES = [
+    'CREATED',
+    'SENT_TO_FINANCIER',
+    'FINANCIER_CONFIRMED',
+    'FIN_PARTS_CREATED',
+    'SENT_TO_TECH_DIR',
+    'TECH_DIR_CONFIRMED_AND_ATTACHED_GIP',
+    'SENT_TO_GIP',
+    'GIP_CONFIRMED',
+    'GIP_CREATED_TECHNICAL_PARTS',
+    'WORK_ORDER_CREATED',
+]
+MAX_PHASE_PROGRESS_PROJECTS = 50
+
+
+def phase_progress(project_codes):
+    """
+    {project_code: [latest project-level action per timeline phase, by PhaseType.order]}
+    in one query: DISTINCT ON (project, phase_type) keeps the newest log of each phase.
+    """
+    rows = (
+        ActionLog.objects
+        .filter(project_id__in=project_codes, path_type='PROJECT', phase_type__key__in=TIMELINE_PHASES)
+        .order_by('project_id', 'phase_type_id', '-performed_at')
+        .distinct('project_id', 'phase_type_id')
+        .values_list('project_id', 'action_id', 'phase_type__key', 'phase_type__order', 'performed_at')
+    )
+    result = {code: [] for code in project_codes}
+    for project_id, action_id, phase_key, order, performed_at in rows:
+        result[project_id].append({
+            'action_id': action_id,
+            'phase_key': phase_key,
+            'order': order,
+            'performed_at': performed_at,
+        })
+    for phases in result.values():
+        phases.sort(key=lambda x: x['order'])
+    return result
+
 
 class ProjectPhaseProgressView(APIView):
-    # permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated]
 
     def get(self, request, project_code):
         project = get_object_or_404(Project, project_code=project_code)
-        full_id_prefix = f"{project.project_code}/"
-
-        # Fetch all project-level actions sorted by latest first
-        actions = (
-            ActionLog.objects
-            .filter(full_id__startswith=full_id_prefix, path_type='PROJECT')
-            .select_related('phase_type', 'performed_by')
-            .order_by('-performed_at')  # latest first
-        )
-
-        seen_phases = set()
-        result = []
+        return Response(phase_progress([project.project_code])[project.project_code])
 
-        for action in actions:
-            phase_key = action.phase_type.key if action.phase_type else None
-            order = PHASE_ORDER_MAP.get(phase_key)
 
-            if phase_key and order and phase_key not in seen_phases:
-                result.append({
-                    'action_id': action.action_id,
-                    'phase_key': phase_key,
-                    'order': order,
-                    'performed_at': action.performed_at,
-                })
-                seen_phases.add(phase_key)
+class ProjectPhaseProgressBatchView(APIView):
+    """Timeline progress of a whole project list page: ?project_codes=1,2,3 -> {code: [...]}."""
+    permission_classes = [IsAuthenticated]
 
-        # Sort result by the defined phase order
-        result.sort(key=lambda x: x['order'])
+    def get(self, request):
+        raw = request.query_params.get('project_codes', '')
+        try:
+            project_codes = list(dict.fromkeys(int(code) for code in raw.split(',') if code.strip()))
+        except ValueError:
+            return Response({"detail": "project_codes must be a comma-separated list of integers"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(project_codes) > MAX_PHASE_PROGRESS_PROJECTS:
+            return Response({"detail": f"At most {MAX_PHASE_PROGRESS_PROJECTS} project_codes per request"}, status=status.HTTP_400_BAD_REQUEST)
 
-        return Response(result)
+        # Only timelines of projects the user's project list would show; other codes answer [] like unknown ones
+        visible = Project.objects.visible_to(request.user).filter(pk__in=project_codes).values_list('pk', flat=True)
+        progress = phase_progress(list(visible))
+        return Response({code: progress.get(code, []) for code in project_codes})
 
 
 
@@ -2416,6 +2440,10 @@ class MarkChatMessagesReadView(APIView):
             receiver=user,
             is_read=False
         ).update(is_read=True, read_time=timezone.now())
+        if updated_count:
+            # Open streams only hear about new messages: tell them the badge went down too
+            unread = ChatMessage.objects.filter(receiver=user, is_read=False).count()
+            publish(user.pk, 'chat_read', task_id=task.pk, unread=unread)
 
         return Response({
             'status': 'success',
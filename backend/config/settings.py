@@ -2,6 +2,7 @@
 from pathlib import Path
 from decouple import config
 import os
+import tempfile
 from datetime import timedelta
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -29,6 +30,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework_simplejwt',
     'api.apps.ApiConfig',
@@ -169,4 +171,18 @@ CSRF_COOKIE_SECURE = False  # True in prod
 SESSION_COOKIE_SECURE = False
 # settings.py
 DATA_UPLOAD_MAX_MEMORY_SIZE = 400 * 1024 * 1024  # 400 MB
-FILE_UPLOAD_MAX_MEMORY_SIZE = 400 * 1024 * 1024  # 400 MB
\ No newline at end of file
+FILE_UPLOAD_MAX_MEMORY_SIZE = 400 * 1024 * 1024  # 400 MB
+# action_logs monthly partitions (api.partitions): older ones are archived by
+# `manage.py action_log_partitions`. The notification list, bulk mark-read and
+# NotificationCounter only see this window (ActionLog.objects.recent())
+ACTION_LOG_RETENTION_MONTHS = config('ACTION_LOG_RETENTION_MONTHS', cast=int, default=12)
+ACTION_LOG_ARCHIVE_DIR = os.path.join(BASE_DIR, 'archive', 'action_logs')
+
+# Cached notification inbox pages (api.inbox). File-based by default so every gunicorn
+# worker sees the same invalidations; a per-process locmem cache would serve stale pages.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': config('CACHE_LOCATION', default=os.path.join(tempfile.gettempdir(), 'promont_cache')),
+    }
+}
@@ -6,6 +6,7 @@ import { useAuth } from '../context/AuthProvider';
 import { createAxiosInstance } from '../utils/createAxiosInstance';
 import { useI18n } from '../context/I18nProvider';
 import { formatDateTime } from '../utils/formatDateTime';
+import { subscribeEvents } from '../utils/eventStream';
 import './ChatNotificationCard.css';
 import { FaProjectDiagram, FaEllipsisH } from 'react-icons/fa';
 
@@ -45,8 +46,13 @@ export default function ChatNotificationCard() {
 
   useEffect(() => {
     fetchChatMessages();
-    const interval = setInterval(fetchChatMessages, 10000);
-    return () => clearInterval(interval);
+    // ✅ Yangi xabar kelganda, xabarlar o‘qilganda (yoki qayta ulanganda) ro‘yxatni yangilaymiz
+    const unsubscribe = [
+      subscribeEvents('chat_message', fetchChatMessages),
+      subscribeEvents('chat_read', fetchChatMessages),
+      subscribeEvents('open', fetchChatMessages),
+    ];
+    return () => unsubscribe.forEach((fn) => fn());
   }, []);
 
   useEffect(() => {
@@ -48,7 +48,7 @@ export default function Notification({ log , hideAction = false, onIdentified})
         }, 300); // ⏱ Delay to allow fade animation
       };
 
-  const createdAt = new Date(log.performed_at);
+  const createdAt = new Date(log.last_repeated_at || log.performed_at); // ✅ coalesced repeats: latest time
   const daysAgo = Math.floor((new Date() - createdAt) / (1000 * 60 * 60 * 24));
 
   function formatDaysAgo(daysAgo) {
@@ -113,6 +113,9 @@ export default function Notification({ log , hideAction = false, onIdentified})
 
       <div className="text-secondary mb-2 small">
         {returnTitle(`action_log.${log.phase_type.key.toLowerCase()}`).toUpperCase()}
+        {log.repeat_count > 1 && (
+          <span className="badge rounded-pill bg-secondary ms-2">×{log.repeat_count}</span>
+        )}
         {log.comment && (
           <FaEllipsisH
             role="button"
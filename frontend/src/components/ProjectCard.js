@@ -23,7 +23,7 @@ import { hasAllCapabilities,hasAnyCapability } from '../utils/hasCapability';
 
 
 
-export default function ProjectCard({ proj }) {
+export default function ProjectCard({ proj, phaseProgress }) {
   const [showModal, setShowModal] = useState(false);
   const { user } = useAuth();
   const {returnTitle}=useI18n()
@@ -268,7 +268,7 @@ export default function ProjectCard({ proj }) {
 
       {/* Phases */}
       <div className='d-flex justify-content-center align-items-center flex-row' style={{ width: '100%'}}>
-        <ProjectStatusLine project={proj} />
+        <ProjectStatusLine project={proj} phaseProgress={phaseProgress} />
       </div>
       {/* Status */}
       <div className="d-flex align-items-center justify-content-between mt-3 small">
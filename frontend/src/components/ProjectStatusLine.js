@@ -8,10 +8,13 @@ import { useI18n } from '../context/I18nProvider';
 
 
 
-export default function ProjectStatusLine({ project }) {
+// phaseProgress: ro‘yxat sahifasi bitta so‘rovda olib bergan progress (projects/phase-progress/);
+// null — ro‘yxat hali yuklayapti, undefined — berilmagan yoki xato: karta o‘zi yuklaydi
+export default function ProjectStatusLine({ project, phaseProgress }) {
   
   const {returnTitle}=useI18n()
-  const [phases, setPhases] = useState([]);
+  const [fetchedPhases, setPhases] = useState([]);
+  const phases = phaseProgress || fetchedPhases;
   const navigate = useNavigate();
   const { setUser, setAccessToken } = useAuth();
 
@@ -27,18 +30,16 @@ export default function ProjectStatusLine({ project }) {
       }
     };
 
-    if (project?.project_code) {
+    if (project?.project_code && phaseProgress === undefined) {
       fetchPhases();
     }
-  }, [project, navigate, setUser, setAccessToken]);
+  }, [project, phaseProgress, navigate, setUser, setAccessToken]);
 
   const phaseMap = {};
   for (const p of phases) {
     phaseMap[p.phase_key] = p;
   }
 
-  const latestOrder = phases.length > 0 ? Math.max(...phases.map(p => p.order || 0)) : -1;
-
 const PHASES = [
   { key: 'CREATED', name: 'status_line.fin_dir_created_project', color: '#FF7F0E', order: 1 }, // Orange
   { key: 'SENT_TO_FINANCIER', name: 'status_line.sent_to_financier', color: '#FFD700', order: 2 }, // Gold
@@ -52,6 +53,10 @@ const PHASES = [
   { key: 'WORK_ORDER_CREATED', name: 'status_line.work_orders_created', color: '#4682B4', order: 10 }, // SteelBlue
 ];
 
+  // Oxirgi bosqich timeline tartibi bo‘yicha (serverdagi PhaseType.order raqamlariga bog‘lanmaydi)
+  const passedOrders = PHASES.filter((phase) => phaseMap[phase.key]).map((phase) => phase.order);
+  const latestOrder = passedOrders.length > 0 ? Math.max(...passedOrders) : -1;
+
 
   return (
     <div className="status-line-wrapper">
@@ -7,6 +7,7 @@ import { useI18n } from '../context/I18nProvider';
 import { createAxiosInstance } from '../utils/createAxiosInstance';
 import { useNavigate } from 'react-router-dom';
 import ChatNotificationCard from './ChatNotificationCard'
+import { subscribeEvents } from '../utils/eventStream';
 
 
 export default function Topbar({ sidebarVisible, toggleSidebar,searchQuery, setSearchQuery }) {
@@ -46,10 +47,28 @@ export default function Topbar({ sidebarVisible, toggleSidebar,searchQuery, setS
 
     useEffect(() => {
       fetchUnreadChatCount();
-      const interval = setInterval(fetchUnreadChatCount, 10000);
-      return () => clearInterval(interval);
     }, []);
 
+
+    // ✅ Server push o‘rniga polling yo‘q: sonlar /api/events/stream/ orqali keladi
+    useEffect(() => {
+      const unsubscribe = [
+        subscribeEvents('counts', (data) => {
+          setUnreadCount(data.notifications || 0);
+          setUnreadChatCount(data.chat_messages || 0);
+        }),
+        subscribeEvents('notification', (data) => setUnreadCount(data.unread || 0)),
+        subscribeEvents('chat_message', () => setUnreadChatCount((count) => count + 1)),
+        subscribeEvents('chat_read', (data) => setUnreadChatCount(data.unread || 0)),
+        // Oqim uzilsa: axios tokenni yangilaydi, sonlar qayta olinadi
+        subscribeEvents('error', () => {
+          fetchUnreadCount();
+          fetchUnreadChatCount();
+        }),
+      ];
+      return () => unsubscribe.forEach((fn) => fn());
+    }, [fetchUnreadCount, fetchUnreadChatCount]);
+
   return (
     <div className="d-flex justify-content-between align-items-center px-3 py-2 border-0" style={{ color: 'white',minHeight:'5vh' }}>
       
@@ -19,6 +19,7 @@ import Alert from '../components/Alert';
 export default function DashboardScreen() {
   const [sidebarVisible, setSidebarVisible] = useState(true);
   const [projects, setProjects] = useState([]);
+  const [phaseProgress, setPhaseProgress] = useState(null); // null: yuklanmoqda, {}: xato (kartalar o‘zi yuklaydi)
   
   const [currentPage, setCurrentPage] = useState(1);
   const [totalPages, setTotalPages] = useState(1);
@@ -56,10 +57,25 @@ export default function DashboardScreen() {
     }));
   };
 
+  // Sahifadagi barcha loyihalar progressi bitta so‘rovda
+  const fetchPhaseProgress = useCallback((list, requestId) => {
+    if (!list.length) return;
+    axiosInstance
+      .get('/projects/phase-progress/', { params: { project_codes: list.map((p) => p.project_code).join(',') } })
+      .then((res) => {
+        if (requestId === requestIdRef.current) setPhaseProgress(res.data);
+      })
+      .catch((err) => {
+        console.error('❌ Failed to fetch phase progress', err);
+        if (requestId === requestIdRef.current) setPhaseProgress({});
+      });
+  }, [axiosInstance]);
+
   const fetchProjects = useCallback(() => {
     const requestId = ++requestIdRef.current; // har bir chaqirishda ID o‘sadi
     setLoading(true);
     setProjects([]); // eski ma’lumotlar yo‘qoladi
+    setPhaseProgress(null);
     const params = {
       page: currentPage,
     };
@@ -80,6 +96,7 @@ export default function DashboardScreen() {
       .then((res) => {
             if (requestId === requestIdRef.current) {
             setProjects(res.data.results);
+            fetchPhaseProgress(res.data.results, requestId);
             setTotalPages(Math.ceil(res.data.count / 10));
             setError('');
           } else {
@@ -95,7 +112,7 @@ export default function DashboardScreen() {
         setLoading(false);
       }
     });
-  }, [axiosInstance, filters, currentPage, searchQuery]);
+  }, [axiosInstance, filters, currentPage, searchQuery, fetchPhaseProgress]);
   
   
 
@@ -173,7 +190,7 @@ export default function DashboardScreen() {
                 >
                   {projects.map((proj) => (
                     <div key={proj.project_code} style={{ height: '100%' }}>
-                      <ProjectCard proj={proj} />
+                      <ProjectCard proj={proj} phaseProgress={phaseProgress === null ? null : phaseProgress[proj.project_code]} />
                     </div>
                   ))}
 
@@ -0,0 +1,69 @@
+import axios from 'axios';
+import Cookies from 'js-cookie';
+
+// Bitta umumiy EventSource (/api/events/stream/) — barcha komponentlar shunga obuna bo‘ladi.
+const RECONNECT_MS = 10000;
+
+const handlers = {};
+let source = null;
+let retryTimer = null;
+let connecting = false;
+
+const emit = (event, data) => (handlers[event] || []).forEach((handler) => handler(data));
+
+// URLda access token emas, bir martalik qisqa muddatli ticket yuboriladi (/api/events/ticket/)
+const connect = async () => {
+  retryTimer = null;
+  const token = Cookies.get('access');
+  if (!token) {
+    retryTimer = setTimeout(connect, RECONNECT_MS);
+    return;
+  }
+  let ticket;
+  connecting = true;
+  try {
+    const res = await axios.post('/api/events/ticket/', null, { headers: { Authorization: `Bearer ${token}` } });
+    ticket = res.data.ticket;
+  } catch (err) {
+    connecting = false;
+    // Token eskirgan bo‘lishi mumkin — 'error' orqali axios uni yangilaydi, keyin qayta urinamiz
+    emit('error');
+    retryTimer = setTimeout(connect, RECONNECT_MS);
+    return;
+  }
+  connecting = false;
+  if (!Object.values(handlers).some((list) => list.length > 0)) return; // kutish paytida obunalar bekor qilindi
+  source = new EventSource(`/api/events/stream/?ticket=${encodeURIComponent(ticket)}`);
+  source.onopen = () => emit('open');
+  ['counts', 'notification', 'chat_message', 'chat_read'].forEach((event) =>
+    source.addEventListener(event, (e) => emit(event, JSON.parse(e.data)))
+  );
+  // Token eskirganda server oqimni yopadi — yangi ticket bilan qayta ulanamiz
+  source.onerror = () => {
+    source.close();
+    source = null;
+    emit('error');
+    retryTimer = setTimeout(connect, RECONNECT_MS);
+  };
+};
+
+/**
+ * Events: "counts" (ulanishda), "notification", "chat_message", "open" (har (qayta) ulanishda), "error".
+ * @param {string} event - event nomi
+ * @param {function} handler - (data) => void
+ * @returns {function} obunani bekor qiluvchi funksiya
+ */
+export const subscribeEvents = (event, handler) => {
+  (handlers[event] = handlers[event] || []).push(handler);
+  if (!source && !retryTimer && !connecting) connect();
+
+  return () => {
+    handlers[event] = handlers[event].filter((h) => h !== handler);
+    if (Object.values(handlers).every((list) => list.length === 0)) {
+      clearTimeout(retryTimer);
+      retryTimer = null;
+      if (source) source.close();
+      source = null;
+    }
+  };
+};